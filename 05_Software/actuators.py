@@ -0,0 +1,147 @@
+"""
+actuators.py
+Command coalescing for the heaters and grow lights.
+
+The mode handlers and the thermostat say what they *want* every time
+they run ("air heater OFF", "LEDs ON"), which used to mean a GPIO/I2C
+write and a log line each time. Now they only record a commanded state
+here. At the end of each loop wakeup main.py calls flush(), which writes
+to hardware_drivers only when:
+- the commanded state differs from the last state written (applied), or
+- the last write is older than ACTUATOR_REASSERT_SEC. Re-sending the
+  same state now and then recovers from a missed write or a latch-up
+  without trusting our own bookkeeping forever.
+
+shed_load() is the exception: LAST_RESORT_MODE commands everything OFF
+and writes it out immediately instead of waiting for the end of the tick.
+
+Counters (commands, bus writes, skipped writes, re-asserts) per actuator
+are available from get_stats().
+"""
+
+import global_config
+import hardware_drivers
+import mission_clock
+
+LEDS = "leds"
+
+# actuator id -> function that writes a state to the hardware
+WRITERS = {
+    global_config.AIR_HEATER: lambda status: hardware_drivers.set_heater(global_config.AIR_HEATER, status),
+    global_config.WATER_HEATER: lambda status: hardware_drivers.set_heater(global_config.WATER_HEATER, status),
+    LEDS: lambda status: hardware_drivers.set_leds(status),
+}
+
+
+class ActuatorManager:
+    def __init__(self, writers=None, reassert_sec=None):
+        self.writers = dict(WRITERS if writers is None else writers)
+        self._reassert_sec = reassert_sec
+        self.reset()
+
+    def reset(self):
+        """Forgets everything; the next flush writes whatever gets commanded."""
+        # Read at every reset, so global_config overrides apply to the next run
+        self.reassert_sec = global_config.ACTUATOR_REASSERT_SEC if self._reassert_sec is None else self._reassert_sec
+        self.commanded = {a: None for a in self.writers}
+        self.applied = {a: None for a in self.writers}
+        self.last_write = {a: None for a in self.writers}
+        self._pending = {a: 0 for a in self.writers}  # Commands since the last flush
+        self.stats = {a: {"commands": 0, "writes": 0, "skipped": 0, "reasserts": 0} for a in self.writers}
+
+    def command(self, actuator, status):
+        """Records the wanted state. Nothing touches the bus until flush()."""
+        self.commanded[actuator] = status
+        self._pending[actuator] += 1
+        self.stats[actuator]["commands"] += 1
+
+    def flush(self, now=None):
+        """Writes every actuator whose state changed or whose re-assert is due. Returns the bus writes made."""
+        now = mission_clock.now() if now is None else now
+        writes = 0
+        for actuator, status in self.commanded.items():
+            if status is None:
+                continue
+            stats = self.stats[actuator]
+            pending, self._pending[actuator] = self._pending[actuator], 0
+            if status == self.applied[actuator]:
+                if now - self.last_write[actuator] < self.reassert_sec:
+                    stats["skipped"] += pending
+                    continue
+                stats["reasserts"] += 1
+            stats["skipped"] += max(pending - 1, 0)  # Several commands in one tick make one write
+            self.writers[actuator](status)
+            self.applied[actuator] = status
+            self.last_write[actuator] = now
+            stats["writes"] += 1
+            writes += 1
+        return writes
+
+    def totals(self):
+        return {key: sum(s[key] for s in self.stats.values())
+                for key in ("commands", "writes", "skipped", "reasserts")}
+
+
+# --- Module-level manager used by conops_modes / system_health / main ---
+_manager = ActuatorManager()
+
+
+def set_heater(heater_id, status):
+    _manager.command(heater_id, status)
+
+
+def set_leds(status):
+    _manager.command(LEDS, status)
+
+
+def get_commanded(actuator):
+    """The last state commanded for an actuator ("ON"/"OFF"), or None."""
+    return _manager.commanded.get(actuator)
+
+
+def shed_load():
+    """Commands all heaters and LEDs OFF and writes them out right away."""
+    for actuator in _manager.writers:
+        _manager.command(actuator, "OFF")
+    return _manager.flush()
+
+
+def flush(now=None):
+    return _manager.flush(now)
+
+
+def reset():
+    _manager.reset()
+
+
+def get_stats():
+    return {actuator: dict(stats) for actuator, stats in _manager.stats.items()}
+
+
+def print_report():
+    totals = _manager.totals()
+    print(f"[Actuators] {totals['commands']} commands -> {totals['writes']} bus writes "
+          f"({totals['reasserts']} re-asserts, {totals['skipped']} skipped)")
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import time
+
+    import actuators  # The instance the flight code uses, not this __main__ copy
+    import main
+
+    # One full fast mission: every command used to be a bus write and a log line
+    mission_clock.set_clock(mission_clock.DiscreteEventClock())
+    duration = 2 * 86400  # Flight task rates; two light/dark cycles
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.run_simulation_loop(mission_duration=duration)
+    elapsed = time.perf_counter() - t0
+
+    print(f"--- Actuators: {duration / 86400:.1f}-day mission in {elapsed:.1f} s ---")
+    print(f"{'actuator':<16}{'commands':>10}{'writes':>10}{'reasserts':>11}{'skipped':>10}")
+    for actuator, s in actuators.get_stats().items():
+        print(f"{actuator:<16}{s['commands']:>10}{s['writes']:>10}{s['reasserts']:>11}{s['skipped']:>10}")
+    actuators.print_report()
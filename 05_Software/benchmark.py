@@ -0,0 +1,297 @@
+"""
+benchmark.py
+Headless performance benchmarks for the flight software, with a stored
+baseline per target so regressions show up before they reach the Pi.
+
+Measured (all on a DiscreteEventClock, so no run waits for real time):
+- tick_us:         check_all_systems plus the mode handler, per loop
+                   wakeup that runs either (p50 / p99 / max),
+- publish_us:      handing one tick's state to the GUI: the old
+                   copy.deepcopy of the whole state and the current
+                   take_delta() (mean per call),
+- gui_process_us:  DashboardApp.process_system_state on a stub window,
+                   so no display is needed (skipped without tkinter),
+- mission_sec:     wall time to simulate EXPERIMENT_DURATION_SEC plus
+                   startup, through main.run_simulation_loop.
+
+Results are written as JSON. Each target has its own baseline in
+bench_baseline.json, keyed by profile: "pi3b" on a Raspberry Pi 3 Model
+B+ (detected from the device tree), "host" anywhere else, or --profile.
+A metric more than its tolerance above the baseline is a regression and
+makes the run exit with status 1. A full mission (not --quick) must also
+finish within MISSION_BUDGET_SEC for the profile, baseline or not: that
+is what --fast promises, so losing it fails the run even before any
+baseline has been saved.
+
+    python benchmark.py                   # compare with this profile's baseline
+    python benchmark.py --save-baseline   # accept the current numbers
+    python benchmark.py --quick           # one simulated day instead of a full mission
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import conops_modes
+import global_config
+import hardware_drivers
+import main
+import mission_clock
+import system_health
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+RESULTS_FILE = "bench_results.json"
+
+# Allowed slowdown against the baseline before a metric counts as a regression.
+# Tail latencies are noisier than means, so they get more room.
+TOLERANCES = {
+    "tick_us.p50": 0.25,
+    "tick_us.p99": 0.50,
+    "publish_us.deepcopy": 0.25,
+    "publish_us.delta": 0.25,
+    "gui_process_us.mean": 0.25,
+    "mission_sec": 0.20,
+}
+
+# Wall time allowed for one full simulated mission (main.py --fast), per profile
+MISSION_BUDGET_SEC = {"host": 30.0, "pi3b": 240.0}
+
+
+def detect_profile():
+    try:
+        with open("/proc/device-tree/model") as f:
+            model = f.read()
+    except OSError:
+        return "host"
+    return "pi3b" if "Raspberry Pi 3 Model B Plus" in model else "host"
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
+@contextlib.contextmanager
+def _simulated_mission(seed=0):
+    saved_clock = mission_clock.get_clock()
+    mission_clock.set_clock(mission_clock.DiscreteEventClock(start_time=1.0e9))
+    hardware_drivers.reset_simulation(seed=seed)
+    conops_modes.reset_timers()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # Flight log echo
+            yield
+    finally:
+        mission_clock.set_clock(saved_clock)
+
+
+# --- Benchmarks ---
+
+def _set(where, name, fn):
+    if isinstance(where, dict):
+        where[name] = fn
+    else:
+        setattr(where, name, fn)
+
+
+def bench_tick(duration):
+    """
+    Times check_all_systems and the mode handlers per wakeup, by wrapping
+    them where main.py looks them up (flight_metrics keeps only per-stage
+    histograms, not their sum per tick). Returns (stats, final state).
+    """
+    spent = [0.0]
+
+    def timed(fn):
+        def wrapper(*args):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                spent[0] += time.perf_counter() - t0
+        return wrapper
+
+    saved = [(system_health, "check_all_systems", system_health.check_all_systems)]
+    saved += [(conops_modes.HANDLERS, mode, fn) for mode, fn in conops_modes.HANDLERS.items()]
+    ticks, last_state = [], []
+
+    def on_tick(system_state):
+        if spent[0]:
+            ticks.append(spent[0])
+            spent[0] = 0.0
+        if not last_state:
+            last_state.append(system_state)
+
+    try:
+        for where, name, fn in saved:
+            _set(where, name, timed(fn))
+        with _simulated_mission():
+            main.run_simulation_loop(mission_duration=duration, on_tick=on_tick)
+    finally:
+        for where, name, fn in saved:
+            _set(where, name, fn)
+
+    ticks.sort()
+    stats = {"ticks": len(ticks),
+             "p50": _percentile(ticks, 0.50) * 1e6,
+             "p99": _percentile(ticks, 0.99) * 1e6,
+             "max": (ticks[-1] if ticks else 0.0) * 1e6}
+    return stats, last_state[0]
+
+
+def bench_publish(state, n=20000):
+    """Old publish (deepcopy of the whole state) vs. the current delta publish."""
+    snapshot = state.snapshot()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        copy.deepcopy(snapshot)
+    deepcopy_us = (time.perf_counter() - t0) / n * 1e6
+
+    t0 = time.perf_counter()
+    for k in range(n):
+        state["battery_voltage"] = 3.8 + k * 1e-6  # The fields a health check changes
+        state["pi_temp"] = 40.0 + k * 1e-6
+        state["payload_temps"]["air"] = 22.0 + k * 1e-6
+        state["payload_temps"]["water"] = 20.0 + k * 1e-6
+        state["mission_time"] = float(k)
+        state.take_delta()
+    delta_us = (time.perf_counter() - t0) / n * 1e6
+    return {"deepcopy": deepcopy_us, "delta": delta_us}
+
+
+class _StubVar:
+    def set(self, value):
+        self.value = value
+
+
+class _StubDashboard:
+    """Just enough of DashboardApp for process_system_state, without a Tk window."""
+
+    def __init__(self):
+        self.state_vars = {name: _StubVar() for name in
+                           ("Current Mode", "Battery Voltage", "Pi Temperature", "Air Temperature",
+                            "Water Temperature", "Air Heater", "LEDs")}
+        self.lights = {}
+
+    def set_status_light(self, name, color):
+        self.lights[name] = color
+
+
+def bench_gui(state, n=20000):
+    try:
+        import gui_dashboard
+    except ImportError as e:  # No tkinter on this machine
+        return {"mean": None, "skipped": str(e)}
+    stub = _StubDashboard()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        gui_dashboard.DashboardApp.process_system_state(stub, state)
+    return {"mean": (time.perf_counter() - t0) / n * 1e6}
+
+
+def bench_mission(duration):
+    with _simulated_mission():
+        t0 = time.perf_counter()
+        main.run_simulation_loop(mission_duration=duration)
+        return time.perf_counter() - t0
+
+
+def run_all(quick=False):
+    mission = 86400.0 if quick else global_config.EXPERIMENT_DURATION_SEC + 600
+    tick, state = bench_tick(min(mission, 86400.0))
+    return {
+        "tick_us": tick,
+        "publish_us": bench_publish(state),
+        "gui_process_us": bench_gui(state),
+        "mission_sec": bench_mission(mission),
+        "mission_days": mission / 86400,
+    }
+
+
+# --- Baseline ---
+
+def _metric(results, name):
+    value = results
+    for part in name.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(results, baseline):
+    """[(metric, baseline, current, ratio, regressed)] for every metric both runs have."""
+    rows = []
+    for name, tolerance in TOLERANCES.items():
+        old, new = _metric(baseline, name), _metric(results, name)
+        if old is None or new is None:
+            continue
+        ratio = new / old if old else float("inf")
+        rows.append((name, old, new, ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def load_baselines(path=BASELINE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flight software benchmarks")
+    parser.add_argument("--profile", default=None, help="Baseline profile (default: detected, pi3b or host).")
+    parser.add_argument("--output", default=RESULTS_FILE, help="Where to write the JSON results.")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the profile's baseline.")
+    parser.add_argument("--quick", action="store_true", help="Simulate one day instead of a full mission.")
+    args = parser.parse_args()
+
+    profile = args.profile or detect_profile()
+    results = run_all(quick=args.quick)
+    results["profile"] = profile
+    results["machine"] = {"platform": platform.platform(), "python": platform.python_version(),
+                          "processor": platform.processor() or platform.machine()}
+    results["time"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    tick, publish = results["tick_us"], results["publish_us"]
+    gui = results["gui_process_us"]
+    print(f"--- Benchmarks ({profile}) -> {args.output} ---")
+    print(f"tick (health + mode)  p50 {tick['p50']:8.1f} us  p99 {tick['p99']:8.1f} us  "
+          f"max {tick['max']:8.1f} us  ({tick['ticks']} ticks)")
+    print(f"publish               deepcopy {publish['deepcopy']:6.1f} us  delta {publish['delta']:6.1f} us")
+    print("gui process_state     " + (f"{gui['mean']:6.1f} us" if gui["mean"] is not None
+                                      else f"skipped ({gui['skipped']})"))
+    print(f"mission               {results['mission_sec']:.1f} s for {results['mission_days']:.1f} days")
+    budget = MISSION_BUDGET_SEC.get(profile)
+    over_budget = not args.quick and budget is not None and results["mission_sec"] > budget
+    if over_budget:
+        print(f"REGRESSION: a full mission took {results['mission_sec']:.1f} s, budget {budget:.0f} s")
+
+    baselines = load_baselines(args.baseline)
+    if args.save_baseline:
+        baselines[profile] = results
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Saved as the '{profile}' baseline in {args.baseline}")
+        sys.exit(1 if over_budget else 0)
+    if profile not in baselines:
+        print(f"No '{profile}' baseline in {args.baseline}; run with --save-baseline to create one.")
+        sys.exit(1 if over_budget else 0)
+    baseline = baselines[profile]
+    if baseline.get("mission_days") != results["mission_days"]:
+        print(f"Baseline mission was {baseline.get('mission_days')} days; mission_sec not compared.")
+        baseline = dict(baseline, mission_sec=None)
+
+    rows = compare(results, baseline)
+    print(f"\n{'metric':<22}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for name, old, new, ratio, regressed in rows:
+        print(f"{name:<22}{old:>12.2f}{new:>12.2f}{ratio:>8.2f}{'  REGRESSION' if regressed else ''}")
+    sys.exit(1 if over_budget or any(row[4] for row in rows) else 0)
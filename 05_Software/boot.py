@@ -0,0 +1,59 @@
+"""
+boot.py
+Headless flight entry point: the shortest path from power-on to the first
+health check after every reset.
+
+Takes the same options as main.py. Compared with running main.py:
+- only flight modules are imported before the loop starts (no Tk or
+  dashboard code; http.server, the telemetry server and the recorder
+  only when their option asks for them, and the image pipeline only
+  with --images or at the first capture). NumPy still loads with the
+  simulated hardware_drivers,
+- the POST checks and the power-on steps run concurrently
+  (sensor_acquisition.run_concurrently),
+- STARTUP and INITIALIZE hand over within the first tick, so the
+  software is in SAFE_MODE (or the mode a checkpoint resumes) before the
+  first heartbeat sleep, and
+- the startup timing breakdown is measured from interpreter start
+  (/proc/self/stat on Linux, otherwise the first line of this file):
+  interpreter, imports, first health check, POST, initialize, and the
+  mode the boot ended in. It goes to the flight log as soon as the boot
+  modes are done, and into the metrics report and /metrics scrape.
+
+    python boot.py --checkpoint --commands          # flight
+    python boot.py --fast --duration 600 --quiet    # bench check
+"""
+
+import time
+
+_FIRST_LINE = time.perf_counter()  # Before any other import
+
+import os
+
+
+def process_start():
+    """perf_counter() time at which this interpreter started, or None if the OS can't say (10 ms resolution)."""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()  # The command name may contain spaces
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")  # starttime, field 22 of stat
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+    return time.perf_counter() - (uptime - started)
+
+
+def boot(argv=None):
+    started = process_start()
+    import flight_metrics
+    import main
+    imported = time.perf_counter()
+    if started is not None:
+        flight_metrics.startup_phase("interpreter", min(started, _FIRST_LINE), _FIRST_LINE)
+    flight_metrics.startup_phase("imports", _FIRST_LINE, imported)
+    main.main(argv)
+
+
+if __name__ == "__main__":
+    boot()
@@ -0,0 +1,221 @@
+"""
+checkpoint.py
+Crash-safe warm-restart checkpoint of the flight state and mode timers.
+
+Without it, a brownout or watchdog reset sends the software back to
+STARTUP: POST and INITIALIZE run again, experiment_start_time is lost and
+conops_modes.last_image_time restarts at 0, so the 14-day experiment
+clock and the LED 16/8 phase start over.
+
+Writing (Checkpoint.save, called once per loop wakeup by main.py):
+- The file is rewritten only when a field that matters after a reset
+  changes (mode, experiment start, ground command, a downlink pass
+  moving the frame counts on), or every CHECKPOINT_INTERVAL_SEC to keep
+  the sensor values, the mode timers and the "saved at" time fresh. The
+  image timer is therefore at most one interval old after a reset,
+  which costs at most one early image.
+- Everything else is a tuple compare, so the per-tick cost is tiny. The
+  interval sets the write rate: at 120 s that is 30 writes an hour (720
+  a day), and a 14-day mission measures 10,091 writes in all.
+- Each write goes to a temporary file, is fsync'ed, and replaces the
+  old checkpoint with os.replace(), so a reset mid-write leaves either
+  the old or the new checkpoint, never a torn one. A CRC over the
+  contents catches anything the card mangles anyway.
+
+Restoring (Checkpoint.load + restore, at the start of run_simulation_loop):
+- Fresh (younger than CHECKPOINT_MAX_AGE_SEC): POST is skipped, but
+  INITIALIZE still runs, because the reset powered off the receiver and
+  ADCS. It hands over to the saved mode in the first tick, with its
+  timers.
+- Older: full POST and INITIALIZE as on a cold boot, but the experiment
+  clock and timers are kept and INITIALIZE hands over to the saved mode
+  instead of SAFE_MODE.
+- Missing, corrupt, from the future, or saved in STARTUP/INITIALIZE:
+  a normal cold boot.
+"""
+
+import json
+import os
+import time
+import zlib
+
+import conops_modes
+import flight_log
+import flight_state
+import global_config
+import mission_clock
+
+VERSION = 1
+
+# A change in any of these is written out right away; the rest waits for the interval
+DURABLE_FIELDS = ("current_mode", "experiment_start_time", "gnd_command_received", "downlink_sequence")
+# Fields that describe this boot, not the mission
+BOOT_FIELDS = ("boot_time", "mission_time", "last_mode", "resume_mode", "telemetry_file")
+# Transitional modes that are never resumed
+COLD_BOOT_MODES = ("STARTUP", "INITIALIZE")
+
+
+def _encode(saved):
+    body = json.dumps(saved, sort_keys=True, separators=(",", ":"))
+    return json.dumps({"crc": zlib.crc32(body.encode("utf-8")), "checkpoint": saved},
+                      sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def _decode(data):
+    outer = json.loads(data)
+    saved = outer["checkpoint"]
+    body = json.dumps(saved, sort_keys=True, separators=(",", ":"))
+    if zlib.crc32(body.encode("utf-8")) != outer["crc"]:
+        raise ValueError("checkpoint CRC mismatch")
+    if saved.get("version") != VERSION:
+        raise ValueError(f"checkpoint version {saved.get('version')}")
+    return saved
+
+
+class Checkpoint:
+    def __init__(self, path=global_config.CHECKPOINT_FILE, interval=None, max_age=None):
+        self.path = path
+        self.interval = global_config.CHECKPOINT_INTERVAL_SEC if interval is None else interval
+        self.max_age = global_config.CHECKPOINT_MAX_AGE_SEC if max_age is None else max_age
+        self.stats = {"writes": 0, "skipped": 0, "bytes": 0, "write_time": 0.0}
+        self._durable = None
+        self._saved_at = None
+
+    # --- Writing ---
+
+    def save(self, system_state, now=None, force=False):
+        """Writes a checkpoint if something durable changed or the interval ran out. Returns True if written."""
+        now = mission_clock.now() if now is None else now
+        durable = tuple(system_state[f] for f in DURABLE_FIELDS)
+        due = self._saved_at is None or not 0 <= now - self._saved_at < self.interval
+        if not (force or due or durable != self._durable):
+            self.stats["skipped"] += 1
+            return False
+
+        t0 = time.perf_counter()
+        state = system_state.snapshot().as_dict()
+        for field in BOOT_FIELDS:
+            state.pop(field, None)
+        saved = {"version": VERSION, "saved_at": now, "state": state, "timers": conops_modes.get_timers()}
+        data = _encode(saved)
+        self._write_atomic(data)
+
+        self._durable, self._saved_at = durable, now
+        self.stats["writes"] += 1
+        self.stats["bytes"] += len(data)
+        self.stats["write_time"] += time.perf_counter() - t0
+        return True
+
+    def _write_atomic(self, data):
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        try:
+            # Make the rename itself durable (not possible on every OS)
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    # --- Restoring ---
+
+    def load(self):
+        """The saved checkpoint dict, or None if there is no usable one."""
+        try:
+            with open(self.path, "rb") as f:
+                return _decode(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            flight_log.warning("Checkpoint", "Ignoring unreadable checkpoint %s: %s", self.path, e)
+            return None
+
+    def restore(self, system_state, now=None):
+        """
+        Applies the saved checkpoint to a freshly booted system_state.
+        Returns "warm" (INITIALIZE, then the saved mode, no POST), "resumed"
+        (POST first, then the saved mode) or "cold" (nothing restored).
+        """
+        now = mission_clock.now() if now is None else now
+        saved = self.load()
+        if saved is None:
+            return "cold"
+        mode = saved["state"].get("current_mode")
+        age = now - saved["saved_at"]
+        if mode in COLD_BOOT_MODES or mode not in conops_modes.MODES or age < 0:
+            flight_log.info("Checkpoint", "Checkpoint not resumable (mode %s, age %.0f s); cold boot.", mode, age)
+            return "cold"
+
+        for field, value in saved["state"].items():
+            if field in system_state and field not in BOOT_FIELDS and field != "current_mode":
+                if isinstance(flight_state.DEFAULTS.get(field), tuple):
+                    value = tuple(value)  # JSON has no tuples
+                system_state[field] = value
+        conops_modes.restore_timers(saved["timers"])
+        self._durable, self._saved_at = None, None  # Write again once the new boot has settled
+
+        if age <= self.max_age:
+            flight_log.info("Checkpoint", "Warm restart: resuming %s from a %.0f s old checkpoint, POST skipped.",
+                            mode, age)
+            system_state["resume_mode"] = mode
+            system_state["current_mode"] = "INITIALIZE"  # Power-on steps, no POST
+            return "warm"
+        flight_log.info("Checkpoint", "Checkpoint is %.0f s old: running POST, then resuming %s.", age, mode)
+        system_state["resume_mode"] = mode
+        return "resumed"
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import tempfile
+
+    import hardware_drivers
+    import main
+    import sensor_acquisition
+
+    sensor_acquisition.set_concurrent(False)  # Mock sensors never block; skip the thread hand-offs
+
+    directory = tempfile.mkdtemp()
+    start = 1.0e9
+    duration = global_config.EXPERIMENT_DURATION_SEC + 600
+
+    def run(path, seconds, start_time):
+        mission_clock.set_clock(mission_clock.DiscreteEventClock(start_time=start_time))
+        conops_modes.reset_timers()
+        hardware_drivers.reset_simulation(seed=0)
+        modes = []
+        checkpoint = Checkpoint(path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.run_simulation_loop(mission_duration=seconds, checkpoint=checkpoint,
+                                     on_tick=lambda s: modes.append((mission_clock.now(), s["current_mode"],
+                                                                     s["experiment_start_time"])))
+        return checkpoint, modes
+
+    # SD card wear over a whole mission
+    path = os.path.join(directory, "mission.json")
+    checkpoint, _ = run(path, duration, start)
+    s = checkpoint.stats
+    print(f"--- Checkpoint: {duration / 86400:.1f}-day mission ---")
+    print(f"{s['writes']} writes ({s['writes'] / (duration / 86400):.0f}/day, {s['bytes'] / 1e3:.0f} kB total), "
+          f"{s['skipped']} wakeups skipped, {s['write_time'] / max(s['writes'], 1) * 1e3:.2f} ms per write "
+          f"(fsync included)")
+
+    # A reset three days into the experiment, then a reboot 60 s or 2 h later
+    for label, downtime in (("60 s brownout", 60.0), ("2 h outage", 7200.0)):
+        path = os.path.join(directory, f"reset_{int(downtime)}.json")
+        _, before = run(path, 3 * 86400, start)
+        crash_time, mode, experiment_start = before[-1]
+        _, after = run(path, 3600, crash_time + downtime)
+        first_experiment = next((t for t, m, _ in after if m == mode), None)
+        print(f"{label}: crashed in {mode}, back in {after[0][1] if after else None} at the first tick, "
+              f"{mode} again after {first_experiment - (crash_time + downtime):.0f} s, "
+              f"experiment start kept: {after[-1][2] == experiment_start}")
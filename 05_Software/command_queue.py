@@ -0,0 +1,477 @@
+"""
+command_queue.py
+Time-tagged stored commands: uplinked in batches, executed by the flight loop.
+
+hardware_drivers.check_for_gnd_command() hands over one command per
+poll and SAFE_MODE acts on it at once, so every action costs a ground
+contact. A batch uplink carries a whole command sequence instead:
+
+    {"crc": <zlib.crc32 of the batch JSON>,
+     "batch": {"id": "2026-290-a",
+               "cancel": ["2026-288-b"],
+               "commands": [
+                   {"cmd": "START_EXPERIMENT", "after": 60, "if": {"min_voltage": 3.7}},
+                   {"cmd": "CAPTURE_IMAGE", "at": 1000003600.0, "priority": 5},
+                   {"cmd": "REQUEST_TRANSMIT", "at": 1000086400.0, "window": 600}]}}
+
+encode_batch() builds this on the ground side.
+- "at" is an absolute mission time and "after" is seconds after
+  receipt; exactly one of the two is given. Relative times are made
+  absolute on receipt, so a reset does not shift them.
+- "if" holds preconditions checked when the command comes due: "mode"
+  (one mode or a list), "min_voltage" and "max_pi_temp". They narrow the
+  modes each command is allowed in anyway (COMMANDS), never widen them.
+- "window" (default 0): if the preconditions do not hold, retry every
+  COMMAND_RETRY_SEC for this many seconds, then drop the command.
+- "priority" (default 10) orders commands due at the same time, lower first.
+- "cancel" drops everything still queued from earlier batches.
+
+On receipt the whole batch is validated (CRC, known commands and fields,
+times within COMMAND_MAX_HORIZON_SEC, queue space, batch not seen
+before) and is queued in full or rejected in full, with every reason
+logged. Batches arrive through the SAFE_MODE command poll, the only
+mode that listens; the stored commands then run in any mode.
+
+Queued commands sit in a heap keyed by (time, priority, sequence).
+dispatch() pops what is due, O(log n) per command, and main.py sleeps
+its "commands" task until the head of the heap is due, so a queue of
+days of operations costs nothing between commands.
+
+With a journal file (start(path)), every accepted batch is appended as
+one fsync'ed JSON line, and the commands finished by one dispatch() call
+as one short "done" line; start() replays it after a reset. Once "done"
+entries outnumber the live commands the journal is rewritten with only
+the live ones (atomically, as in checkpoint.py), so it stays
+proportional to the queue. Without a journal (simulations) the queue
+lives in memory only.
+"""
+
+import heapq
+import itertools
+import json
+import math
+import os
+import zlib
+
+import actuators
+import conops_modes
+import flight_log
+import global_config
+import mission_clock
+
+DEFAULT_PRIORITY = 10
+
+
+# --- Commands ---
+# Name -> (function(system_state), modes it may run in)
+
+def _start_experiment(system_state):
+    # As in handle_safe_mode: PAY-3, heat the water before saturation
+    system_state["current_mode"] = "PRE_EXPERIMENT_HEATING"
+
+
+def _request_transmit(system_state):
+    system_state["current_mode"] = "TRANSMIT_MODE"
+
+
+def _enter_safe_mode(system_state):
+    actuators.set_leds("OFF")
+    system_state["current_mode"] = "SAFE_MODE"
+
+
+def _capture_image(system_state):
+    import image_pipeline  # As in conops_modes: not loaded until the first capture
+    image_pipeline.request_capture(system_state)
+
+
+def _noop(system_state):
+    pass
+
+
+_RUNNING = ("SAFE_MODE", "PRE_EXPERIMENT_HEATING", "WATER_SATURATION", "EXPERIMENT_MODE", "TRANSMIT_MODE")
+
+COMMANDS = {
+    "START_EXPERIMENT": (_start_experiment, ("SAFE_MODE",)),
+    "REQUEST_TRANSMIT": (_request_transmit, ("SAFE_MODE",)),
+    "ENTER_SAFE_MODE": (_enter_safe_mode, _RUNNING),
+    "CAPTURE_IMAGE": (_capture_image, ("EXPERIMENT_MODE",)),
+    "NOOP": (_noop, tuple(conops_modes.MODES)),
+}
+
+COMMAND_FIELDS = {"cmd", "at", "after", "if", "window", "priority"}
+CONDITIONS = {"mode", "min_voltage", "max_pi_temp"}
+
+
+# --- Uplink Format ---
+
+def _dumps(obj):
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"))
+
+
+def encode_batch(batch_id, commands, cancel=()):
+    """Ground side: the uplink text for a list of command dicts."""
+    batch = {"id": batch_id, "commands": list(commands)}
+    if cancel:
+        batch["cancel"] = list(cancel)
+    return _dumps({"crc": zlib.crc32(_dumps(batch).encode("utf-8")), "batch": batch})
+
+
+def is_batch(cmd):
+    """True if a check_for_gnd_command() result is a batch uplink rather than a single command."""
+    return isinstance(cmd, str) and cmd.startswith("{")
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _check_command(i, c, now):
+    """Errors in one uplinked command dict; [] if it is valid."""
+    where = f"command {i}"
+    if not isinstance(c, dict):
+        return [f"{where}: not an object"]
+    errors = [f"{where}: unknown field {k!r}" for k in sorted(set(c) - COMMAND_FIELDS)]
+    if not isinstance(c.get("cmd"), str) or c["cmd"] not in COMMANDS:
+        errors.append(f"{where}: unknown command {c.get('cmd')!r}")
+    if ("at" in c) == ("after" in c):
+        errors.append(f"{where}: needs exactly one of 'at' and 'after'")
+    else:
+        when = c["at"] if "at" in c else c["after"]
+        if not _number(when):
+            errors.append(f"{where}: time {when!r} is not a number")
+        else:
+            due = when if "at" in c else now + when
+            if due < now:
+                errors.append(f"{where}: time {due} is in the past")
+            elif due > now + global_config.COMMAND_MAX_HORIZON_SEC:
+                errors.append(f"{where}: time {due} is beyond the {global_config.COMMAND_MAX_HORIZON_SEC:.0f} s horizon")
+    for field in ("window", "priority"):
+        if field in c and not (_number(c[field]) and c[field] >= 0):
+            errors.append(f"{where}: {field} {c[field]!r} is not a number >= 0")
+    conditions = c.get("if", {})
+    if not isinstance(conditions, dict):
+        return errors + [f"{where}: 'if' is not an object"]
+    errors += [f"{where}: unknown precondition {k!r}" for k in sorted(set(conditions) - CONDITIONS)]
+    if "mode" in conditions:
+        modes = conditions["mode"] if isinstance(conditions["mode"], list) else [conditions["mode"]]
+        errors += [f"{where}: unknown mode {m!r}" for m in modes if m not in conops_modes.MODES]
+    for field in ("min_voltage", "max_pi_temp"):
+        if field in conditions and not _number(conditions[field]):
+            errors.append(f"{where}: {field} {conditions[field]!r} is not a number")
+    return errors
+
+
+def _allowed_modes(cmd, conditions):
+    allowed = COMMANDS[cmd][1]
+    if "mode" not in conditions:
+        return allowed
+    wanted = conditions["mode"] if isinstance(conditions["mode"], list) else [conditions["mode"]]
+    return tuple(m for m in allowed if m in wanted)
+
+
+class CommandQueue:
+    """
+    The stored-command heap and its journal. Entries are kept by sequence
+    number; the heap only holds (due, priority, seq), and entries that
+    were cancelled are skipped when they reach the top.
+    """
+
+    def __init__(self, path=None, capacity=None):
+        self.path = path
+        self.capacity = global_config.COMMAND_QUEUE_CAPACITY if capacity is None else capacity
+        self._heap = []
+        self._entries = {}  # seq -> [due, priority, seq, cmd, modes, min_voltage, max_pi_temp, expires, batch id]
+        self._seen = set()  # Batch ids ever accepted; a repeated uplink is not queued twice
+        self._seq = itertools.count()
+        self._done_lines = 0  # Finished commands in the journal since the last rewrite
+        self.stats = {"batches": 0, "rejected_batches": 0, "queued": 0, "executed": 0,
+                      "retries": 0, "expired": 0, "cancelled": 0, "compactions": 0}
+        if path and os.path.exists(path):
+            self._replay()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --- Receiving ---
+
+    def validate(self, text, now):
+        """(batch dict, []) for a valid uplink, or (None, [reasons])."""
+        try:
+            outer = json.loads(text)
+            batch = outer["batch"]
+            if zlib.crc32(_dumps(batch).encode("utf-8")) != outer["crc"]:
+                return None, ["CRC mismatch"]
+        except (ValueError, KeyError, TypeError) as e:
+            return None, [f"unreadable batch: {e}"]
+        if not isinstance(batch, dict) or not isinstance(batch.get("commands"), list):
+            return None, ["batch has no command list"]
+        errors = []
+        if not isinstance(batch.get("id"), str) or not batch["id"]:
+            errors.append("batch has no id")
+        elif batch["id"] in self._seen:
+            errors.append(f"batch {batch['id']} was already received")
+        cancel = batch.get("cancel", [])
+        if not isinstance(cancel, list) or not all(isinstance(b, str) for b in cancel):
+            errors.append("'cancel' is not a list of batch ids")
+        for i, c in enumerate(batch["commands"]):
+            errors += _check_command(i, c, now)
+        if len(self._entries) + len(batch["commands"]) > self.capacity:
+            errors.append(f"{len(batch['commands'])} commands do not fit "
+                          f"({len(self._entries)} of {self.capacity} queued)")
+        return (None, errors) if errors else (batch, [])
+
+    def receive(self, text, now=None):
+        """Validates one uplinked batch and queues it in full. Returns the list of errors ([] if accepted)."""
+        now = mission_clock.now() if now is None else now
+        batch, errors = self.validate(text, now)
+        if errors:
+            self.stats["rejected_batches"] += 1
+            flight_log.error("Commands", "Batch rejected: %s", "; ".join(errors))
+            return errors
+
+        entries = []
+        for c in batch["commands"]:
+            conditions = c.get("if", {})
+            due = c["at"] if "at" in c else now + c["after"]
+            entries.append([due, c.get("priority", DEFAULT_PRIORITY), next(self._seq), c["cmd"],
+                            _allowed_modes(c["cmd"], conditions), conditions.get("min_voltage"),
+                            conditions.get("max_pi_temp"), due + c.get("window", 0), batch["id"]])
+        record = {"op": "batch", "id": batch["id"], "cancel": batch.get("cancel", []), "commands": entries}
+        self._append(record)
+        cancelled = self._apply(record)
+        flight_log.info("Commands", "Batch %s: %d commands queued, %d cancelled, %d in queue.",
+                        batch["id"], len(entries), cancelled, len(self._entries))
+        return []
+
+    def _apply(self, record):
+        """Puts a journal "batch" record into memory. Returns how many queued commands it cancelled."""
+        cancel = set(record.get("cancel", ()))
+        cancelled = 0
+        if cancel:
+            for seq in [s for s, e in self._entries.items() if e[8] in cancel]:
+                del self._entries[seq]
+                cancelled += 1
+        for entry in record["commands"]:
+            entry[4] = tuple(entry[4])
+            self._entries[entry[2]] = entry
+            heapq.heappush(self._heap, (entry[0], entry[1], entry[2]))
+        if record.get("id") is not None:
+            self._seen.add(record["id"])
+        self._seen.update(record.get("seen", ()))
+        self.stats["batches"] += 1
+        self.stats["queued"] += len(record["commands"])
+        self.stats["cancelled"] += cancelled
+        return cancelled
+
+    # --- Dispatching ---
+
+    def next_due(self):
+        """Mission time of the next queued command, or None."""
+        heap = self._heap
+        while heap and heap[0][2] not in self._entries:
+            heapq.heappop(heap)  # Cancelled
+        return heap[0][0] if heap else None
+
+    def dispatch(self, system_state, now=None):
+        """Runs every command that is due. Returns how many ran."""
+        now = mission_clock.now() if now is None else now
+        heap, entries = self._heap, self._entries
+        done, ran = [], 0
+        while heap and heap[0][0] <= now:
+            _, _, seq = heapq.heappop(heap)
+            entry = entries.get(seq)
+            if entry is None:
+                continue  # Cancelled
+            cmd, modes, min_voltage, max_pi_temp, expires = entry[3:8]
+            failed = self._failed(system_state, modes, min_voltage, max_pi_temp)
+            if failed and now + global_config.COMMAND_RETRY_SEC <= expires:
+                entry[0] = now + global_config.COMMAND_RETRY_SEC
+                heapq.heappush(heap, (entry[0], entry[1], seq))
+                self.stats["retries"] += 1
+                continue
+            del entries[seq]
+            done.append(seq)
+            if failed:
+                self.stats["expired"] += 1
+                flight_log.warning("Commands", "%s (batch %s) dropped: %s.", cmd, entry[8], failed)
+                continue
+            flight_log.info("Commands", "Executing stored %s (batch %s).", cmd, entry[8])
+            COMMANDS[cmd][0](system_state)
+            system_state["gnd_command_received"] = cmd
+            self.stats["executed"] += 1
+            ran += 1
+        if done:
+            self._append({"op": "done", "seq": done})
+            self._done_lines += len(done)
+            if self.path and self._done_lines > max(len(entries), 64):
+                self.compact()
+        return ran
+
+    def _failed(self, system_state, modes, min_voltage, max_pi_temp):
+        """Why the preconditions do not hold, or None."""
+        mode = system_state["current_mode"]
+        if mode not in modes:
+            return f"mode is {mode}"
+        if min_voltage is not None and system_state["battery_voltage"] < min_voltage:
+            return f"battery at {system_state['battery_voltage']:.2f} V"
+        if max_pi_temp is not None and system_state["pi_temp"] > max_pi_temp:
+            return f"Pi at {system_state['pi_temp']:.1f}°C"
+        return None
+
+    # --- Journal ---
+
+    def _append(self, record):
+        if not self.path:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(_dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay(self):
+        done = set()
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Only the last line can be torn by a reset mid-append
+                    flight_log.warning("Commands", "Ignoring a torn journal line in %s.", self.path)
+        for record in records:
+            if record["op"] == "batch":
+                self._apply(record)
+            elif record["op"] == "done":
+                done.update(record["seq"])
+        for seq in done:
+            self._entries.pop(seq, None)
+        self._done_lines = len(done)
+        last = max(self._entries, default=-1)
+        self._seq = itertools.count(max(last, max(done, default=-1)) + 1)
+        self.stats = dict(self.stats, batches=0, queued=0, cancelled=0)  # Count this boot only
+        flight_log.info("Commands", "Restored %d stored commands from %s.", len(self._entries), self.path)
+
+    def compact(self):
+        """Rewrites the journal with only the live commands."""
+        record = {"op": "batch", "id": None, "seen": sorted(self._seen),
+                  "commands": sorted(self._entries.values(), key=lambda e: e[2])}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(_dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._done_lines = 0
+        self.stats["compactions"] += 1
+
+
+# --- Module-level queue used by conops_modes and main.py ---
+_queue = CommandQueue()
+
+
+def start(path=global_config.COMMAND_QUEUE_FILE):
+    """Switches to a journaled queue, restoring what the last boot left in it."""
+    global _queue
+    _queue = CommandQueue(path)
+
+
+def reset():
+    """An empty in-memory queue, for a new simulated mission."""
+    global _queue
+    _queue = CommandQueue()
+
+
+def receive(text, now=None):
+    return _queue.receive(text, now)
+
+
+def dispatch(system_state, now=None):
+    return _queue.dispatch(system_state, now)
+
+
+def next_due():
+    return _queue.next_due()
+
+
+def get_stats():
+    return dict(_queue.stats, pending=len(_queue))
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import random
+    import tempfile
+    import time
+
+    import hardware_drivers
+    import main
+    import sensor_acquisition
+    import command_queue  # The queue the flight code uses, not this __main__ copy
+
+    state = dict(current_mode="EXPERIMENT_MODE", battery_voltage=3.9, pi_temp=45.0, gnd_command_received=None)
+    directory = tempfile.mkdtemp()
+    rng = random.Random(0)
+
+    def noop_batch(batch_id, n, now, span):
+        return encode_batch(batch_id, [{"cmd": "NOOP", "at": now + rng.uniform(0, span),
+                                        "priority": rng.randrange(20)} for _ in range(n)])
+
+    # Receipt and dispatch cost against queue size: dispatch should grow like log n.
+    # Both include the fsync'ed journal line, which dominates when few commands are due per call.
+    print("--- Stored commands: throughput (journal fsync included) ---")
+    print(f"{'queued':>8}{'receive (us/cmd)':>18}{'journal (ms)':>14}{'dispatch (us/cmd)':>19}{'restart (ms)':>14}")
+    for n in (1000, 10000, 100000):
+        path = os.path.join(directory, f"queue_{n}.jsonl")
+        queue = CommandQueue(path, capacity=n)
+        text = noop_batch(f"tp-{n}", n, 0.0, 14 * 86400)
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            queue.receive(text, now=0.0)
+            receive_time = time.perf_counter() - t0
+            # Drain half of it in 10-minute steps, the way the task would
+            t0 = time.perf_counter()
+            ran = 0
+            for step in range(1, 7 * 144 + 1):
+                ran += queue.dispatch(state, now=step * 600.0)
+            dispatch_time = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            restored = CommandQueue(path, capacity=n)
+            restart_time = time.perf_counter() - t0
+        assert len(restored) == len(queue) and restored.next_due() == queue.next_due()
+        print(f"{n:>8}{receive_time / n * 1e6:>18.2f}{os.path.getsize(path) / 1e3:>12.0f}kB"
+              f"{dispatch_time / ran * 1e6:>19.2f}{restart_time * 1e3:>14.1f}")
+
+    # Validation: one bad command rejects the whole batch
+    queue = CommandQueue()
+    bad = encode_batch("bad", [{"cmd": "NOOP", "after": 10}, {"cmd": "SELF_DESTRUCT", "after": 20},
+                               {"cmd": "CAPTURE_IMAGE", "at": -5.0, "if": {"mode": "WARP"}}])
+    with contextlib.redirect_stdout(io.StringIO()):
+        errors = queue.receive(bad, now=0.0)
+    print(f"\ninvalid batch: {len(errors)} errors, {len(queue)} queued: {errors}")
+
+    # End to end: one uplink schedules 3 days of operations through the flight loop
+    sensor_acquisition.set_concurrent(False)
+    start_time = 1.0e9
+    plan = [{"cmd": "START_EXPERIMENT", "after": 120, "if": {"min_voltage": 3.6}}]
+    plan += [{"cmd": "CAPTURE_IMAGE", "after": 1800 + 7200 * k, "priority": 5} for k in range(36)]
+    plan += [{"cmd": "REQUEST_TRANSMIT", "after": 2 * 86400, "window": 600},  # Not in SAFE_MODE then
+             {"cmd": "ENTER_SAFE_MODE", "after": 3 * 86400 - 300},
+             {"cmd": "REQUEST_TRANSMIT", "after": 3 * 86400 - 200}]
+    uplinks = iter([encode_batch("ops-1", plan)])
+    saved = hardware_drivers.check_for_gnd_command
+    hardware_drivers.check_for_gnd_command = lambda: next(uplinks, None)
+    modes = []
+    try:
+        mission_clock.set_clock(mission_clock.DiscreteEventClock(start_time=start_time))
+        hardware_drivers.reset_simulation(seed=0)
+        conops_modes.reset_timers()
+        command_queue.start(os.path.join(directory, "flight.jsonl"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.run_simulation_loop(mission_duration=3 * 86400,
+                                     on_tick=lambda s: modes.append(s["current_mode"]) if not modes or
+                                     modes[-1] != s["current_mode"] else None)
+    finally:
+        hardware_drivers.check_for_gnd_command = saved
+    print(f"\n3-day mission from one uplink of {len(plan)} commands: {command_queue.get_stats()}")
+    print("modes: " + " -> ".join(modes))
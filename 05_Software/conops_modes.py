@@ -5,30 +5,60 @@ Each function is called by main.py when the satellite is in that specific mode.
 """
 
 import time
+
+import actuators
+import flight_log
+import flight_metrics
 import hardware_drivers
 import global_config
-import system_health
+import mission_clock
+import sensor_acquisition
+import thermal_control
+
+# --- Mode Names (numbered as in the CONOPS, Mode 1..8) ---
+MODES = [
+    "STARTUP", "INITIALIZE", "SAFE_MODE", "PRE_EXPERIMENT_HEATING",
+    "WATER_SATURATION", "EXPERIMENT_MODE", "TRANSMIT_MODE", "LAST_RESORT_MODE",
+]
+# Run once per boot; main.py runs the mode they hand over to in the same tick
+BOOT_MODES = ("STARTUP", "INITIALIZE")
 
 # --- Global Timer Variables for Image Capture ---
+# The interval itself is global_config.IMAGE_INTERVAL_SEC, so it can be tuned
 last_image_time = 0
-IMAGE_INTERVAL = 300  # 300 seconds = 5 minutes
+
+def reset_timers():
+    """Clears the module-level mode timers before a new simulated mission."""
+    global last_image_time
+    last_image_time = 0
+
+def get_timers():
+    """The module-level mode timers, for checkpoint.py."""
+    return {"last_image_time": last_image_time}
+
+def restore_timers(timers):
+    """Puts back timers saved by get_timers() after a warm restart."""
+    global last_image_time
+    last_image_time = timers.get("last_image_time", 0)
 
 def handle_startup(system_state):
     """
     Mode 1: STARTUP
     Runs once on boot. Performs Power-On Self-Test (POST).
     """
-    print("[Mode] STARTUP: Running Power-On Self-Tests...")
+    flight_log.info("Mode", "STARTUP: Running Power-On Self-Tests...")
     
-    # Check sensors, memory, etc.
-    sensors_ok = hardware_drivers.check_all_sensors()
-    memory_ok = hardware_drivers.check_memory()
+    # Check sensors, memory, etc. The checks are independent, so they run at the same time.
+    t0 = time.perf_counter()
+    sensors_ok, memory_ok = sensor_acquisition.run_concurrently(
+        hardware_drivers.check_all_sensors, hardware_drivers.check_memory)
+    flight_metrics.startup_phase("post", t0, time.perf_counter())
     
     if sensors_ok and memory_ok:
-        print("[Mode] STARTUP: POST successful.")
+        flight_log.info("Mode", "STARTUP: POST successful.")
         system_state["current_mode"] = "INITIALIZE"
     else:
-        print("[Mode] STARTUP: POST FAILED. Entering SAFE_MODE.")
+        flight_log.error("Mode", "STARTUP: POST FAILED. Entering SAFE_MODE.")
         system_state["current_mode"] = "SAFE_MODE"
 
 
@@ -38,12 +68,21 @@ def handle_initialize(system_state):
     Runs once after STARTUP. Powers on essential components
     and transitions to the default idle state (SAFE_MODE).
     """
-    print("[Mode] INITIALIZE: Powering on essential systems...")
-    hardware_drivers.power_on_comms_receiver()
-    hardware_drivers.power_on_adcs_systems()
+    flight_log.info("Mode", "INITIALIZE: Powering on essential systems...")
+    t0 = time.perf_counter()
+    sensor_acquisition.run_concurrently(
+        hardware_drivers.power_on_comms_receiver, hardware_drivers.power_on_adcs_systems)
+    flight_metrics.startup_phase("initialize", t0, time.perf_counter())
     
-    # Default to SAFE_MODE to wait for ground commands or scheduled events
-    print("[Mode] INITIALIZE: Init complete. Entering SAFE_MODE.")
+    # Default to SAFE_MODE to wait for ground commands or scheduled events,
+    # unless a reset interrupted a mode that should carry on (checkpoint.py)
+    resume_mode = system_state.get("resume_mode")
+    if resume_mode:
+        flight_log.info("Mode", "INITIALIZE: Init complete. Resuming %s.", resume_mode)
+        system_state["resume_mode"] = None
+        system_state["current_mode"] = resume_mode
+        return
+    flight_log.info("Mode", "INITIALIZE: Init complete. Entering SAFE_MODE.")
     system_state["current_mode"] = "SAFE_MODE"
 
 
@@ -55,19 +94,24 @@ def handle_safe_mode(system_state):
     - Maintain critical systems (payload survival temps)
     - Listen for commands from ground
     """
-    print_once(system_state, "[Mode] SAFE_MODE: System idle. Listening for commands.")
+    print_once(system_state, "SAFE_MODE: System idle. Listening for commands.")
     
-    # Per PAY-1, we must keep plants alive. Run thermal control.
-    system_health.run_payload_thermal_control(system_state)
+    # Per PAY-1, we must keep plants alive: main.py's thermal task runs
+    # the thermostat in this mode every THERMAL_CONTROL_PERIOD_SEC.
     
     # Check for commands from ground (this is a mock function)
     cmd = hardware_drivers.check_for_gnd_command()
-    if cmd == "START_EXPERIMENT":
-        print("[Mode] SAFE_MODE: Received START_EXPERIMENT command.")
+    # Imported here: command_queue imports this module for MODES.
+    import command_queue
+    if command_queue.is_batch(cmd):
+        # A time-tagged command sequence; main.py runs it from the queue
+        command_queue.receive(cmd)
+    elif cmd == "START_EXPERIMENT":
+        flight_log.info("Mode", "SAFE_MODE: Received START_EXPERIMENT command.")
         # As per PAY-3, we must heat water *before* saturation.
         system_state["current_mode"] = "PRE_EXPERIMENT_HEATING"
     elif cmd == "REQUEST_TRANSMIT":
-        print("[Mode] SAFE_MODE: Received REQUEST_TRANSMIT command.")
+        flight_log.info("Mode", "SAFE_MODE: Received REQUEST_TRANSMIT command.")
         system_state["current_mode"] = "TRANSMIT_MODE"
 
 
@@ -77,15 +121,15 @@ def handle_pre_experiment_heating(system_state):
     As per PAY-3, "water temperature... shall be greater than 15°C
     before initial water saturation."
     """
-    print_once(system_state, "[Mode] PRE_EXPERIMENT: Heating water...")
+    print_once(system_state, "PRE_EXPERIMENT: Heating water...")
     
     water_temp = system_state["payload_temps"]["water"]
     
     if water_temp < global_config.MIN_WATER_TEMP:
-        hardware_drivers.set_heater(global_config.WATER_HEATER, "ON")
+        actuators.set_heater(global_config.WATER_HEATER, "ON")
     else:
-        print(f"[Mode] PRE_EXPERIMENT: Water is at {water_temp}°C. Ready for saturation.")
-        hardware_drivers.set_heater(global_config.WATER_HEATER, "OFF")
+        flight_log.info("Mode", "PRE_EXPERIMENT: Water is at %s°C. Ready for saturation.", water_temp)
+        actuators.set_heater(global_config.WATER_HEATER, "OFF")
         system_state["current_mode"] = "WATER_SATURATION"
 
 
@@ -95,13 +139,13 @@ def handle_water_saturation(system_state):
     As per PAY-1, this "denotes the start of the experiment."
     This mode runs the pump to saturate the plant pillows.
     """
-    print("[Mode] WATER_SATURATION: Saturating plant pillows...")
+    flight_log.info("Mode", "WATER_SATURATION: Saturating plant pillows...")
     
     # Run the pump for a configured amount of time
     hardware_drivers.run_pump(duration_sec=global_config.SATURATION_TIME_SEC)
     
-    print("[Mode] WATER_SATURATION: Complete.")
-    system_state["experiment_start_time"] = time.time()
+    flight_log.info("Mode", "WATER_SATURATION: Complete.")
+    system_state["experiment_start_time"] = mission_clock.now()
     system_state["current_mode"] = "EXPERIMENT_MODE"
 
 
@@ -109,39 +153,39 @@ def handle_experiment_mode(system_state):
     """
     Mode 6: EXPERIMENT_MODE
     The main mission.
-    - Run payload thermal control (MO-1)
+    - Payload thermal control (MO-1) is main.py's thermal task
     - Run LED light cycles (PAY-4)
     - Image growth chamber (MO-3)
     """
     global last_image_time  # We need to access the global timer
 
-    print_once(system_state, "[Mode] EXPERIMENT: Running main science mission.")
+    print_once(system_state, "EXPERIMENT: Running main science mission.")
     
-    # 1. Run thermal control (MO-1)
-    system_health.run_payload_thermal_control(system_state)
-    
-    # 2. Run LED cycles (PAY-4: "16 hours on and 8 hours off")
-    time_since_start = time.time() - system_state["experiment_start_time"]
+    # 1. Run LED cycles (PAY-4: "16 hours on and 8 hours off")
+    time_since_start = mission_clock.now() - system_state["experiment_start_time"]
     day_cycle_time = time_since_start % (24 * 3600) # Time in seconds into a 24-hr cycle
     
     if day_cycle_time < (16 * 3600): # First 16 hours
-        hardware_drivers.set_leds("ON")
+        actuators.set_leds("ON")
     else: # Last 8 hours
-        hardware_drivers.set_leds("OFF")
+        actuators.set_leds("OFF")
         
-    # 3. Check Image Timer (Fixed for Data Budget)
-    current_time = time.time()
+    # 2. Check Image Timer (Fixed for Data Budget)
+    current_time = mission_clock.now()
     
-    # Only take a picture if 300 seconds (5 mins) have passed
-    if (current_time - last_image_time) >= IMAGE_INTERVAL:
-        print(f"[Mode] EXPERIMENT: Timer hit ({IMAGE_INTERVAL}s). Capturing image.")
-        hardware_drivers.capture_image()
+    # Only take a picture if IMAGE_INTERVAL_SEC (5 mins) have passed
+    if (current_time - last_image_time) >= global_config.IMAGE_INTERVAL_SEC:
+        flight_log.info("Mode", "EXPERIMENT: Timer hit (%ss). Capturing image.", global_config.IMAGE_INTERVAL_SEC)
+        # Only queues the capture; encoding and storage happen off the loop.
+        # Imported here so a boot doesn't load the pipeline (and NumPy) before it is needed
+        import image_pipeline
+        image_pipeline.request_capture(system_state)
         last_image_time = current_time  # Reset the timer
     
     # This mode runs until the experiment duration is over
     if time_since_start > global_config.EXPERIMENT_DURATION_SEC:
-        print("[Mode] EXPERIMENT: Experiment duration complete. Returning to SAFE_MODE.")
-        hardware_drivers.set_leds("OFF")
+        flight_log.info("Mode", "EXPERIMENT: Experiment duration complete. Returning to SAFE_MODE.")
+        actuators.set_leds("OFF")
         system_state["current_mode"] = "SAFE_MODE"
 
 
@@ -151,13 +195,17 @@ def handle_transmit_mode(system_state):
     Powers on the high-gain antenna and transmitter to downlink
     sensor and image data.
     """
-    print_once(system_state, "[Mode] TRANSMIT: Powering on transmitter.")
+    print_once(system_state, "TRANSMIT: Powering on transmitter.")
     hardware_drivers.power_on_comms_transmitter()
     
-    print("[Mode] TRANSMIT: Downlinking data...")
-    hardware_drivers.downlink_data_buffer()
+    flight_log.info("Mode", "TRANSMIT: Downlinking data...")
+    # Imported here: downlink -> telemetry_recorder imports this module.
+    import downlink
+    frames, report = downlink.prepare_pass(system_state)
+    hardware_drivers.downlink_data_buffer(frames)
+    flight_log.info("Mode", "TRANSMIT: %s", report.summary())
     
-    print("[Mode] TRANSMIT: Downlink complete. Returning to SAFE_MODE.")
+    flight_log.info("Mode", "TRANSMIT: Downlink complete. Returning to SAFE_MODE.")
     hardware_drivers.power_off_comms_transmitter()
     system_state["current_mode"] = "SAFE_MODE"
 
@@ -170,21 +218,70 @@ def handle_last_resort_mode(system_state):
     - Orient for maximum sun (ADCS)
     - Wait for power to recover.
     """
-    print_once(system_state, "[Mode] LAST_RESORT: CRITICAL POWER. Shutting down non-essentials.")
+    print_once(system_state, "LAST_RESORT: CRITICAL POWER. Shutting down non-essentials.", flight_log.CRITICAL)
     
-    # This is a "hard-power-off" command
-    hardware_drivers.power_off_all_non_essential()
+    # This is a "hard-power-off" command; it does not wait for the end of the tick
+    actuators.shed_load()
+    thermal_control.shed_load(mission_clock.now())
     
     # The system_health module will be responsible for checking
     # if voltage has recovered and can move back to SAFE_MODE.
 
 
+# --- Dispatch Table (main.py runs HANDLERS[current_mode] each mode tick) ---
+HANDLERS = {
+    "STARTUP": handle_startup,
+    "INITIALIZE": handle_initialize,
+    "SAFE_MODE": handle_safe_mode,
+    "PRE_EXPERIMENT_HEATING": handle_pre_experiment_heating,
+    "WATER_SATURATION": handle_water_saturation,
+    "EXPERIMENT_MODE": handle_experiment_mode,
+    "TRANSMIT_MODE": handle_transmit_mode,
+    "LAST_RESORT_MODE": handle_last_resort_mode,
+}
+
+
+# --- Scheduling Helper ---
+
+def next_deadline(system_state):
+    """
+    Returns the next absolute mission time at which the current mode has
+    something time-driven to do, or None if every tick matters.
+
+    Only EXPERIMENT_MODE is purely timer-driven (image timer, LED 16/8
+    boundary, end of experiment). The scheduler in main.py uses this to
+    run the mode only at its next event instead of every tick.
+    """
+    if system_state["current_mode"] != "EXPERIMENT_MODE":
+        return None
+    if system_state["experiment_start_time"] is None:
+        return None
+
+    now = mission_clock.now()
+    start = system_state["experiment_start_time"]
+
+    # Next image
+    next_image = last_image_time + global_config.IMAGE_INTERVAL_SEC
+
+    # Next LED switch (PAY-4: 16 hours on, 8 hours off)
+    day_cycle_time = (now - start) % (24 * 3600)
+    if day_cycle_time < (16 * 3600):
+        next_led_switch = now + (16 * 3600 - day_cycle_time)
+    else:
+        next_led_switch = now + (24 * 3600 - day_cycle_time)
+
+    # End of experiment
+    experiment_end = start + global_config.EXPERIMENT_DURATION_SEC
+
+    return min(next_image, next_led_switch, experiment_end)
+
+
 # --- Utility Function ---
 
-def print_once(system_state, message):
+def print_once(system_state, message, level=flight_log.INFO):
     """
-    Helper function to print a message only once when entering a mode.
+    Helper function to log a message only once when entering a mode.
     """
     if system_state["current_mode"] != system_state["last_mode"]:
-        print(message)
+        flight_log.log(level, "Mode", message)
         system_state["last_mode"] = system_state["current_mode"]
\ No newline at end of file
@@ -0,0 +1,302 @@
+"""
+downlink.py
+Turns recorded telemetry into compressed, CCSDS-style transfer frames.
+
+Pipeline (encode_pass):
+1. Quantize each telemetry column to an integer (ms, mV, 0.01 °C, ...).
+2. Delta-encode each column, zigzag the signed deltas and write them as
+   variable-length integers (LEB128). Slow-moving housekeeping data
+   becomes mostly 1-byte values.
+3. Compress the byte stream with zlib.
+4. Cut the result into fixed-size frames:
+       [ASM 4 B][header 6 B][data][CRC-16 2 B]
+   The header carries the spacecraft/virtual channel IDs, a 16-bit frame
+   sequence count and the number of data bytes used in the frame.
+
+decode_frames() reverses all of it on the ground, one payload per
+virtual channel, and reports missing or corrupt frames. Each pass produces a PassReport with throughput,
+compression ratio and bytes per reading.
+
+prepare_pass() always sends the housekeeping beacon (housekeeping.py:
+min/max/mean/std, limit and mode times since the last pass, a few
+hundred bytes) on its own virtual channel; the raw telemetry above, from
+the ring main.py records with --record, is only added if
+DOWNLINK_RAW_TELEMETRY is set. Frame sequence counts run on from pass to
+pass on each virtual channel, and only records newer than the last pass
+are sent. Both are kept in the flight state, so they start over with a
+new mission and survive a warm restart (checkpoint.py).
+"""
+
+import binascii
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+import global_config
+import housekeeping
+import mission_clock
+import telemetry_recorder
+
+# --- Frame Format ---
+ASM = b"\x1a\xcf\xfc\x1d"           # CCSDS attached sync marker
+FRAME_HEADER = struct.Struct(">HHH")  # ids, sequence count, data length
+CRC = struct.Struct(">H")
+FRAME_DATA_SIZE = global_config.DOWNLINK_FRAME_SIZE - len(ASM) - FRAME_HEADER.size - CRC.size
+VIRTUAL_CHANNEL_TELEMETRY = 1
+VIRTUAL_CHANNEL_HOUSEKEEPING = 2
+SEQUENCE_MASK = 0xFFFF
+
+# --- Payload Format ---
+PAYLOAD_HEADER = struct.Struct(">4sII")  # magic, record count, column count
+PAYLOAD_MAGIC = b"PFDL"
+
+# (column, scale) pairs: value is sent as round(value * scale)
+COLUMNS = [
+    ("time", 1000),            # ms
+    ("mode", 1),
+    ("battery_voltage", 1000),  # mV
+    ("pi_temp", 100),          # 0.01 °C
+    ("air_temp", 100),
+    ("substrate_temp", 100),
+    ("water_temp", 100),
+    ("soil_moisture", 100),
+    ("humidity", 100),
+    ("flags", 1),
+]
+
+
+# --- Variable-Length Integers (vectorized) ---
+
+def varint_encode(values):
+    """LEB128-encodes an array of non-negative integers into bytes."""
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        n_bytes += values >= np.uint64(1 << (7 * k))
+    shifts = np.arange(10, dtype=np.uint64) * np.uint64(7)
+    groups = ((values[:, None] >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    more = np.arange(10) < (n_bytes[:, None] - 1)
+    groups[more] |= 0x80
+    return groups[np.arange(10) < n_bytes[:, None]].tobytes()
+
+
+def varint_decode(data):
+    """Inverse of varint_encode. Returns a uint64 array."""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if len(raw) == 0:
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero((raw & 0x80) == 0)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group_id = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    position = np.arange(len(raw)) - starts[group_id]
+    parts = (raw & 0x7F).astype(np.uint64) << (position.astype(np.uint64) * np.uint64(7))
+    return np.add.reduceat(parts, starts)
+
+
+def _zigzag(values):
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values):
+    values = values.astype(np.int64)
+    return (values >> 1) ^ -(values & 1)
+
+
+# --- Payload Encode / Decode ---
+
+def encode_records(records):
+    """Quantized, delta + varint encoded, zlib-compressed bytes for `records`."""
+    chunks = [PAYLOAD_HEADER.pack(PAYLOAD_MAGIC, len(records), len(COLUMNS))]
+    for name, scale in COLUMNS:
+        column = np.round(records[name].astype(np.float64) * scale).astype(np.int64)
+        deltas = np.diff(column, prepend=0)
+        encoded = varint_encode(_zigzag(deltas))
+        chunks.append(struct.pack(">I", len(encoded)))
+        chunks.append(encoded)
+    return zlib.compress(b"".join(chunks), 9)
+
+
+def decode_records(payload):
+    """Inverse of encode_records. Returns a structured array of the quantized values."""
+    raw = zlib.decompress(payload)
+    magic, count, n_columns = PAYLOAD_HEADER.unpack_from(raw, 0)
+    if magic != PAYLOAD_MAGIC or n_columns != len(COLUMNS):
+        raise ValueError("not a Pathfinder downlink payload")
+    records = np.zeros(count, dtype=telemetry_recorder.RECORD_DTYPE)
+    offset = PAYLOAD_HEADER.size
+    for name, scale in COLUMNS:
+        (length,) = struct.unpack_from(">I", raw, offset)
+        offset += 4
+        deltas = _unzigzag(varint_decode(raw[offset:offset + length]))
+        offset += length
+        records[name] = np.cumsum(deltas) / scale
+    return records
+
+
+# --- Framing ---
+
+def _crc16(data):
+    # CRC-16-CCITT, initial value 0xFFFF (the CCSDS frame error control field)
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def frame_payload(payload, first_sequence=0, virtual_channel=VIRTUAL_CHANNEL_TELEMETRY):
+    """Splits `payload` into fixed-size frames. The last frame is zero-padded."""
+    ids = ((global_config.SPACECRAFT_ID & 0x3FF) << 4) | ((virtual_channel & 0x7) << 1)
+    frames = []
+    for i, offset in enumerate(range(0, max(len(payload), 1), FRAME_DATA_SIZE)):
+        data = payload[offset:offset + FRAME_DATA_SIZE]
+        header = FRAME_HEADER.pack(ids, (first_sequence + i) & SEQUENCE_MASK, len(data))
+        body = header + data.ljust(FRAME_DATA_SIZE, b"\x00")
+        frames.append(ASM + body + CRC.pack(_crc16(body)))
+    return frames
+
+
+def decode_frames(frames):
+    """
+    Checks and reassembles frames on the ground.
+    Returns (payloads, stats): payloads maps each virtual channel to its
+    reassembled bytes, and stats counts good, corrupt and missing (never
+    received) frames. Sequence counts run per virtual channel. Corrupt
+    frames are dropped; a payload is only valid if nothing was lost.
+    """
+    stats = {"good": 0, "corrupt": 0, "missing": 0}
+    gaps = 0
+    chunks = {}
+    expected = {}
+    for frame in frames:
+        body, (crc,) = frame[len(ASM):-CRC.size], CRC.unpack(frame[-CRC.size:])
+        if frame[:len(ASM)] != ASM or _crc16(body) != crc:
+            stats["corrupt"] += 1
+            continue
+        ids, sequence, length = FRAME_HEADER.unpack_from(body, 0)
+        vc = (ids >> 1) & 0x7
+        if vc in expected and sequence != expected[vc]:
+            gaps += (sequence - expected[vc]) & SEQUENCE_MASK
+        expected[vc] = (sequence + 1) & SEQUENCE_MASK
+        chunks.setdefault(vc, []).append(body[FRAME_HEADER.size:FRAME_HEADER.size + length])
+        stats["good"] += 1
+    # Corrupt frames also show up as sequence gaps
+    stats["missing"] = max(0, gaps - stats["corrupt"])
+    return {vc: b"".join(parts) for vc, parts in chunks.items()}, stats
+
+
+# --- Pass Report ---
+
+class PassReport:
+    """What one downlink pass cost and how well it compressed."""
+
+    def __init__(self, n_records, payload_bytes, n_frames, encode_seconds, beacon_bytes=0):
+        self.n_records = n_records
+        self.beacon_bytes = beacon_bytes
+        self.raw_bytes = n_records * telemetry_recorder.RECORD_SIZE
+        self.payload_bytes = payload_bytes
+        self.n_frames = n_frames
+        self.link_bytes = n_frames * global_config.DOWNLINK_FRAME_SIZE
+        self.encode_seconds = encode_seconds
+
+    @property
+    def compression_ratio(self):
+        return self.raw_bytes / self.link_bytes if self.link_bytes else 0.0
+
+    @property
+    def bytes_per_reading(self):
+        return self.link_bytes / self.n_records if self.n_records else 0.0
+
+    @property
+    def link_seconds(self):
+        return self.link_bytes * 8 / global_config.DOWNLINK_BITRATE_BPS
+
+    def summary(self):
+        rate = self.n_records / self.encode_seconds if self.encode_seconds else 0.0
+        beacon = f"beacon {self.beacon_bytes} B, " if self.beacon_bytes else ""
+        return (f"{beacon}{self.n_records} records, {self.raw_bytes} B raw -> {self.link_bytes} B in "
+                f"{self.n_frames} frames (ratio {self.compression_ratio:.1f}x, "
+                f"{self.bytes_per_reading:.2f} B/reading), encode {rate:,.0f} records/s, "
+                f"{self.link_seconds:.0f} s on air")
+
+
+def encode_pass(records, first_sequence=0):
+    """Encodes and frames `records`. Returns (frames, PassReport)."""
+    t0 = time.perf_counter()
+    payload = encode_records(records) if len(records) else b""
+    frames = frame_payload(payload, first_sequence) if payload else []
+    report = PassReport(len(records), len(payload), len(frames), time.perf_counter() - t0)
+    return frames, report
+
+
+def prepare_pass(system_state, raw=None):
+    """
+    Frames for one pass (used by conops_modes.handle_transmit_mode): the
+    housekeeping beacon, then, if raw (default DOWNLINK_RAW_TELEMETRY),
+    all telemetry in system_state["telemetry_file"] newer than the last
+    pass. Updates the downlink fields of system_state.
+    Returns (frames, PassReport).
+    """
+    raw = global_config.DOWNLINK_RAW_TELEMETRY if raw is None else raw
+    telemetry_sequence, housekeeping_sequence = system_state.get("downlink_sequence") or (0, 0)
+    beacon = housekeeping.beacon(mission_clock.now())
+    beacon_frames = frame_payload(beacon, housekeeping_sequence, VIRTUAL_CHANNEL_HOUSEKEEPING) if beacon else []
+    records = np.empty(0, dtype=telemetry_recorder.RECORD_DTYPE)
+    if raw:
+        records = _records_since(system_state.get("telemetry_file"), system_state.get("downlink_time"))
+    frames, report = encode_pass(records, telemetry_sequence)
+    if len(records):
+        system_state["downlink_time"] = float(records["time"][-1])
+    system_state["downlink_sequence"] = ((telemetry_sequence + len(frames)) & SEQUENCE_MASK,
+                                         (housekeeping_sequence + len(beacon_frames)) & SEQUENCE_MASK)
+    report.beacon_bytes = len(beacon)
+    report.n_frames += len(beacon_frames)
+    report.link_bytes += len(beacon_frames) * global_config.DOWNLINK_FRAME_SIZE
+    return beacon_frames + frames, report
+
+
+def _records_since(path, after):
+    """Telemetry in the ring at `path` newer than `after`; empty if nothing is being recorded."""
+    if path is None or not os.path.exists(path):
+        return np.empty(0, dtype=telemetry_recorder.RECORD_DTYPE)
+    start = float("-inf") if after is None else np.nextafter(after, np.inf)
+    reader = telemetry_recorder.TelemetryReader(path)
+    try:
+        return reader.window(start, float("inf"))
+    finally:
+        reader.close()
+
+
+def synthetic_log(days=14, seed=0):
+    """A 1 Hz housekeeping log with realistic drift, noise and mode changes."""
+    rng = np.random.default_rng(seed)
+    n = days * 24 * 3600
+    t = np.arange(n, dtype=np.float64)
+    records = np.zeros(n, dtype=telemetry_recorder.RECORD_DTYPE)
+    day_phase = (t % 86400) < 16 * 3600
+    records["time"] = 1.0e9 + t
+    records["mode"] = 5  # EXPERIMENT_MODE
+    records["battery_voltage"] = 3.8 + 0.05 * np.sin(2 * np.pi * t / 5400) + rng.normal(0, 0.003, n)
+    records["pi_temp"] = 43.0 + rng.normal(0, 0.05, n)
+    records["air_temp"] = np.where(day_phase, 23.5, 20.5) + rng.normal(0, 0.05, n)
+    records["substrate_temp"] = np.where(day_phase, 22.0, 20.0) + rng.normal(0, 0.05, n)
+    records["water_temp"] = np.where(day_phase, 22.0, 19.5) + rng.normal(0, 0.05, n)
+    records["soil_moisture"] = 0.45 - 0.1 * t / n
+    records["humidity"] = 60.0 + rng.normal(0, 0.2, n)
+    records["flags"] = np.where(day_phase, telemetry_recorder.FLAG_LEDS, telemetry_recorder.FLAG_AIR_HEATER)
+    return records
+
+
+if __name__ == "__main__":
+    records = synthetic_log()
+    frames, report = encode_pass(records)
+    print("--- Downlink: synthetic 14-day log ---")
+    print(report.summary())
+
+    t0 = time.perf_counter()
+    payloads, stats = decode_frames(frames)
+    decoded = decode_records(payloads[VIRTUAL_CHANNEL_TELEMETRY])
+    print(f"Decode: {(time.perf_counter() - t0) * 1000:.0f} ms, frames {stats}")
+    for name, scale in COLUMNS:
+        error = np.max(np.abs(decoded[name].astype(np.float64) - records[name].astype(np.float64)))
+        assert error <= 0.5 / scale + 1e-4, name
+    print("Round trip OK (within quantization)")
@@ -0,0 +1,453 @@
+"""
+fleet_sim.py
+Vectorized "fleet" simulation: steps N satellites per tick with NumPy.
+
+Instead of N system_state dicts (and a copy.deepcopy per tick), the
+fleet keeps every system_state field in a NumPy array with one entry per
+vehicle. Each tick runs:
+1. Vectorized sensor reads: the thermal network of hardware_drivers, and
+   the battery of power_model (bus voltage from state of charge and
+   load). The transmitter is left out: the fleet doesn't build downlink
+   passes, so it can't know how long the transmitter stays keyed.
+2. Vectorized fault checks (mirrors system_health.check_all_systems).
+3. Vectorized mode logic (mirrors the handlers in conops_modes).
+4. Every THERMAL_CONTROL_PERIOD_SEC, in SAFE_MODE and EXPERIMENT_MODE,
+   the payload thermostat (mirrors main.py's thermal task running
+   thermal_control with the "hysteresis" controller): air and water
+   channels with their own bands, THERMAL_MIN_DWELL_SEC between relay
+   switches unless the air leaves the PAY-1 survival range, and both
+   channels OFF when LAST_RESORT_MODE sheds load.
+
+verify_against_scalar() runs the same random sensor traces through the
+real scalar code and checks that modes, heaters and LEDs agree tick for
+tick. verify_power_model() does the same for the battery against
+power_model.PowerModel.
+
+Usage:
+    python fleet_sim.py --vehicles 10000 --ticks 1000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import actuators
+import global_config
+import conops_modes
+import system_health
+import hardware_drivers
+import mission_clock
+import power_model
+import thermal_control
+import thermal_model
+
+# --- Mode Codes (index into conops_modes.MODES) ---
+STARTUP = conops_modes.MODES.index("STARTUP")
+INITIALIZE = conops_modes.MODES.index("INITIALIZE")
+SAFE_MODE = conops_modes.MODES.index("SAFE_MODE")
+PRE_EXPERIMENT_HEATING = conops_modes.MODES.index("PRE_EXPERIMENT_HEATING")
+WATER_SATURATION = conops_modes.MODES.index("WATER_SATURATION")
+EXPERIMENT_MODE = conops_modes.MODES.index("EXPERIMENT_MODE")
+TRANSMIT_MODE = conops_modes.MODES.index("TRANSMIT_MODE")
+LAST_RESORT_MODE = conops_modes.MODES.index("LAST_RESORT_MODE")
+
+# --- Ground Command Codes ---
+CMD_NONE = 0
+CMD_START_EXPERIMENT = 1
+CMD_REQUEST_TRANSMIT = 2
+COMMANDS = {None: CMD_NONE, "START_EXPERIMENT": CMD_START_EXPERIMENT,
+            "REQUEST_TRANSMIT": CMD_REQUEST_TRANSMIT}
+
+DAY_SEC = 24 * 3600
+LED_ON_SEC = 16 * 3600
+
+
+class Fleet:
+    """
+    The state of N satellites, one array element per vehicle.
+    Field names follow system_state in main.py.
+    """
+
+    def __init__(self, n, water_temp=12.0):
+        if global_config.THERMAL_CONTROLLER != "hysteresis":
+            raise ValueError(f"the fleet only runs the hysteresis thermostat, not {global_config.THERMAL_CONTROLLER!r}")
+        self.n = n
+        self.current_mode = np.full(n, STARTUP, dtype=np.int8)
+        self.battery_voltage = np.zeros(n)
+        self.pi_temp = np.zeros(n)
+        self.air_temp = np.zeros(n)
+        self.water_temp = np.zeros(n)
+        self.experiment_start_time = np.full(n, np.nan)
+
+        # Module-level state of conops_modes / hardware_drivers, per vehicle
+        self.last_image_time = np.zeros(n)
+        self.air_heater_on = np.zeros(n, dtype=bool)
+        self.water_heater_on = np.zeros(n, dtype=bool)
+        self.leds_on = np.zeros(n, dtype=bool)
+        self.images_captured = np.zeros(n, dtype=np.int64)
+        self.node_temps = np.tile(thermal_model.INITIAL_TEMPS, (n, 1))
+        self.node_temps[:, thermal_model.WATER] = water_temp
+        self.thermal_time = None
+
+        # thermal_control channels: what the thermostat last decided, and
+        # when each relay last switched (NaN: never)
+        self.air_channel_on = np.zeros(n, dtype=bool)
+        self.water_channel_on = np.zeros(n, dtype=bool)
+        self.air_last_switch = np.full(n, np.nan)
+        self.water_last_switch = np.full(n, np.nan)
+        self.thermal_due = None
+
+        # power_model battery; loads other than heaters and LEDs
+        self.energy_wh = np.full(n, global_config.BATTERY_CAPACITY_WH * global_config.BATTERY_INITIAL_SOC)
+        self.essentials_on = np.zeros(n, dtype=bool)  # Receiver and ADCS, from INITIALIZE on
+        self.pump_until = np.full(n, -np.inf)
+        self.power_time = None
+
+    # --- 1. Sensors (same thermal and battery models as hardware_drivers) ---
+
+    def load_watts(self, t):
+        """Electrical load of every vehicle (W) just after time t."""
+        return (global_config.PI_POWER_W
+                + self.essentials_on * (global_config.RECEIVER_POWER_W + global_config.ADCS_POWER_W)
+                + self.air_heater_on * global_config.AIR_HEATER_POWER_W
+                + self.water_heater_on * global_config.WATER_HEATER_POWER_W
+                + self.leds_on * global_config.LED_POWER_W
+                + (self.pump_until > t) * global_config.PUMP_POWER_W)
+
+    def advance_power(self, now):
+        """power_model.PowerModel.advance_to for every vehicle at once."""
+        t = self.power_time
+        if t is None or now <= t:
+            self.power_time = now if t is None else t
+            return
+        capacity = global_config.BATTERY_CAPACITY_WH
+        while t < now:
+            # Power is constant until the next eclipse edge or pump stopping
+            step_end = min(now, power_model.next_orbit_edge(t))
+            stopping = self.pump_until[(self.pump_until > t) & (self.pump_until < step_end)]
+            if stopping.size:
+                step_end = float(stopping.min())
+            solar = global_config.SOLAR_ARRAY_POWER_W if power_model.in_sunlight(t) else 0.0
+            net = solar - self.load_watts(t)
+            delta = np.where(net > 0, net * global_config.BATTERY_CHARGE_EFFICIENCY, net) * (step_end - t) / 3600.0
+            self.energy_wh = np.clip(self.energy_wh + delta, 0.0, capacity)
+            t = step_end
+        self.power_time = now
+
+    def bus_voltage(self):
+        """power_model.PowerModel.voltage for every vehicle, at the battery's current time."""
+        capacity = global_config.BATTERY_CAPACITY_WH
+        now = self.power_time or 0.0
+        solar = global_config.SOLAR_ARRAY_POWER_W if power_model.in_sunlight(now) else 0.0
+        net = solar - self.load_watts(now)
+        net = np.where((net > 0) & (self.energy_wh >= capacity), 0.0, net)  # Full battery: shunted
+        ocv = power_model.open_circuit_voltage(self.energy_wh / capacity)
+        return ocv + net / ocv * global_config.BATTERY_RESISTANCE_OHM
+
+    def read_sensors(self, now, rng):
+        """
+        Advances every vehicle's thermal network and battery to `now` and
+        draws one set of sensor readings. Returns (voltage, pi_temp,
+        air_temp, water_temp).
+        """
+        n = self.n
+        if self.thermal_time is not None and now > self.thermal_time:
+            power = thermal_model.heat_input(self.air_heater_on, self.water_heater_on, self.leds_on)
+            self.node_temps = thermal_model.DEFAULT_NETWORK.advance(
+                self.node_temps, power, now - self.thermal_time)
+        self.thermal_time = now
+        self.advance_power(now)
+
+        voltage = self.bus_voltage() + rng.uniform(-0.01, 0.01, n)
+        noise = rng.uniform(-0.1, 0.1, (n, 3))
+        pi_temp = self.node_temps[:, thermal_model.PI] + noise[:, 0]
+        air_temp = self.node_temps[:, thermal_model.AIR] + noise[:, 1]
+        water_temp = self.node_temps[:, thermal_model.WATER] + noise[:, 2]
+        return voltage, pi_temp, air_temp, water_temp
+
+    # --- 2. Health checks (mirrors system_health.check_all_systems) ---
+
+    def check_all_systems(self, voltage, pi_temp, air_temp, water_temp):
+        self.battery_voltage[:] = voltage
+        self.pi_temp[:] = pi_temp
+        self.air_temp[:] = air_temp
+        self.water_temp[:] = water_temp
+        mode = self.current_mode
+
+        last_resort = voltage < global_config.LAST_RESORT_VOLTAGE
+        low = ~last_resort & (voltage < global_config.SAFE_MODE_VOLTAGE)
+        recovered = ~last_resort & ~low & (voltage > global_config.RECOVERED_VOLTAGE)
+
+        shed = low & ((mode == EXPERIMENT_MODE) | (mode == PRE_EXPERIMENT_HEATING))
+        recover = recovered & (mode == LAST_RESORT_MODE)
+
+        mode[last_resort] = LAST_RESORT_MODE
+        mode[shed | recover] = SAFE_MODE
+        mode[pi_temp > global_config.MAX_PI_TEMP] = SAFE_MODE
+
+    # --- 3. Mode logic (mirrors conops_modes) ---
+
+    def run_modes(self, now, gnd_command=CMD_START_EXPERIMENT):
+        """
+        Runs one mode handler per vehicle, chosen by its mode at dispatch
+        time. gnd_command is a command code or an array of codes.
+        """
+        mode = self.current_mode
+        startup = mode == STARTUP
+        initialize = mode == INITIALIZE
+        safe = mode == SAFE_MODE
+        pre = mode == PRE_EXPERIMENT_HEATING
+        saturation = mode == WATER_SATURATION
+        experiment = mode == EXPERIMENT_MODE
+        transmit = mode == TRANSMIT_MODE
+        last_resort = mode == LAST_RESORT_MODE
+        cmd = np.broadcast_to(gnd_command, mode.shape)
+
+        # STARTUP / INITIALIZE (POST always passes in simulation)
+        mode[startup] = INITIALIZE
+        self.essentials_on[initialize] = True
+        mode[initialize] = SAFE_MODE
+
+        # SAFE_MODE: ground commands
+        mode[safe & (cmd == CMD_START_EXPERIMENT)] = PRE_EXPERIMENT_HEATING
+        mode[safe & (cmd == CMD_REQUEST_TRANSMIT)] = TRANSMIT_MODE
+
+        # PRE_EXPERIMENT_HEATING: heat water until it is warm enough
+        cold = self.water_temp < global_config.MIN_WATER_TEMP
+        self.water_heater_on[pre] = cold[pre]
+        mode[pre & ~cold] = WATER_SATURATION
+
+        # WATER_SATURATION: run the pump, start the experiment clock
+        self.pump_until[saturation] = now + global_config.SATURATION_TIME_SEC
+        self.experiment_start_time[saturation] = now
+        mode[saturation] = EXPERIMENT_MODE
+
+        # EXPERIMENT_MODE: LED cycle, image timer, end of experiment
+        since_start = now - self.experiment_start_time
+        self.leds_on[experiment] = (since_start[experiment] % DAY_SEC) < LED_ON_SEC
+
+        take_image = experiment & ((now - self.last_image_time) >= global_config.IMAGE_INTERVAL_SEC)
+        self.images_captured += take_image
+        self.last_image_time[take_image] = now
+
+        done = experiment & (since_start > global_config.EXPERIMENT_DURATION_SEC)
+        self.leds_on[done] = False
+        mode[done] = SAFE_MODE
+
+        # TRANSMIT_MODE: one downlink, then back to SAFE_MODE
+        mode[transmit] = SAFE_MODE
+
+        # LAST_RESORT_MODE: everything non-essential off (thermal_control.shed_load too)
+        self.air_heater_on[last_resort] = False
+        self.water_heater_on[last_resort] = False
+        self.leds_on[last_resort] = False
+        for on, last_switch in ((self.air_channel_on, self.air_last_switch),
+                                (self.water_channel_on, self.water_last_switch)):
+            shed = last_resort & on
+            on[shed] = False
+            last_switch[shed] = now
+
+    # --- 4. Payload thermostat (mirrors main.py's thermal task) ---
+
+    def run_thermal(self, now):
+        """One thermal_control update for the vehicles in SAFE_MODE or EXPERIMENT_MODE."""
+        thermal = (self.current_mode == SAFE_MODE) | (self.current_mode == EXPERIMENT_MODE)
+        air_survival = (self.air_temp < global_config.MIN_PLANT_TEMP) | (self.air_temp > global_config.MAX_PLANT_TEMP)
+        channels = (
+            (self.air_temp, global_config.IDEAL_PLANT_TEMP_MIN, air_survival,
+             self.air_channel_on, self.air_last_switch, self.air_heater_on),
+            (self.water_temp, global_config.MIN_WATER_TEMP, np.zeros(self.n, dtype=bool),
+             self.water_channel_on, self.water_last_switch, self.water_heater_on),
+        )
+        for temp, low, urgent, on, last_switch, heater_on in channels:
+            # thermal_control.Hysteresis
+            on_below = low + global_config.THERMAL_MARGIN_C
+            off_above = on_below + global_config.THERMAL_HYSTERESIS_C
+            wanted = np.where(temp < on_below, True, np.where(temp > off_above, False, on))
+            # thermal_control.Channel: the relay dwell rule
+            dwelt = np.isnan(last_switch) | (now - last_switch >= global_config.THERMAL_MIN_DWELL_SEC)
+            switch = thermal & (wanted != on) & (urgent | dwelt)
+            on[switch] = wanted[switch]
+            last_switch[switch] = now
+            heater_on[thermal] = on[thermal]
+
+    def step(self, now, rng, gnd_command=CMD_START_EXPERIMENT):
+        """One full tick with mock sensors: read, check health, run modes, thermostat when due."""
+        self.check_all_systems(*self.read_sensors(now, rng))
+        self.run_modes(now, gnd_command)
+        if self.thermal_due is None or now >= self.thermal_due:
+            self.run_thermal(now)
+            self.thermal_due = now + global_config.THERMAL_CONTROL_PERIOD_SEC
+
+
+# --- Equivalence Check Against The Scalar State Machine ---
+
+HANDLERS = conops_modes.HANDLERS
+ACTUATOR_STATES = (global_config.AIR_HEATER, global_config.WATER_HEATER, "leds")
+
+
+def _random_traces(n, ticks, rng):
+    """Sensor and command traces that cross every threshold we check."""
+    voltage = 3.6 + np.cumsum(rng.normal(0.0, 0.05, (ticks, n)), axis=0)
+    voltage = np.clip(voltage, 3.1, 4.0)
+    pi_temp = np.where(rng.random((ticks, n)) < 0.02, 85.0, 50.0)
+    air_temp = rng.uniform(17.0, 28.0, (ticks, n))
+    water_temp = rng.uniform(10.0, 20.0, (ticks, n))
+    cmd = rng.choice([CMD_NONE, CMD_START_EXPERIMENT, CMD_REQUEST_TRANSMIT],
+                     size=(ticks, n), p=[0.6, 0.3, 0.1])
+    # Large, uneven steps so LED cycles, images and experiment ends all occur
+    times = 1.0e9 + np.cumsum(rng.choice([1.0, 60.0, 3600.0, 8 * 3600.0], size=ticks))
+    return times, voltage, pi_temp, air_temp, water_temp, cmd
+
+
+def _run_scalar(times, voltage, pi_temp, air_temp, water_temp, cmd):
+    """
+    Runs one vehicle through the real system_health/conops_modes code,
+    with the thermostat after the mode handler as in main.py. Returns the
+    mode and the (air heater, water heater, LEDs) states of every tick,
+    and the image count.
+    """
+    command_names = {code: name for name, code in COMMANDS.items()}
+    sensor_values = {}
+    hardware_drivers.read_voltage_sensor = lambda: sensor_values["voltage"]
+    hardware_drivers.read_temp_sensor = lambda sensor_id: sensor_values[sensor_id]
+    hardware_drivers.check_for_gnd_command = lambda: sensor_values["cmd"]
+
+    clock = mission_clock.DiscreteEventClock(start_time=times[0])
+    mission_clock.set_clock(clock)
+    hardware_drivers.reset_simulation()
+    conops_modes.reset_timers()
+    actuators.reset()
+    thermal_control.reset()
+
+    system_state = {
+        "current_mode": "STARTUP", "last_mode": "", "experiment_start_time": None,
+        "battery_voltage": 0.0, "pi_temp": 0.0,
+        "payload_temps": {"air": 0.0, "substrate": 0.0, "water": 0.0},
+    }
+    modes, states = [], []
+    for k, now in enumerate(times):
+        clock.current_time = now
+        sensor_values.update({
+            "voltage": voltage[k],
+            global_config.PI_TEMP_SENSOR: pi_temp[k],
+            global_config.AIR_TEMP_SENSOR: air_temp[k],
+            global_config.WATER_TEMP_SENSOR: water_temp[k],
+            "cmd": command_names[cmd[k]],
+        })
+        system_health.check_all_systems(system_state)
+        HANDLERS[system_state["current_mode"]](system_state)
+        if system_state["current_mode"] in ("SAFE_MODE", "EXPERIMENT_MODE"):
+            system_health.run_payload_thermal_control(system_state)
+        actuators.flush(now)
+        modes.append(conops_modes.MODES.index(system_state["current_mode"]))
+        states.append((hardware_drivers.get_heater_state(global_config.AIR_HEATER) == "ON",
+                       hardware_drivers.get_heater_state(global_config.WATER_HEATER) == "ON",
+                       hardware_drivers.get_led_state() == "ON"))
+    return modes, states, hardware_drivers.get_image_count()
+
+
+def verify_against_scalar(n=20, ticks=400, seed=0):
+    """
+    Drives the fleet and the scalar state machine with identical random
+    sensor traces and checks that every vehicle's mode, heaters and LEDs
+    match on every tick, and that image counts match at the end. Returns
+    True on success.
+    """
+    import contextlib
+    import io
+
+    rng = np.random.default_rng(seed)
+    times, voltage, pi_temp, air_temp, water_temp, cmd = _random_traces(n, ticks, rng)
+
+    fleet = Fleet(n)
+    fleet_modes = np.empty((ticks, n), dtype=np.int8)
+    fleet_states = np.empty((ticks, n, len(ACTUATOR_STATES)), dtype=bool)
+    for k in range(ticks):
+        fleet.check_all_systems(voltage[k], pi_temp[k], air_temp[k], water_temp[k])
+        fleet.run_modes(times[k], cmd[k])
+        fleet.run_thermal(times[k])
+        fleet_modes[k] = fleet.current_mode
+        fleet_states[k] = np.stack([fleet.air_heater_on, fleet.water_heater_on, fleet.leds_on], axis=1)
+
+    saved = (hardware_drivers.read_voltage_sensor, hardware_drivers.read_temp_sensor,
+             hardware_drivers.check_for_gnd_command, mission_clock.get_clock())
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(n):
+                modes, states, images = _run_scalar(times, voltage[:, i], pi_temp[:, i],
+                                                    air_temp[:, i], water_temp[:, i], cmd[:, i])
+                if list(fleet_modes[:, i]) != modes or fleet.images_captured[i] != images:
+                    return False
+                if not np.array_equal(fleet_states[:, i], states):
+                    return False
+    finally:
+        (hardware_drivers.read_voltage_sensor, hardware_drivers.read_temp_sensor,
+         hardware_drivers.check_for_gnd_command) = saved[:3]
+        mission_clock.set_clock(saved[3])
+    return True
+
+
+def verify_power_model(n=5, ticks=300, seed=0):
+    """
+    Switches the same random heater, LED, pump and INITIALIZE loads on the
+    fleet battery and on one power_model.PowerModel per vehicle, over
+    steps that cross eclipse edges. True if the stored energy and the bus
+    voltage agree on every tick.
+    """
+    rng = np.random.default_rng(seed)
+    fleet = Fleet(n)
+    models = [power_model.PowerModel() for _ in range(n)]
+    now = 0.0
+    for _ in range(ticks):
+        now += float(rng.choice([1.0, 60.0, 600.0, 3600.0]))
+        fleet.advance_power(now)
+        for model in models:
+            model.advance_to(now)
+        voltages = [model.voltage() for model in models]
+        if not (np.allclose(fleet.energy_wh, [m.energy_wh for m in models], rtol=0, atol=1e-9)
+                and np.allclose(fleet.bus_voltage(), voltages, rtol=0, atol=1e-9)):
+            return False
+        switch = rng.random((4, n)) < 0.3
+        for heater, load, loads in ((fleet.air_heater_on, power_model.AIR_HEATER, switch[0]),
+                                    (fleet.water_heater_on, power_model.WATER_HEATER, switch[1]),
+                                    (fleet.leds_on, power_model.LEDS, switch[2])):
+            heater[loads] = ~heater[loads]
+            for i in np.flatnonzero(loads):
+                models[i].set_load(load, heater[i], now)
+        for i in np.flatnonzero(switch[3] & ~fleet.essentials_on):
+            fleet.essentials_on[i] = True
+            models[i].set_load(power_model.RECEIVER, True, now)
+            models[i].set_load(power_model.ADCS, True, now)
+        for i in np.flatnonzero(rng.random(n) < 0.1):
+            fleet.pump_until[i] = now + global_config.SATURATION_TIME_SEC
+            models[i].run_for(power_model.PUMP, global_config.SATURATION_TIME_SEC, now)
+    return True
+
+
+def benchmark(n=10000, ticks=1000, seed=0):
+    """Returns vehicle-ticks per second for a fleet of n over `ticks` ticks."""
+    rng = np.random.default_rng(seed)
+    fleet = Fleet(n)
+    now = 1.0e9
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        fleet.step(now, rng)
+        now += global_config.MAIN_LOOP_DELAY
+    return n * ticks / (time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vectorized Pathfinder fleet simulation")
+    parser.add_argument("--vehicles", type=int, default=10000)
+    parser.add_argument("--ticks", type=int, default=1000)
+    args = parser.parse_args()
+
+    print("--- Fleet: checking equivalence with the scalar state machine ---")
+    print("PASS" if verify_against_scalar() else "FAIL")
+    print("--- Fleet: checking the battery against power_model ---")
+    print("PASS" if verify_power_model() else "FAIL")
+
+    rate = benchmark(args.vehicles, args.ticks)
+    print(f"--- Fleet: {args.vehicles} vehicles x {args.ticks} ticks: {rate:,.0f} vehicle-ticks/s ---")
@@ -0,0 +1,308 @@
+"""
+flight_log.py
+Queue-backed, rate-limited structured logger for the flight software.
+
+The control loop used to print() straight to the console or SD card,
+which blocks on I/O, has no severity, and grows without bound (the
+"[Mock HW] Setting heater" line alone came up once a second).
+
+Now a call like
+    flight_log.info("Mock HW", "Setting heater %s to %s", heater_id, status)
+does only three cheap things in the calling thread:
+1. drops it if it is below LOG_LEVEL,
+2. rate-limits it: each distinct message (source, format string and
+   arguments, so "heater_air to ON" and "heater_water to OFF" are
+   different messages) may log LOG_RATE_LIMIT_COUNT times per
+   LOG_RATE_LIMIT_WINDOW_SEC of mission time; the rest are counted and
+   the count rides along on the next copy that gets through
+   ("suppressed": n). ERROR and CRITICAL are never rate-limited,
+3. puts the unformatted arguments on a queue.
+
+A background thread formats each message, writes it as one JSON line
+    {"t": mission time, "lvl": "INFO", "src": "Mock HW", "msg": "...", "suppressed": 0}
+and optionally echoes "[Mock HW] ..." to the console. The file rotates
+at LOG_MAX_BYTES and keeps LOG_BACKUPS old files, so the log never takes
+more than LOG_MAX_BYTES * (LOG_BACKUPS + 1) on disk, however long the
+mission runs.
+
+If the logger was never started (e.g. Monte Carlo runs), messages that
+pass the rate limit are printed synchronously, like before.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+import global_config
+import mission_clock
+
+DEBUG, INFO, WARNING, ERROR, CRITICAL = 10, 20, 30, 40, 50
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR", CRITICAL: "CRITICAL"}
+_LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+
+def _format(fmt, args):
+    try:
+        return fmt % args if args else fmt
+    except (TypeError, ValueError):
+        return f"{fmt} {args!r}"
+
+
+class RateLimiter:
+    """Allows `count` messages per key in every `window` seconds of mission time."""
+
+    # Keys are pruned of finished windows once there are this many
+    MAX_KEYS = 1024
+
+    def __init__(self, count=None, window=None):
+        self.count = global_config.LOG_RATE_LIMIT_COUNT if count is None else count
+        self.window = global_config.LOG_RATE_LIMIT_WINDOW_SEC if window is None else window
+        self._keys = {}  # key -> [window start, messages let through, suppressed]
+        self._lock = threading.Lock()
+
+    def allow(self, key, now):
+        """Returns None if the message must be dropped, else the number suppressed before it."""
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None and len(self._keys) >= self.MAX_KEYS:
+                self._prune(now)
+            if entry is None or not 0 <= now - entry[0] < self.window:
+                suppressed = entry[2] if entry else 0
+                self._keys[key] = [now, 1, 0]
+                return suppressed
+            if entry[1] < self.count:
+                entry[1] += 1
+                suppressed, entry[2] = entry[2], 0
+                return suppressed
+            entry[2] += 1
+            return None
+
+    def _prune(self, now):
+        # Messages with changing arguments (temperatures, times) each get a
+        # key; forget the ones whose window is over. A suppressed count
+        # still pending on such a key is lost, like a message never repeated.
+        self._keys = {key: entry for key, entry in self._keys.items() if 0 <= now - entry[0] < self.window}
+
+    def reset(self):
+        with self._lock:
+            self._keys.clear()
+
+
+class FlightLog:
+    def __init__(self, path=global_config.LOG_FILE, max_bytes=global_config.LOG_MAX_BYTES,
+                 backups=global_config.LOG_BACKUPS, queue_size=global_config.LOG_QUEUE_SIZE, echo=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue_size = queue_size
+        self.echo = echo
+        self.records = queue.SimpleQueue()
+        self.stats = {"written": 0, "dropped": 0, "bytes": 0, "rotations": 0}
+        self._file = None
+        self._size = 0
+        self._thread = None
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = os.path.getsize(self.path)
+        self._thread = threading.Thread(target=self._worker, name="flight_log", daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        """Queues one record. Never blocks; drops it if the writer is far behind."""
+        if self.records.qsize() >= self.queue_size:
+            self.stats["dropped"] += 1
+            return False
+        self.records.put(record)
+        return True
+
+    def _worker(self):
+        while True:
+            batch = [self.records.get()]
+            # Write everything that is waiting with one flush
+            while len(batch) < 1000:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            for record in batch:
+                if record is not None:
+                    self._write(record)
+            self._file.flush()
+            if stop:
+                return
+
+    def _write(self, record):
+        t, level, source, fmt, args, suppressed = record
+        message = _format(fmt, args)
+        line = json.dumps({"t": round(t, 3), "lvl": LEVEL_NAMES[level], "src": source,
+                           "msg": message, "suppressed": suppressed}, ensure_ascii=False) + "\n"
+        size = len(line.encode("utf-8"))
+        if self._size + size > self.max_bytes and self._size > 0:
+            self._rotate()
+        self._file.write(line)
+        self._size += size
+        self.stats["written"] += 1
+        self.stats["bytes"] += size
+        if self.echo:
+            suffix = f" (+{suppressed} suppressed)" if suppressed else ""
+            try:
+                print(f"[{source}] {message}{suffix}")
+            except OSError:
+                self.echo = False  # Console went away; keep writing the file
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups, 0, -1):
+            older = f"{self.path}.{i - 1}" if i > 1 else self.path
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i}")
+        if self.backups == 0:
+            os.remove(self.path)
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._size = 0
+        self.stats["rotations"] += 1
+
+    def stop(self):
+        """Writes out everything still queued, then stops the writer thread."""
+        if self._thread is None:
+            return
+        self.records.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+
+# --- Module-level logger used by the flight code ---
+_log = None
+_limiter = RateLimiter()
+_level = _LEVELS[global_config.LOG_LEVEL]
+
+
+def start(path=global_config.LOG_FILE, echo=True):
+    global _log
+    _log = FlightLog(path, echo=echo)
+    _log.start()
+
+
+def stop():
+    global _log
+    if _log is not None:
+        _log.stop()
+        _log = None
+
+
+def reset():
+    """Clears the rate limiter (new simulated mission)."""
+    _limiter.reset()
+
+
+def get_stats():
+    return dict(_log.stats) if _log is not None else {}
+
+
+def log(level, source, fmt, *args):
+    if level < _level:
+        return
+    now = mission_clock.now()
+    if level >= ERROR:
+        suppressed = 0  # Every error is logged
+    else:
+        try:
+            suppressed = _limiter.allow((source, fmt, args), now)
+        except TypeError:  # Unhashable arguments: key on the text instead
+            suppressed = _limiter.allow((source, _format(fmt, args)), now)
+        if suppressed is None:
+            return
+    if _log is None:
+        suffix = f" (+{suppressed} suppressed)" if suppressed else ""
+        print(f"[{source}] {_format(fmt, args)}{suffix}")
+        return
+    _log.put((now, level, source, fmt, args, suppressed))
+
+
+def debug(source, fmt, *args):
+    log(DEBUG, source, fmt, *args)
+
+
+def info(source, fmt, *args):
+    log(INFO, source, fmt, *args)
+
+
+def warning(source, fmt, *args):
+    log(WARNING, source, fmt, *args)
+
+
+def error(source, fmt, *args):
+    log(ERROR, source, fmt, *args)
+
+
+def critical(source, fmt, *args):
+    log(CRITICAL, source, fmt, *args)
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import tempfile
+    import time
+
+    import main
+
+    directory = tempfile.mkdtemp()
+    n = 20000
+
+    # Control-thread cost per call: print() to a file vs. queueing a log record
+    with open(os.path.join(directory, "console.txt"), "w") as console, contextlib.redirect_stdout(console):
+        t0 = time.perf_counter()
+        for k in range(n):
+            print(f"[Mock HW] Setting heater heater_air to {'ON' if k % 2 else 'OFF'}")
+            console.flush()
+        print_cost = (time.perf_counter() - t0) / n
+
+    log_file = FlightLog(os.path.join(directory, "bench.jsonl"), queue_size=n + 1)
+    log_file.start()
+    _log, _limiter.count = log_file, n  # No rate limiting: measure the raw call
+    t0 = time.perf_counter()
+    for k in range(n):
+        info("Mock HW", "Setting heater %s to %s", "heater_air", "ON" if k % 2 else "OFF")
+    log_cost = (time.perf_counter() - t0) / n
+    stop()
+    reset()
+    _limiter.count = global_config.LOG_RATE_LIMIT_COUNT
+
+    # The common case in the loop: a repeated message over its rate limit
+    with contextlib.redirect_stdout(io.StringIO()):  # The first few still get printed
+        t0 = time.perf_counter()
+        for k in range(n):
+            info("Mock HW", "Setting heater %s to %s", "heater_air", "ON" if k % 2 else "OFF")
+    limited_cost = (time.perf_counter() - t0) / n
+    reset()
+
+    print(f"--- Flight log: {n} calls ---")
+    print(f"print() + flush  {print_cost * 1e6:7.2f} us/call (page cache only, no SD card or console)")
+    print(f"flight_log.info  {log_cost * 1e6:7.2f} us/call queued (format + write on the background thread)")
+    print(f"flight_log.info  {limited_cost * 1e6:7.2f} us/call rate-limited")
+
+    # Log volume for one full fast mission at flight task rates
+    import flight_log  # The instance the flight code uses, not this __main__ copy
+    mission_clock.set_clock(mission_clock.DiscreteEventClock())
+    duration = global_config.EXPERIMENT_DURATION_SEC + 600
+    path = os.path.join(directory, "mission.jsonl")
+    flight_log.start(path, echo=False)
+    t0 = time.perf_counter()
+    main.run_simulation_loop(mission_duration=duration)
+    elapsed = time.perf_counter() - t0
+    written = flight_log._log.stats["written"]
+    flight_log.stop()
+    files = sorted(f for f in os.listdir(directory) if f.startswith("mission.jsonl"))
+    total = sum(os.path.getsize(os.path.join(directory, f)) for f in files)
+    print(f"{duration / 86400:.1f}-day mission ({elapsed:.0f} s): {written} messages, "
+          f"{total / 1e3:.0f} kB in {len(files)} file(s), "
+          f"cap {global_config.LOG_MAX_BYTES * (global_config.LOG_BACKUPS + 1) / 1e6:.0f} MB")
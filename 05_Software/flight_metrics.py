@@ -0,0 +1,261 @@
+"""
+flight_metrics.py
+Always-on profiling counters for the flight loop, and a local scrape endpoint.
+
+main.run_simulation_loop reports into the module-level Metrics:
+- stage times per wakeup: health, mode (the handler), thermal, stored
+  commands, publish, and sleep (wall time between wakeups not spent in those stages),
+- per mode handler: calls, time, exceptions and the last error,
+- ticks and overruns: wakeups whose work took longer than MAIN_LOOP_DELAY.
+
+Each report is two perf_counter() calls and a few additions; times go
+into fixed-bucket histograms (sensor_acquisition.LatencyHistogram), so
+nothing grows with mission length and the counters can stay on in
+flight builds.
+
+Boot phases (interpreter start, imports, POST, initialize, the first
+health check, the mode the boot ends in) are kept separately with
+startup_phase(): once per process, so reset() between missions keeps them.
+
+snapshot() returns everything as a plain dict: the dashboard can read it
+in-process, and MetricsServer serves it as JSON on
+http://127.0.0.1:METRICS_PORT/metrics for out-of-process tools.
+"""
+
+import json
+import threading
+import time
+
+import global_config
+from sensor_acquisition import LatencyHistogram
+
+# Tick stages are well under a millisecond on a desktop, a few ms on the Pi
+STAGE_BUCKETS_MS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf"))
+STAGES = ("health", "mode", "thermal", "commands", "publish", "sleep")
+
+
+class StageTimer:
+    __slots__ = ("calls", "total", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.histogram = LatencyHistogram(STAGE_BUCKETS_MS)
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.histogram.add(seconds)
+
+    def as_dict(self):
+        h = self.histogram
+        return {"calls": self.calls, "total_s": self.total,
+                "mean_ms": self.total / self.calls * 1000.0 if self.calls else 0.0,
+                "p50_ms": h.percentile(50), "p99_ms": h.percentile(99), "max_ms": h.max_ms}
+
+
+class Metrics:
+    def __init__(self, overrun_sec=None):
+        self.overrun_sec = global_config.MAIN_LOOP_DELAY if overrun_sec is None else overrun_sec
+        self.reset()
+
+    def reset(self):
+        self.stages = {stage: StageTimer() for stage in STAGES}
+        self.handlers = {}     # mode -> StageTimer
+        self.exceptions = {}   # stage or mode -> count
+        self.last_error = {}   # stage or mode -> "ExceptionType: message"
+        self.ticks = 0
+        self.overruns = 0
+        self.worst_tick = 0.0
+        self.started = time.time()
+        self._work = 0.0       # Stage time spent in the current wakeup
+        self._tick_end = None  # perf_counter() at the end of the previous wakeup
+
+    def stage(self, stage, seconds):
+        self.stages[stage].add(seconds)
+        self._work += seconds
+
+    def handler(self, mode, seconds):
+        timer = self.handlers.get(mode)
+        if timer is None:
+            timer = self.handlers[mode] = StageTimer()
+        timer.add(seconds)
+        self.stage("mode", seconds)
+
+    def error(self, where, exc):
+        self.exceptions[where] = self.exceptions.get(where, 0) + 1
+        self.last_error[where] = f"{type(exc).__name__}: {exc}"
+
+    def end_tick(self, now=None):
+        """Closes one wakeup: counts it, checks for an overrun, and books the time since the last one as sleep."""
+        now = time.perf_counter() if now is None else now
+        work, self._work = self._work, 0.0
+        if self._tick_end is not None:
+            self.stages["sleep"].add(max(now - self._tick_end - work, 0.0))
+        self._tick_end = now
+        self.ticks += 1
+        self.worst_tick = max(self.worst_tick, work)
+        if work > self.overrun_sec:
+            self.overruns += 1
+
+    def snapshot(self):
+        # Read from other threads without a lock: copies first, values may be one tick apart
+        return {
+            "uptime_s": time.time() - self.started,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "overrun_threshold_s": self.overrun_sec,
+            "worst_tick_ms": self.worst_tick * 1000.0,
+            "stages": {stage: timer.as_dict() for stage, timer in list(self.stages.items())},
+            "handlers": {mode: timer.as_dict() for mode, timer in list(self.handlers.items())},
+            "exceptions": dict(self.exceptions),
+            "last_error": dict(self.last_error),
+        }
+
+
+# --- Module-level metrics used by main.py ---
+_metrics = Metrics()
+stage = _metrics.stage
+handler = _metrics.handler
+error = _metrics.error
+end_tick = _metrics.end_tick
+
+
+def reset():
+    _metrics.reset()
+
+
+def snapshot():
+    snap = _metrics.snapshot()
+    snap["startup_ms"] = {name: {"start": start, "duration": duration}
+                          for name, start, duration in startup_breakdown()}
+    return snap
+
+
+def print_report():
+    snap = snapshot()
+    print(f"[Metrics] {snap['ticks']} ticks, {snap['overruns']} overruns (> {snap['overrun_threshold_s']} s), "
+          f"worst {snap['worst_tick_ms']:.2f} ms")
+    print(f"{'stage':<24}{'calls':>10}{'mean (ms)':>12}{'p99 (ms)':>10}{'max (ms)':>10}{'errors':>8}")
+    rows = list(snap["stages"].items()) + [(f"  {mode}", s) for mode, s in snap["handlers"].items()]
+    for name, s in rows:
+        errors = snap["exceptions"].get(name.strip(), 0)
+        print(f"{name:<24}{s['calls']:>10}{s['mean_ms']:>12.3f}{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}{errors:>8}")
+    if snap["startup_ms"]:
+        print(f"{'startup phase':<24}{'start (ms)':>10}{'took (ms)':>12}")
+        for name, s in snap["startup_ms"].items():
+            print(f"{name:<24}{s['start']:>10.1f}{s['duration']:>12.2f}")
+
+
+# --- Startup Timing ---
+# phase -> (start, end) in perf_counter() seconds; the first occurrence wins
+_startup = {}
+
+
+def startup_phase(name, start, end=None):
+    """Records one boot phase. A phase with no end is an instant (e.g. the mode the boot ended in)."""
+    _startup.setdefault(name, (start, start if end is None else end))
+
+
+def startup_breakdown():
+    """[(phase, start_ms, duration_ms)] in start order, from the earliest recorded start."""
+    if not _startup:
+        return []
+    origin = min(start for start, _ in _startup.values())
+    return [(name, (start - origin) * 1000.0, (end - start) * 1000.0)
+            for name, (start, end) in sorted(_startup.items(), key=lambda item: item[1])]
+
+
+def startup_summary():
+    """One line for the flight log, e.g. "imports 140.2 ms, post 0.4 ms, SAFE_MODE at 151.0 ms"."""
+    return ", ".join(f"{name} at {start:.1f} ms" if duration == 0 else f"{name} {duration:.1f} ms"
+                     for name, start, duration in startup_breakdown())
+
+
+# --- Scrape Endpoint ---
+
+def _handler_class():
+    # http.server (and the email/http.client modules it pulls in) is a
+    # noticeable share of boot imports, so it is only loaded when serving
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = json.dumps(snapshot()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass  # Scrapes are not flight events
+
+    return Handler
+
+
+class MetricsServer:
+    """Serves snapshot() as JSON from a daemon thread."""
+
+    def __init__(self, host=global_config.TELEMETRY_HOST, port=global_config.METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        from http.server import ThreadingHTTPServer
+        self._server = ThreadingHTTPServer((self.host, self.port), _handler_class())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]  # In case port 0 was asked for
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics_server", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import urllib.request
+
+    import main
+    import mission_clock
+    import flight_metrics  # The instance the flight code uses, not this __main__ copy
+
+    # What one report costs in the flight thread
+    n = 200000
+    bench = Metrics()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        start = time.perf_counter()
+        bench.stage("health", time.perf_counter() - start)
+    report_cost = (time.perf_counter() - t0) / n
+
+    server = flight_metrics.MetricsServer(port=0)
+    server.start()
+    mission_clock.set_clock(mission_clock.DiscreteEventClock())
+    duration = 86400
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.run_simulation_loop(mission_duration=duration)
+    with urllib.request.urlopen(f"http://{server.host}:{server.port}/metrics") as response:
+        scraped = json.load(response)
+    server.stop()
+
+    snap = flight_metrics.snapshot()
+    stage_calls = sum(s["calls"] for name, s in snap["stages"].items() if name != "sleep")
+    tick_work = sum(s["total_s"] for name, s in snap["stages"].items() if name != "sleep")
+    print(f"--- Flight metrics: {duration / 86400:.0f}-day mission ---")
+    print(f"one stage report {report_cost * 1e6:.2f} us (incl. timing it); {stage_calls / snap['ticks']:.1f} per tick "
+          f"= {stage_calls * report_cost / tick_work * 100:.2f}% of measured tick work")
+    print(f"scraped /metrics: {len(json.dumps(scraped))} bytes, {scraped['ticks']} ticks")
+    flight_metrics.print_report()
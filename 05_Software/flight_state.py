@@ -0,0 +1,208 @@
+"""
+flight_state.py
+Fixed-schema, array-backed replacement for the system_state dict.
+
+The flight code still reads and writes it like the old dict:
+    system_state["battery_voltage"] = 3.8
+    system_state["payload_temps"]["air"] = 22.1
+but every field lives in one flat list at a fixed index. That gives us:
+- snapshot(): a cheap immutable copy (a single tuple copy), and
+- take_delta(): only the fields that changed since the last publish, and
+- mode_entries: how often each mode was entered, counted where
+  current_mode is written, so modes passed through within one tick
+  (STARTUP -> INITIALIZE -> SAFE_MODE at boot) are counted too.
+
+main.py publishes deltas to the GUI queue instead of a copy.deepcopy of
+the whole state every tick. The cost of a publish depends on how many
+fields changed, not on how many fields the state has, so adding
+humidity, soil moisture, CO2, etc. does not slow the loop down.
+"""
+
+# --- Schema ---
+# Nested payload temperatures are stored flat as "payload_temps.<name>".
+FIELDS = (
+    "current_mode",
+    "last_mode",
+    "boot_time",
+    "experiment_start_time",
+    "battery_voltage",
+    "pi_temp",
+    "payload_temps.air",
+    "payload_temps.substrate",
+    "payload_temps.water",
+    "soil_moisture",
+    "humidity",
+    "gnd_command_received",
+    "stale_sensors",
+    "mission_time",
+    "resume_mode",
+    "telemetry_file",
+    "downlink_time",
+    "downlink_sequence",
+)
+
+DEFAULTS = {
+    "current_mode": "STARTUP",
+    "last_mode": "",
+    "boot_time": 0.0,
+    "experiment_start_time": None,
+    "battery_voltage": 0.0,
+    "pi_temp": 0.0,
+    "payload_temps.air": 0.0,
+    "payload_temps.substrate": 0.0,
+    "payload_temps.water": 0.0,
+    "soil_moisture": 0.0,
+    "humidity": 0.0,
+    "gnd_command_received": None,
+    "stale_sensors": (),
+    "mission_time": 0.0,
+    "resume_mode": None,
+    "telemetry_file": None,       # main.py's --record ring, the raw telemetry a pass sends
+    "downlink_time": None,        # Time of the newest record already downlinked
+    "downlink_sequence": (0, 0),  # Next frame count (telemetry, housekeeping virtual channel)
+}
+
+
+class _Group:
+    """Dict-style view of one nested group, e.g. state["payload_temps"]."""
+    __slots__ = ("_state", "_keys")
+
+    def __init__(self, state, group):
+        self._state = state
+        prefix = group + "."
+        self._keys = {f[len(prefix):]: f for f in state._fields if f.startswith(prefix)}
+
+    def __getitem__(self, key):
+        return self._state[self._keys[key]]
+
+    def __setitem__(self, key, value):
+        self._state[self._keys[key]] = value
+
+    def keys(self):
+        return self._keys.keys()
+
+
+class Snapshot:
+    """Immutable, read-only copy of a FlightState at one instant."""
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    def __getitem__(self, key):
+        index = self._index.get(key)
+        if index is not None:
+            return self._values[index]
+        # Nested group, e.g. snap["payload_temps"]["air"]
+        prefix = key + "."
+        return {f[len(prefix):]: self._values[i] for f, i in self._index.items() if f.startswith(prefix)}
+
+    def as_dict(self):
+        return {f: self._values[i] for f, i in self._index.items()}
+
+
+class FlightState:
+    """
+    The satellite's state, one slot per schema field.
+    Writes that do not change a value are ignored, so the dirty set
+    only ever holds real changes.
+    """
+    __slots__ = ("_fields", "_index", "_values", "_dirty", "_groups", "_mode_index", "mode_entries")
+
+    def __init__(self, fields=FIELDS, **initial):
+        self._fields = tuple(fields)
+        self._index = {f: i for i, f in enumerate(self._fields)}
+        self._values = [DEFAULTS.get(f, 0.0) for f in self._fields]
+        self._dirty = set(range(len(self._fields)))  # Everything is new to a subscriber
+        groups = {f.split(".", 1)[0] for f in self._fields if "." in f}
+        self._groups = {g: _Group(self, g) for g in groups}
+        self._mode_index = self._index.get("current_mode")
+        self.mode_entries = {}  # mode -> times current_mode changed to it
+        for key, value in initial.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        index = self._index.get(key)
+        if index is None:
+            return self._groups[key]
+        return self._values[index]
+
+    def __setitem__(self, key, value):
+        index = self._index[key]
+        if self._values[index] != value:
+            self._values[index] = value
+            self._dirty.add(index)
+            if index == self._mode_index:
+                self.mode_entries[value] = self.mode_entries.get(value, 0) + 1
+
+    def __contains__(self, key):
+        return key in self._index or key in self._groups
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def snapshot(self):
+        return Snapshot(tuple(self._values), self._index)
+
+    def take_delta(self):
+        """Returns {field: value} for every field changed since the last call."""
+        if not self._dirty:
+            return {}
+        fields, values = self._fields, self._values
+        delta = {fields[i]: values[i] for i in self._dirty}
+        self._dirty.clear()
+        return delta
+
+    def apply_delta(self, delta):
+        """Applies a delta from take_delta() (used on the subscriber side)."""
+        for key, value in delta.items():
+            self[key] = value
+
+
+if __name__ == "__main__":
+    import copy
+    import time
+
+    def per_call_us(fn, n=20000):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - t0) / n * 1e6
+
+    print("--- Per-tick publish cost (5 sensor fields change per tick) ---")
+    print(f"{'fields':>8}{'deepcopy dict (us)':>22}{'delta publish (us)':>22}")
+    for extra in (0, 20, 100, 500):
+        extra_fields = tuple(f"extra_{i}" for i in range(extra))
+
+        old_state = {
+            "current_mode": "EXPERIMENT_MODE", "last_mode": "EXPERIMENT_MODE",
+            "boot_time": 0.0, "experiment_start_time": 0.0, "battery_voltage": 3.8,
+            "pi_temp": 40.0, "payload_temps": {"air": 22.0, "substrate": 21.0, "water": 20.0},
+            "soil_moisture": 0.0, "humidity": 0.0, "gnd_command_received": None,
+        }
+        old_state.update({f: 0.0 for f in extra_fields})
+        new_state = FlightState(FIELDS + extra_fields)
+        new_state.take_delta()
+
+        tick = [0]
+
+        def old_tick():
+            tick[0] += 1
+            old_state["battery_voltage"] = 3.8 + tick[0] * 1e-6
+            old_state["pi_temp"] = 40.0 + tick[0] * 1e-6
+            old_state["payload_temps"]["air"] = 22.0 + tick[0] * 1e-6
+            old_state["payload_temps"]["water"] = 20.0 + tick[0] * 1e-6
+            old_state["payload_temps"]["substrate"] = 21.0 + tick[0] * 1e-6
+            copy.deepcopy(old_state)
+
+        def new_tick():
+            tick[0] += 1
+            new_state["battery_voltage"] = 3.8 + tick[0] * 1e-6
+            new_state["pi_temp"] = 40.0 + tick[0] * 1e-6
+            new_state["payload_temps"]["air"] = 22.0 + tick[0] * 1e-6
+            new_state["payload_temps"]["water"] = 20.0 + tick[0] * 1e-6
+            new_state["payload_temps"]["substrate"] = 21.0 + tick[0] * 1e-6
+            new_state.take_delta()
+
+        print(f"{len(FIELDS) + extra:>8}{per_call_us(old_tick):>22.2f}{per_call_us(new_tick):>22.2f}")
@@ -8,6 +8,25 @@ through all the logic files.
 # --- System ---
 MAIN_LOOP_DELAY = 1.0  # seconds. The "heartbeat" of the main loop.
 
+# --- Task Rates (Ref: scheduler.py) ---
+# Modes that poll (SAFE_MODE commands, pre-heating) run every MAIN_LOOP_DELAY;
+# timer-driven work (images, LEDs, end of experiment) runs at its own deadlines.
+HEALTH_CHECK_PERIOD_SEC = 5.0      # Sensor reads + fault checks. Battery/thermal time constants are minutes.
+THERMAL_CONTROL_PERIOD_SEC = 10.0  # Payload thermostat. Chamber air time constant is ~60 s.
+
+# --- Sensor Acquisition (Ref: sensor_acquisition.py) ---
+# A sensor that has not answered within its deadline is reported stale
+# and keeps its last good value for that health check.
+SENSOR_DEADLINES_SEC = {
+    "battery_voltage": 0.05,
+    "pi_temp": 0.05,
+    "air_temp": 0.25,
+    "water_temp": 0.25,
+}
+
+# --- Actuators (Ref: actuators.py) ---
+ACTUATOR_REASSERT_SEC = 300.0  # Re-send an unchanged heater/LED state this often
+
 # --- Power Thresholds (Ref: EPS-2, EPS-3) ---
 LAST_RESORT_VOLTAGE = 3.3  # Volts. Below this, enter LAST_RESORT_MODE.
 SAFE_MODE_VOLTAGE = 3.5    # Volts. Below this, shed load and enter SAFE_MODE.
@@ -25,13 +44,99 @@ MIN_WATER_TEMP = 15.0  # °C
 # OBC Temp
 MAX_PI_TEMP = 80.0     # °C
 
+# --- Payload Thermal Control (Ref: thermal_control.py) ---
+THERMAL_CONTROLLER = "hysteresis"  # "hysteresis", "pid" or "mpc"
+THERMAL_MARGIN_C = 0.5             # Aim this far above the lower band limit
+THERMAL_HYSTERESIS_C = 1.0         # Hysteresis: OFF this far above the ON point
+THERMAL_MIN_DWELL_SEC = 30.0       # Shortest time between relay switches (survival limits excepted)
+THERMAL_PID_KP = 0.5               # Duty per °C of error
+THERMAL_PID_TI_SEC = 900.0         # Integral time
+THERMAL_PID_KD = 0.0               # Duty per °C/s (off: the sensor noise is larger than the signal)
+THERMAL_PWM_PERIOD_SEC = 30.0      # PID duty is applied as ON/OFF over this window (air time constant ~60 s)
+THERMAL_HORIZON_SEC = 600.0        # Receding-horizon look-ahead
+
 # --- CONOPS Timings (Ref: PAY-4) ---
 SATURATION_TIME_SEC = 30       # How long to run the pump
 LED_ON_TIME_SEC = 16 * 3600    # 16 hours
 LED_OFF_TIME_SEC = 8 * 3600    # 8 hours
-IMAGE_INTERVAL_SEC = 1 * 3600  # Take a picture every 1 hour
+IMAGE_INTERVAL_SEC = 5 * 60    # Take a picture every 5 minutes (fixed for the data budget)
 EXPERIMENT_DURATION_SEC = 14 * 24 * 3600 # 14 days
 
+# --- Power Draw (used by the simulation models) ---
+AIR_HEATER_POWER_W = 3.0    # Polyimide heater, payload air
+WATER_HEATER_POWER_W = 5.0  # Polyimide heater, water reservoir
+LED_POWER_W = 4.0           # Grow lights (electrical)
+LED_HEAT_FRACTION = 0.75    # Share of LED power that ends up as heat in the chamber
+PI_POWER_W = 2.5            # Raspberry Pi 3B+ (typical load)
+PUMP_POWER_W = 1.5          # Peristaltic water pump
+TRANSMITTER_POWER_W = 6.0   # UHF transmitter while keyed
+RECEIVER_POWER_W = 0.3      # UHF receiver, always listening once powered
+ADCS_POWER_W = 0.8          # Magnetorquers and sensors
+
+# --- EPS / Orbit (Ref: power_model.py) ---
+SOLAR_ARRAY_POWER_W = 20.0        # Array output in sunlight (deployed panels, sun-pointing)
+ORBIT_PERIOD_SEC = 92 * 60        # ~400 km LEO
+ORBIT_ECLIPSE_SEC = 35 * 60       # Eclipse at the start of each orbit
+ORBIT_EPOCH = 0.0                 # Mission time of an eclipse entry
+BATTERY_CAPACITY_WH = 40.0        # 1S4P Li-ion pack
+BATTERY_INITIAL_SOC = 0.8         # State of charge at deployment
+BATTERY_CHARGE_EFFICIENCY = 0.95  # Share of charging energy that is stored
+BATTERY_RESISTANCE_OHM = 0.05     # Pack internal resistance (IR drop under load)
+
+# --- Data Handling ---
+TELEMETRY_FILE = "telemetry.bin"       # Ring file for 1 Hz housekeeping records
+TELEMETRY_CAPACITY = 15 * 24 * 3600    # Records kept (15 days at 1 Hz, ~52 MB)
+TELEMETRY_FLUSH_INTERVAL = 60          # Records between flushes to the SD card
+LOG_FILE = "flight_log.jsonl"           # JSON-lines flight log (see flight_log.py)
+LOG_LEVEL = "INFO"                     # DEBUG, INFO, WARNING, ERROR or CRITICAL
+LOG_MAX_BYTES = 1_000_000              # Rotate the log file at this size
+LOG_BACKUPS = 4                        # Rotated files kept: at most 5 MB of logs in total
+LOG_QUEUE_SIZE = 10000                 # Messages that may wait for the log writer thread
+LOG_RATE_LIMIT_COUNT = 5               # Identical messages let through ...
+LOG_RATE_LIMIT_WINDOW_SEC = 60.0       # ... per this much mission time
+CHECKPOINT_FILE = "checkpoint.json"    # Warm-restart state (see checkpoint.py)
+CHECKPOINT_INTERVAL_SEC = 120.0        # Rewrite at least this often even if nothing important changed
+CHECKPOINT_MAX_AGE_SEC = 900.0         # Younger checkpoints resume without POST after a reset
+COMMAND_QUEUE_FILE = "command_queue.jsonl"  # Stored-command journal (see command_queue.py)
+COMMAND_QUEUE_CAPACITY = 10000         # Stored commands that may wait at once
+COMMAND_MAX_HORIZON_SEC = 30 * 24 * 3600  # Reject command times further out than this
+COMMAND_RETRY_SEC = 10.0               # Re-check a command's preconditions this often within its window
+IMAGE_DIR = "images"                   # Where captured images and their index go
+IMAGE_QUEUE_SIZE = 4                   # Capture requests that may wait for the camera worker
+IMAGE_LATE_SEC = 10.0                  # A capture that starts later than this is "late"
+THUMBNAIL_SCALE = 8                    # Thumbnail is 1/8 of the full frame per side
+IMAGE_STORE_CAPACITY = 8192            # Frames the image store index has room for (~2x a mission)
+IMAGE_TILE_SIZE = 32                   # Delta frames store changed 32x32 tiles (see image_store.py)
+IMAGE_KEYFRAME_INTERVAL = 48           # Stored frames between full keyframes
+IMAGE_TILE_THRESHOLD = 2.0             # Gray levels an 8x8 block mean must move for its tile to be stored
+IMAGE_DUPLICATE_THRESHOLD = 1.0        # Gray levels the frame signature must move to be stored at all
+
+# --- Housekeeping Beacon (Ref: housekeeping.py) ---
+HOUSEKEEPING_HISTORY = {0: 1440, 1: 336, 2: 256}  # Summary records kept: minutes (1 day), hours (14 days), orbits
+HOUSEKEEPING_BEACON_ORBITS = 2   # Orbit records sent with each pass summary
+DOWNLINK_RAW_TELEMETRY = False   # Also downlink the 1 Hz telemetry ring each pass (the beacon always goes)
+
+# --- Parameter Sweeps ---
+SWEEP_CACHE_DIR = "sweep_cache"  # sweep.py mission results, keyed by config + seed + source hash
+
+# --- Ground Display (Ref: history_buffer.py) ---
+HISTORY_RAW_POINTS = 3600      # Last hour at 1 Hz, every sample
+HISTORY_MINUTE_POINTS = 2880   # Last 2 days as per-minute min/max/mean
+HISTORY_HOUR_POINTS = 1440     # Last 60 days as per-hour min/max/mean
+
+# --- Camera ---
+CAMERA_WIDTH = 640
+CAMERA_HEIGHT = 480
+
+# --- Comms ---
+SPACECRAFT_ID = 0x2A           # 10-bit CCSDS spacecraft ID (placeholder until assigned)
+DOWNLINK_FRAME_SIZE = 256      # bytes per transfer frame, incl. sync marker and CRC
+DOWNLINK_BITRATE_BPS = 9600    # UHF downlink rate, for pass-time estimates
+TELEMETRY_HOST = "127.0.0.1"   # Local flight-state server for ground tools (telemetry_server.py)
+TELEMETRY_PORT = 5760
+TELEMETRY_SEND_BUFFER = 16384  # Per-subscriber socket buffer; slow readers get conflated beyond this
+METRICS_PORT = 5761            # Local JSON scrape endpoint for loop metrics (flight_metrics.py)
+
 # --- Hardware IDs (for hardware_drivers.py) ---
 # Sensor IDs
 AIR_TEMP_SENSOR = "temp_sensor_air"
@@ -5,6 +5,15 @@ state of the flight software simulation (main.py).
 
 It runs the simulation in a separate thread and displays
 the live data it receives on a "red/yellow/green" dashboard.
+
+Below the labels, rolling plots show battery voltage, Pi, air and
+water temperature and the mode history over the last hour, day or the
+whole mission. They are drawn from a history_buffer.MultiResolutionHistory,
+so memory stays constant and a 14-day plot redraws in milliseconds.
+
+With --connect HOST:PORT it runs no simulation of its own and instead
+subscribes to a flight process started with `main.py --serve`, so Tk
+redraws never compete with the flight code for the GIL.
 """
 
 import tkinter as tk
@@ -16,12 +25,34 @@ import time
 # Import the simulation loop and config from your existing files
 import main
 import global_config
+import flight_log
+import flight_state
+import history_buffer
+import image_pipeline
+import telemetry_server
+
+# (state field, plot title, unit) for each strip chart
+PLOTS = [
+    ("battery_voltage", "Battery", "V"),
+    ("pi_temp", "Pi", "°C"),
+    ("payload_temps.air", "Air", "°C"),
+    ("payload_temps.water", "Water", "°C"),
+]
+PLOT_SPANS = {"1 h": 3600, "1 day": 24 * 3600, "14 days": 14 * 24 * 3600}
+PLOT_REFRESH_SEC = 1.0  # Plots redraw at most this often (labels update every 100 ms)
+MODE_COLORS = {
+    "STARTUP": "#777777", "INITIALIZE": "#999999", "SAFE_MODE": "#E0C000",
+    "PRE_EXPERIMENT_HEATING": "#E08000", "WATER_SATURATION": "#4090FF",
+    "EXPERIMENT_MODE": "#00C060", "TRANSMIT_MODE": "#A060FF", "LAST_RESORT_MODE": "#FF3030",
+}
+
 
 class DashboardApp:
-    def __init__(self, root):
+    def __init__(self, root, server_address=None):
         self.root = root
+        self.server_address = server_address  # (host, port) of a telemetry server, or None
         self.root.title("Pathfinder Flight Software - SITL Dashboard")
-        self.root.geometry("600x450")
+        self.root.geometry("900x900")
         
         # Set up a professional-looking theme
         self.root.configure(bg="#2E2E2E")
@@ -31,17 +62,25 @@ class DashboardApp:
         self.bg_color = "#2E2E2E"
         self.frame_color = "#3E3E3E"
 
-        # This queue is used to pass the 'system_state' dict
+        # This queue is used to pass 'system_state' changes (deltas)
         # from the simulation thread to this GUI thread.
         self.data_queue = queue.Queue()
+        # Local copy of the flight state, rebuilt from the deltas
+        self.system_state = flight_state.FlightState()
+        # Fixed-size history behind the plots
+        self.history = history_buffer.MultiResolutionHistory([field for field, _, _ in PLOTS])
+        self._last_plot = 0.0
         
         # This event is used to tell the simulation thread to stop
         self.stop_event = threading.Event()
 
         self.create_widgets()
         
-        # Start the simulation in a new thread
-        self.start_simulation()
+        # Start the simulation in a new thread, or subscribe to a running one
+        if server_address:
+            self.start_subscription()
+        else:
+            self.start_simulation()
         
         # Start the GUI's own update loop
         self.update_gui()
@@ -114,9 +153,29 @@ class DashboardApp:
             # Store the canvas so we can change its color
             self.status_lights[name] = canvas
 
+        self.create_plots()
+
+    def create_plots(self):
+        """Strip charts for the PLOTS fields plus a mode-history band."""
+        plot_frame = tk.Frame(self.root, bg=self.frame_color, bd=2, relief=tk.GROOVE, padx=10, pady=5)
+        plot_frame.pack(fill="both", expand=True, padx=10, pady=5)
+
+        span_frame = tk.Frame(plot_frame, bg=self.frame_color)
+        span_frame.pack(anchor="w")
+        self.plot_span = tk.StringVar(value="1 h")
+        for label in PLOT_SPANS:
+            tk.Radiobutton(span_frame, text=label, variable=self.plot_span, value=label,
+                           command=self.draw_plots, font=self.primary_font, bg=self.frame_color,
+                           fg=self.label_color, selectcolor=self.bg_color).pack(side="left")
+
+        self.plot_canvas = tk.Canvas(plot_frame, height=400, bg="#1E1E1E", highlightthickness=0)
+        self.plot_canvas.pack(fill="both", expand=True)
+
     def start_simulation(self):
         """Starts the main.run_simulation_loop in a new daemon thread."""
-        print("[GUI] Starting simulation thread...")
+        flight_log.info("GUI", "Starting simulation thread...")
+        flight_log.start()
+        image_pipeline.start()
         self.sim_thread = threading.Thread(
             target=main.run_simulation_loop,
             args=(self.data_queue, self.stop_event),
@@ -124,14 +183,31 @@ class DashboardApp:
         )
         self.sim_thread.start()
 
+    def start_subscription(self):
+        """Feeds self.data_queue from a flight process's telemetry server."""
+        host, port = self.server_address
+        flight_log.info("GUI", "Subscribing to %s:%d...", host, port)
+        self.client = telemetry_server.TelemetryClient(host, port)
+        self.client.feed(self.data_queue, self.stop_event)
+
     def update_gui(self):
         """Periodically checks the queue for new data and updates the GUI."""
         try:
-            # Check for new data from the simulation thread
-            # Use a loop to clear the queue and get the *latest* state
+            # Check for new data from the simulation thread.
+            # Applying a delta is cheap, so drain the whole queue first
+            # and redraw only once with the *latest* state.
+            updated = False
+            state = self.system_state
             while not self.data_queue.empty():
-                system_state = self.data_queue.get_nowait()
-                self.process_system_state(system_state)
+                state.apply_delta(self.data_queue.get_nowait())
+                # Every sample goes into the history; only the newest is drawn
+                self.history.add(state["mission_time"], [state[field] for field, _, _ in PLOTS],
+                                 state["current_mode"])
+                updated = True
+            if updated:
+                self.process_system_state(state)
+                if time.monotonic() - self._last_plot >= PLOT_REFRESH_SEC:
+                    self.draw_plots()
 
         except queue.Empty:
             # No new data, that's fine
@@ -161,7 +237,7 @@ class DashboardApp:
         if state["current_mode"] == "EXPERIMENT_MODE":
              # This logic is from conops_modes.py
              if state["experiment_start_time"]:
-                time_since_start = time.time() - state["experiment_start_time"]
+                time_since_start = state["mission_time"] - state["experiment_start_time"]
                 day_cycle_time = time_since_start % (24 * 3600)
                 if day_cycle_time < (16 * 3600):
                     self.state_vars["LEDs"].set("ON")
@@ -214,6 +290,51 @@ class DashboardApp:
         else:
              self.set_status_light("water_temp", "green") # Not a concern
             
+    def draw_plots(self):
+        """Redraws every strip chart for the selected span from the history buffer."""
+        self._last_plot = time.monotonic()
+        canvas = self.plot_canvas
+        canvas.delete("plot")
+        t_end = self.history.latest_time
+        if t_end is None:
+            return
+        t_start = t_end - PLOT_SPANS[self.plot_span.get()]
+        width = max(canvas.winfo_width(), 200)
+        height = max(canvas.winfo_height(), 200)
+        left, right = 90, width - 10
+        mode_height = 16
+        strip = (height - mode_height - 10) / len(PLOTS)
+
+        def x_of(t):
+            return left + (t - t_start) / (t_end - t_start) * (right - left)
+
+        for k, (field, title, unit) in enumerate(PLOTS):
+            top = k * strip + 4
+            bottom = top + strip - 8
+            canvas.create_rectangle(left, top, right, bottom, outline="#555555", tags="plot")
+            t, y = self.history.query(field, t_start, t_end, max_points=int(right - left))
+            if len(t) < 2:
+                continue
+            low, high = float(y.min()), float(y.max())
+            if high - low < 1e-6:
+                low, high = low - 0.5, high + 0.5
+            canvas.create_text(left - 6, top, text=f"{high:.2f}", anchor="ne", fill=self.label_color, tags="plot")
+            canvas.create_text(left - 6, bottom, text=f"{low:.2f}", anchor="se", fill=self.label_color, tags="plot")
+            canvas.create_text(left - 6, (top + bottom) / 2, text=f"{title} ({unit})", anchor="e",
+                               fill=self.label_color, tags="plot")
+            xs = left + (t - t_start) / (t_end - t_start) * (right - left)
+            ys = bottom - (y - low) / (high - low) * (bottom - top)
+            coords = [c for point in zip(xs.tolist(), ys.tolist()) for c in point]
+            canvas.create_line(*coords, fill="#00C0FF", tags="plot")
+
+        # Mode history band along the bottom
+        top = height - mode_height - 4
+        for t0, t1, mode in self.history.modes(t_start, t_end):
+            canvas.create_rectangle(x_of(t0), top, max(x_of(t1), x_of(t0) + 1), top + mode_height,
+                                    fill=MODE_COLORS.get(mode, "grey"), width=0, tags="plot")
+        canvas.create_text(left - 6, top + mode_height / 2, text="Mode", anchor="e",
+                           fill=self.label_color, tags="plot")
+
     def set_status_light(self, name, color):
         """Changes the color of a specific status light."""
         canvas = self.status_lights.get(name)
@@ -222,10 +343,15 @@ class DashboardApp:
 
     def on_closing(self):
         """Called when the user clicks the 'X' button."""
-        print("[GUI] Closing application...")
+        flight_log.info("GUI", "Closing application...")
         
         # Signal the simulation thread to stop
         self.stop_event.set()
+        if self.server_address:
+            self.client.close()
+        else:
+            image_pipeline.stop(drain=False)
+            flight_log.stop()
         
         # Wait for the thread to finish (optional, but good practice)
         # self.sim_thread.join() 
@@ -234,6 +360,16 @@ class DashboardApp:
         self.root.destroy()
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Pathfinder SITL dashboard")
+    parser.add_argument("--connect", metavar="HOST:PORT",
+                        help="Subscribe to a flight process started with main.py --serve.")
+    args = parser.parse_args()
+    address = None
+    if args.connect:
+        host, _, port = args.connect.rpartition(":")
+        address = (host or global_config.TELEMETRY_HOST, int(port))
+
     root = tk.Tk()
-    app = DashboardApp(root)
+    app = DashboardApp(root, address)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,343 @@
+"""
+hal_trace.py
+Record-and-replay layer over hardware_drivers for deterministic regression runs.
+
+Recording wraps the hardware_drivers functions in place (the same way
+fleet_sim swaps them out) and logs, with the mission time of each call:
+- every sensor read and its result (voltage, temperatures, POST checks),
+- every check_for_gnd_command() result,
+- every actuator or power call and its arguments (heaters, LEDs, pump,
+  camera, comms), and
+- every mode transition, taken from run_simulation_loop's on_tick.
+
+The trace file is a small header, a string table, and four columns
+(time step in microseconds, kind, key, value), all zlib-compressed.
+Strings such as "set_heater:heater_air" or "ON" are stored once and
+referenced by index, and the regular loop ticks make the time column
+nearly free, so an event costs a little over its 8-byte value.
+
+Replay installs drivers that hand back the recorded read results (per
+sensor, in order) on a DiscreteEventClock, so the flight code runs as
+fast as the CPU allows and needs no physics or random numbers. Every
+actuator call and mode transition is compared with the recording and
+any difference (wrong value, wrong time, missing or extra call) is
+reported as a divergence. A recorded trace therefore works as a golden
+regression test:
+
+    python hal_trace.py record golden.trace        # once, on known-good code
+    python hal_trace.py replay golden.trace        # after every change; exit 1 on divergence
+"""
+
+import collections
+import contextlib
+import io
+import struct
+import time
+import zlib
+
+import numpy as np
+
+import global_config
+import hardware_drivers
+import mission_clock
+
+MAGIC = b"PFHAL001"
+HEADER = struct.Struct("<8sdII")  # magic, start time, string count, event count
+
+# Event kinds
+READ_NUMBER, READ_STRING, READ_BOOL, WRITE, MODE = range(5)
+_STRING_KINDS = (READ_STRING, WRITE, MODE)  # value is an index into the string table
+
+# hardware_drivers functions whose results are recorded and played back
+READS = ("read_voltage_sensor", "read_temp_sensor", "check_for_gnd_command",
+         "check_all_sensors", "check_memory")
+# hardware_drivers functions whose calls are recorded and checked on replay
+WRITES = ("set_heater", "set_leds", "run_pump", "capture_image",
+          "power_on_comms_receiver", "power_on_adcs_systems", "power_on_comms_transmitter",
+          "power_off_comms_transmitter", "downlink_data_buffer")
+
+
+def _key(name, args):
+    return name if not args else f"{name}:{':'.join(str(a) for a in args)}"
+
+
+def _write_value(name, args):
+    if name == "downlink_data_buffer":
+        frames = args[0] if args else ()
+        return f"{len(frames)} frames"  # Frame contents depend on the telemetry file
+    if name == "set_heater":
+        return str(args[1])
+    return ",".join(str(a) for a in args) if args else "called"
+
+
+def _write_key(name, args):
+    return f"set_heater:{args[0]}" if name == "set_heater" else name
+
+
+# --- Trace File ---
+
+class Trace:
+    """In-memory trace: a list of (time, kind, key, value) events."""
+
+    def __init__(self, start_time=0.0, events=None):
+        self.start_time = start_time
+        self.events = events if events is not None else []
+
+    def save(self, path):
+        strings, index = [], {}
+
+        def intern(text):
+            if text not in index:
+                index[text] = len(strings)
+                strings.append(text)
+            return index[text]
+
+        n = len(self.events)
+        times = np.fromiter((e[0] for e in self.events), np.float64, n)
+        kinds = np.fromiter((e[1] for e in self.events), np.uint8, n)
+        keys = np.fromiter((intern(e[2]) for e in self.events), np.uint16, n)
+        values = np.fromiter((intern(v) if k in _STRING_KINDS else float(v) for _, k, _, v in self.events),
+                             np.float64, n)
+        # Column by column, time as microsecond steps: ticks are regular, so this compresses well
+        steps = np.diff(np.round((times - self.start_time) * 1e6).astype(np.int64), prepend=0)
+        table = b"".join(struct.pack("<H", len(s.encode())) + s.encode() for s in strings)
+        raw = (HEADER.pack(MAGIC, self.start_time, len(strings), n) + table
+               + steps.tobytes() + kinds.tobytes() + keys.tobytes() + values.tobytes())
+        data = zlib.compress(raw, 9)
+        with open(path, "wb") as f:
+            f.write(data)
+        return len(data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            raw = zlib.decompress(f.read())
+        magic, start_time, n_strings, n = HEADER.unpack_from(raw, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a HAL trace")
+        offset = HEADER.size
+        strings = []
+        for _ in range(n_strings):
+            (length,) = struct.unpack_from("<H", raw, offset)
+            strings.append(raw[offset + 2:offset + 2 + length].decode())
+            offset += 2 + length
+        columns = []
+        for dtype in (np.int64, np.uint8, np.uint16, np.float64):
+            columns.append(np.frombuffer(raw, dtype, n, offset))
+            offset += n * np.dtype(dtype).itemsize
+        steps, kinds, keys, values = columns
+        times = (start_time + np.cumsum(steps) / 1e6).tolist()
+        events = []
+        for t, kind, key, value in zip(times, kinds.tolist(), keys.tolist(), values.tolist()):
+            if kind in _STRING_KINDS:
+                value = strings[int(value)]
+            elif kind == READ_BOOL:
+                value = bool(value)
+            events.append((t, kind, strings[key], value))
+        return cls(start_time, events)
+
+
+# --- Recording ---
+
+class TraceRecorder:
+    """Wraps hardware_drivers so every call lands in self.trace. Use as a context manager."""
+
+    def __init__(self):
+        self.trace = Trace(mission_clock.now())
+        self._saved = {}
+        self._last_mode = None
+
+    def _wrap_read(self, name, fn):
+        def read(*args):
+            value = fn(*args)
+            kind = READ_BOOL if isinstance(value, bool) else READ_STRING if isinstance(value, str) else READ_NUMBER
+            self.trace.events.append((mission_clock.now(), kind, _key(name, args), value))
+            return value
+        return read
+
+    def _wrap_write(self, name, fn):
+        def write(*args, **kwargs):
+            args = args + tuple(kwargs.values())
+            self.trace.events.append((mission_clock.now(), WRITE, _write_key(name, args), _write_value(name, args)))
+            return fn(*args)
+        return write
+
+    def on_tick(self, system_state):
+        mode = system_state["current_mode"]
+        if mode != self._last_mode:
+            self.trace.events.append((mission_clock.now(), MODE, "mode", mode))
+            self._last_mode = mode
+
+    def __enter__(self):
+        self.trace.start_time = mission_clock.now()
+        for name in READS + WRITES:
+            fn = getattr(hardware_drivers, name)
+            self._saved[name] = fn
+            setattr(hardware_drivers, name, (self._wrap_read if name in READS else self._wrap_write)(name, fn))
+        return self
+
+    def __exit__(self, *exc):
+        for name, fn in self._saved.items():
+            setattr(hardware_drivers, name, fn)
+        self._saved.clear()
+
+
+# --- Replay ---
+
+class Divergence:
+    __slots__ = ("time", "key", "expected", "actual")
+
+    def __init__(self, time, key, expected, actual):
+        self.time, self.key, self.expected, self.actual = time, key, expected, actual
+
+    def __repr__(self):
+        return f"t={self.time:.1f} {self.key}: expected {self.expected!r}, got {self.actual!r}"
+
+
+class TraceReplayer:
+    """Drivers that play a Trace back and check the flight code's outputs against it."""
+
+    def __init__(self, trace, max_divergences=100):
+        self.trace = trace
+        self.max_divergences = max_divergences
+        self.divergences = []
+        self.reads = collections.defaultdict(collections.deque)
+        self.writes = collections.defaultdict(collections.deque)
+        self.modes = collections.deque()
+        for t, kind, key, value in trace.events:
+            if kind == WRITE:
+                self.writes[key].append((t, value))
+            elif kind == MODE:
+                self.modes.append((t, value))
+            else:
+                self.reads[key].append((t, value))
+        self._saved = {}
+        self._last_mode = None
+
+    def _diverge(self, key, expected, actual):
+        if len(self.divergences) < self.max_divergences:
+            self.divergences.append(Divergence(mission_clock.now(), key, expected, actual))
+
+    def _check(self, queue, key, actual):
+        now = mission_clock.now()
+        if not queue:
+            self._diverge(key, "no call", (now, actual))
+            return None
+        t, expected = queue.popleft()
+        if expected != actual or abs(t - now) > 1e-6:
+            self._diverge(key, (t, expected), (now, actual))
+        return expected
+
+    def _replay_read(self, name):
+        def read(*args):
+            key = _key(name, args)
+            queue = self.reads[key]
+            if not queue:
+                self._diverge(key, "no recorded read", "read")
+                raise RuntimeError(f"trace has no more {key} reads")
+            t, value = queue.popleft()
+            if abs(t - mission_clock.now()) > 1e-6:
+                self._diverge(key, f"read at {t:.1f}", f"read at {mission_clock.now():.1f}")
+            return value
+        return read
+
+    def _replay_write(self, name):
+        def write(*args, **kwargs):
+            args = args + tuple(kwargs.values())
+            key = _write_key(name, args)
+            self._check(self.writes[key], key, _write_value(name, args))
+        return write
+
+    def on_tick(self, system_state):
+        mode = system_state["current_mode"]
+        if mode != self._last_mode:
+            self._check(self.modes, "mode", mode)
+            self._last_mode = mode
+
+    def finish(self):
+        """Anything recorded but never called is a divergence too."""
+        for key, queue in list(self.writes.items()) + [("mode", self.modes)]:
+            for t, expected in queue:
+                self._diverge(key, (t, expected), "never called")
+        return self.divergences
+
+    def __enter__(self):
+        for name in READS + WRITES:
+            self._saved[name] = getattr(hardware_drivers, name)
+            setattr(hardware_drivers, name, (self._replay_read if name in READS else self._replay_write)(name))
+        return self
+
+    def __exit__(self, *exc):
+        for name, fn in self._saved.items():
+            setattr(hardware_drivers, name, fn)
+        self._saved.clear()
+
+
+# --- Runs ---
+
+@contextlib.contextmanager
+def _simulation(start_time):
+    """Fresh simulated hardware, module timers and a DiscreteEventClock at start_time."""
+    import conops_modes
+    import sensor_acquisition
+    saved_clock = mission_clock.get_clock()
+    mission_clock.set_clock(mission_clock.DiscreteEventClock(start_time=start_time))
+    conops_modes.reset_timers()
+    sensor_acquisition.set_concurrent(False)  # No wall-clock deadlines: runs must be repeatable
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        sensor_acquisition.set_concurrent(True)
+        mission_clock.set_clock(saved_clock)
+
+
+def record_mission(path, duration, seed=0, start_time=1.0e9):
+    """Runs one simulated mission, saves its trace to `path` and returns the Trace."""
+    import main
+    hardware_drivers.reset_simulation(seed=seed)
+    with _simulation(start_time), TraceRecorder() as recorder:
+        main.run_simulation_loop(mission_duration=duration, on_tick=recorder.on_tick)
+    recorder.trace.save(path)
+    return recorder.trace
+
+
+def replay_mission(path, duration=None):
+    """
+    Replays a recorded trace through run_simulation_loop.
+    Returns (divergences, trace). duration defaults to the recorded span.
+    """
+    import main
+    trace = Trace.load(path)
+    if duration is None:
+        duration = max((t for t, _, _, _ in trace.events), default=trace.start_time) - trace.start_time + 1e-3
+    with _simulation(trace.start_time), TraceReplayer(trace) as replayer:
+        main.run_simulation_loop(mission_duration=duration, on_tick=replayer.on_tick)
+    return replayer.finish(), trace
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Record or replay a HAL golden trace")
+    parser.add_argument("command", choices=("record", "replay"))
+    parser.add_argument("path")
+    parser.add_argument("--duration", type=float, default=global_config.EXPERIMENT_DURATION_SEC + 600,
+                        help="Mission seconds to record (default: one full experiment).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.command == "record":
+        trace = record_mission(args.path, args.duration, args.seed)
+        import os
+        print(f"[Trace] Recorded {len(trace.events):,} events over {args.duration / 86400:.1f} days "
+              f"in {time.perf_counter() - t0:.1f} s -> {args.path} ({os.path.getsize(args.path) / 1e3:.0f} kB)")
+    else:
+        divergences, trace = replay_mission(args.path)
+        print(f"[Trace] Replayed {len(trace.events):,} events in {time.perf_counter() - t0:.1f} s: "
+              f"{len(divergences)} divergence(s)")
+        for divergence in divergences[:20]:
+            print(f"  {divergence}")
+        sys.exit(1 if divergences else 0)
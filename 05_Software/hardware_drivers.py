@@ -3,7 +3,13 @@ hardware_drivers.py
 This is the "Hardware Abstraction Layer" (HAL).
 """
 import random
+import threading
+import numpy as np
+import flight_log
 import global_config
+import mission_clock
+import power_model
+import thermal_model
 
 # --- INTERNAL SIMULATION STATE ---
 # These variables simulate the physical reality of the satellite
@@ -11,83 +17,160 @@ _heater_states = {
     global_config.AIR_HEATER: "OFF", 
     global_config.WATER_HEATER: "OFF"
 }
-_mock_water_temp = 12.0  # Start cold
+_thermal = thermal_model.ThermalModel()  # Water starts cold (12°C)
+_SENSOR_NODES = {
+    global_config.AIR_TEMP_SENSOR: thermal_model.AIR,
+    global_config.WATER_TEMP_SENSOR: thermal_model.WATER,
+    global_config.SUBSTRATE_TEMP_SENSOR: thermal_model.SUBSTRATE,
+    global_config.PI_TEMP_SENSOR: thermal_model.PI,
+}
+_led_state = "OFF"
+_images_captured = 0
+_camera_background = None
+_power = power_model.PowerModel()  # Battery and per-load energy ledger
+_rng = random.Random()   # Sensor noise. Re-seeded per simulated mission.
+_thermal_lock = threading.Lock()  # Sensors may be read from several threads at once (guards both models)
+
+def reset_simulation(seed=None, water_temp=12.0):
+    """
+    Puts the simulated hardware back to its power-on state so a new
+    mission can run in the same process (used by monte_carlo.py).
+    """
+    global _thermal, _power, _images_captured, _led_state
+    _heater_states[global_config.AIR_HEATER] = "OFF"
+    _heater_states[global_config.WATER_HEATER] = "OFF"
+    temps = thermal_model.INITIAL_TEMPS.copy()
+    temps[thermal_model.WATER] = water_temp
+    _thermal = thermal_model.ThermalModel(temps)
+    _power = power_model.PowerModel()
+    _led_state = "OFF"
+    _images_captured = 0
+    _rng.seed(seed)
+
+def get_heater_state(heater_id):
+    return _heater_states[heater_id]
+
+def get_led_state():
+    return _led_state
+
+def get_image_count():
+    return _images_captured
+
+def get_energy_report():
+    """Energy per load, solar in and battery state so far (see power_model.PowerModel.accounting)."""
+    with _thermal_lock:
+        _power.advance_to(mission_clock.now())
+        return _power.accounting()
+
+def _switch_load(load, on):
+    with _thermal_lock:
+        _power.set_load(load, on, mission_clock.now())
 
 # --- Self-Test Functions ---
 def check_all_sensors():
-    print("[Mock HW] Checking all sensors... OK.")
+    flight_log.info("Mock HW", "Checking all sensors... OK.")
     return True
 
 def check_memory():
-    print("[Mock HW] Checking memory... OK.")
+    flight_log.info("Mock HW", "Checking memory... OK.")
     return True
 
 # --- Power/System Functions ---
 def power_on_comms_receiver():
-    print("[Mock HW] Comms receiver powered ON.")
+    _switch_load(power_model.RECEIVER, True)
+    flight_log.info("Mock HW", "Comms receiver powered ON.")
 
 def power_on_adcs_systems():
-    print("[Mock HW] ADCS systems powered ON.")
+    _switch_load(power_model.ADCS, True)
+    flight_log.info("Mock HW", "ADCS systems powered ON.")
 
 def power_on_comms_transmitter():
-    print("[Mock HW] Comms transmitter (high power) powered ON.")
+    # The transmitter only draws its full power while keyed (downlink_data_buffer)
+    flight_log.info("Mock HW", "Comms transmitter (high power) powered ON.")
     
 def power_off_comms_transmitter():
-    print("[Mock HW] Comms transmitter powered OFF.")
-
-def power_off_all_non_essential():
-    print("[Mock HW] CRITICAL: Powering off all non-essential systems.")
-    set_heater(global_config.AIR_HEATER, "OFF")
-    set_heater(global_config.WATER_HEATER, "OFF")
-    set_leds("OFF")
+    flight_log.info("Mock HW", "Comms transmitter powered OFF.")
 
 # --- Sensor Read Functions ---
 def read_voltage_sensor():
-    return 3.8 + random.uniform(-0.1, 0.1) 
+    # Bus voltage from the battery model: state of charge and present load
+    with _thermal_lock:
+        _power.advance_to(mission_clock.now())
+        voltage = _power.voltage()
+    return voltage + _rng.uniform(-0.01, 0.01)
 
 def read_temp_sensor(sensor_id):
-    # Simulate Real Physics!
-    
-    # 1. Handle Water Temp (Dynamic)
-    if sensor_id == global_config.WATER_TEMP_SENSOR:
-        global _mock_water_temp
-        
-        # If heater is ON, temperature rises
-        if _heater_states[global_config.WATER_HEATER] == "ON":
-            _mock_water_temp += 0.5  # Heat up by 0.5 deg per second
-            
-        # If heater is OFF, it slowly cools down (simplified)
-        else:
-            if _mock_water_temp > 12.0:
-                _mock_water_temp -= 0.1
-                
-        return _mock_water_temp
-
-    # 2. Handle Air Temp (Random fluctuation)
-    else:
-        return 22.0 + random.uniform(-0.5, 0.5)
+    # Temperatures come from the thermal network model. Reading only
+    # brings the model up to the current mission time; it never moves
+    # the physics by itself.
+    node = _SENSOR_NODES[sensor_id]
+    with _thermal_lock:
+        _thermal.advance_to(mission_clock.now())
+        temperature = _thermal.temperature(node)
+    return temperature + _rng.uniform(-0.1, 0.1)
 
 # --- Actuator Control Functions ---
 def set_heater(heater_id, status):
     # Update our internal state so the sensor knows to heat up
     global _heater_states
     _heater_states[heater_id] = status
-    print(f"[Mock HW] Setting heater {heater_id} to {status}")
+    # Apply the old heat input up to now, then switch
+    with _thermal_lock:
+        _thermal.advance_to(mission_clock.now())
+        if heater_id == global_config.AIR_HEATER:
+            _thermal.air_heater_on = (status == "ON")
+        elif heater_id == global_config.WATER_HEATER:
+            _thermal.water_heater_on = (status == "ON")
+        load = power_model.AIR_HEATER if heater_id == global_config.AIR_HEATER else power_model.WATER_HEATER
+        _power.set_load(load, status == "ON", mission_clock.now())
+    flight_log.info("Mock HW", "Setting heater %s to %s", heater_id, status)
 
 def set_leds(status):
-    print(f"[Mock HW] Setting LEDs to {status}")
+    global _led_state
+    _led_state = status
+    with _thermal_lock:
+        _thermal.advance_to(mission_clock.now())
+        _thermal.leds_on = (status == "ON")
+        _power.set_load(power_model.LEDS, status == "ON", mission_clock.now())
+    flight_log.info("Mock HW", "Setting LEDs to %s", status)
 
 def run_pump(duration_sec):
-    print(f"[Mock HW] Running pump for {duration_sec} seconds...")
+    with _thermal_lock:
+        _power.run_for(power_model.PUMP, duration_sec, mission_clock.now())
+    flight_log.info("Mock HW", "Running pump for %s seconds...", duration_sec)
     # We do NOT sleep here, or the GUI would freeze!
     
 def capture_image():
-    print(f"[Mock HW] Triggering camera. Saving image to disk.")
+    global _images_captured
+    _images_captured += 1
+    flight_log.info("Mock HW", "Triggering camera. Saving image to disk.")
+
+def read_camera_frame():
+    """
+    Reads out the last triggered frame as a grayscale uint8 array
+    (CAMERA_HEIGHT x CAMERA_WIDTH). Mock: a fixed chamber background with
+    a "plant" that grows a little with every image, plus sensor noise.
+    """
+    global _camera_background
+    h, w = global_config.CAMERA_HEIGHT, global_config.CAMERA_WIDTH
+    if _camera_background is None:
+        y, x = np.mgrid[0:h, 0:w]
+        _camera_background = (60 + 40 * x / w + 20 * y / h).astype(np.int16)
+        _camera_background.flags.writeable = False
+
+    y, x = np.ogrid[0:h, 0:w]
+    radius = min(h, w) * (0.05 + 0.3 * min(_images_captured, 4000) / 4000)
+    plant = ((x - w / 2) ** 2 + (y - h * 0.7) ** 2) < radius ** 2
+    noise = np.random.default_rng(_rng.getrandbits(32)).integers(-2, 3, (h, w), dtype=np.int16)
+    return np.clip(_camera_background + 120 * plant + noise, 0, 255).astype(np.uint8)
     
 # --- Comms Functions ---
 def check_for_gnd_command():
     # Force the start command for testing
     return "START_EXPERIMENT" 
 
-def downlink_data_buffer():
-    print(f"[Mock HW] Beginning data downlink... [||||||||||] Complete.")
\ No newline at end of file
+def downlink_data_buffer(frames=()):
+    n_bytes = sum(len(frame) for frame in frames)
+    with _thermal_lock:
+        _power.run_for(power_model.TRANSMITTER, n_bytes * 8 / global_config.DOWNLINK_BITRATE_BPS, mission_clock.now())
+    flight_log.info("Mock HW", "Beginning data downlink of %d frames (%d B)... [||||||||||] Complete.", len(frames), n_bytes)
\ No newline at end of file
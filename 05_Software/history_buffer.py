@@ -0,0 +1,236 @@
+"""
+history_buffer.py
+Fixed-size, multi-resolution time-series history for the dashboard plots.
+
+Every sample goes into three ring buffers of fixed length:
+- raw:    the last HISTORY_RAW_POINTS samples as received,
+- minute: min / max / mean of each minute, HISTORY_MINUTE_POINTS minutes,
+- hour:   min / max / mean of each hour, HISTORY_HOUR_POINTS hours.
+Memory is therefore the same after one hour or after the full 14 days.
+
+query(channel, t_start, t_end, max_points) uses the finest tier that
+still covers t_start and thins it down to at most max_points points
+(about one per pixel):
+- raw samples with LTTB (Largest-Triangle-Three-Buckets), which keeps
+  the visually important points such as spikes and heater edges,
+- minute/hour buckets with min/max per pixel column, so a voltage sag
+  inside a bucket still shows up as a dip. The minute or hour still
+  being filled is included, so the newest samples show on every tier.
+
+Mode history is stored separately as a bounded list of mode changes.
+"""
+
+import collections
+
+import numpy as np
+
+import global_config
+
+MINUTE = 60.0
+HOUR = 3600.0
+
+
+# --- Decimation ---
+
+def lttb(t, y, n_out):
+    """Largest-Triangle-Three-Buckets: picks n_out of the (t, y) points that keep the shape."""
+    n = len(t)
+    if n_out >= n or n_out < 3:
+        return t, y
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    edges = np.maximum(edges, np.arange(1, n_out))  # Every bucket holds at least one point
+    # The third corner of each triangle is the average of the *next* bucket
+    next_edges = np.append(edges[1:], n)
+    sums_t, sums_y = np.add.reduceat(t, next_edges[:-1]), np.add.reduceat(y, next_edges[:-1])
+    widths = np.diff(next_edges)
+    avg_t = np.append(sums_t[:len(widths)] / widths, t[-1]).tolist()
+    avg_y = np.append(sums_y[:len(widths)] / widths, y[-1]).tolist()
+
+    # The chosen point of one bucket feeds the next, so this part is a plain loop
+    tl, yl, bounds = t.tolist(), y.tolist(), edges.tolist()
+    keep = [0]
+    a = 0
+    for i in range(n_out - 2):
+        ta, ya, ct, cy = tl[a], yl[a], avg_t[i], avg_y[i]
+        best, best_area = bounds[i], -1.0
+        for j in range(bounds[i], bounds[i + 1]):
+            area = abs((ta - ct) * (yl[j] - ya) - (ta - tl[j]) * (cy - ya))
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+        a = best
+    keep.append(n - 1)
+    return t[keep], y[keep]
+
+
+def min_max_per_column(t, lows, highs, n_columns):
+    """Splits the span into n_columns and keeps each column's min and max (in time order)."""
+    n = len(t)
+    if n <= n_columns:
+        out_t = np.repeat(t, 2)
+        out_y = np.column_stack((lows, highs)).ravel()
+        return out_t, out_y
+    starts = np.linspace(0, n, n_columns + 1).astype(np.int64)[:-1]
+    col_min = np.minimum.reduceat(lows, starts)
+    col_max = np.maximum.reduceat(highs, starts)
+    col_t = t[starts]
+    return np.repeat(col_t, 2), np.column_stack((col_min, col_max)).ravel()
+
+
+# --- Buffers ---
+
+class _Ring:
+    """Fixed-capacity ring of (time, min, max, mean) rows per channel."""
+
+    def __init__(self, capacity, n_channels):
+        self.capacity = capacity
+        self.t = np.zeros(capacity)
+        self.low = np.zeros((capacity, n_channels), dtype=np.float32)
+        self.high = np.zeros((capacity, n_channels), dtype=np.float32)
+        self.mean = np.zeros((capacity, n_channels), dtype=np.float32)
+        self.count = 0
+
+    def append(self, t, low, high, mean):
+        i = self.count % self.capacity
+        self.t[i], self.low[i], self.high[i], self.mean[i] = t, low, high, mean
+        self.count += 1
+
+    def oldest(self):
+        if not self.count:
+            return float("inf")
+        return self.t[self.count % self.capacity] if self.count > self.capacity else self.t[0]
+
+    def ordered(self, column, channel):
+        """(t, values) oldest first."""
+        n = min(self.count, self.capacity)
+        data = getattr(self, column)[:, channel]
+        if self.count <= self.capacity:
+            return self.t[:n], data[:n]
+        head = self.count % self.capacity
+        return np.concatenate((self.t[head:], self.t[:head])), np.concatenate((data[head:], data[:head]))
+
+
+class _Bucket:
+    """Running min/max/sum for the minute or hour being filled."""
+
+    def __init__(self, width, n_channels):
+        self.width = width
+        self.index = None
+        self.low = np.full(n_channels, np.inf)
+        self.high = np.full(n_channels, -np.inf)
+        self.total = np.zeros(n_channels)
+        self.n = 0
+
+    def add(self, t, values, ring):
+        index = int(t // self.width)
+        if index != self.index:
+            if self.n:
+                ring.append(self.index * self.width, self.low, self.high, self.total / self.n)
+            self.index = index
+            self.low.fill(np.inf)
+            self.high.fill(-np.inf)
+            self.total.fill(0.0)
+            self.n = 0
+        np.minimum(self.low, values, out=self.low)
+        np.maximum(self.high, values, out=self.high)
+        self.total += values
+        self.n += 1
+
+    def start(self):
+        return self.index * self.width
+
+
+class MultiResolutionHistory:
+    def __init__(self, channels, raw_points=None, minute_points=None, hour_points=None,
+                 max_mode_changes=4096):
+        self.channels = list(channels)
+        self._index = {name: i for i, name in enumerate(self.channels)}
+        n = len(self.channels)
+        self.raw = _Ring(raw_points or global_config.HISTORY_RAW_POINTS, n)
+        self.minutes = _Ring(minute_points or global_config.HISTORY_MINUTE_POINTS, n)
+        self.hours = _Ring(hour_points or global_config.HISTORY_HOUR_POINTS, n)
+        self._minute = _Bucket(MINUTE, n)
+        self._hour = _Bucket(HOUR, n)
+        self.mode_changes = collections.deque(maxlen=max_mode_changes)  # (time, mode)
+        self.latest_time = None
+
+    def add(self, t, values, mode=None):
+        """Adds one sample; `values` is a sequence in channel order."""
+        values = np.asarray(values, dtype=np.float64)
+        self.raw.append(t, values, values, values)
+        self._minute.add(t, values, self.minutes)
+        self._hour.add(t, values, self.hours)
+        if mode is not None and (not self.mode_changes or self.mode_changes[-1][1] != mode):
+            self.mode_changes.append((t, mode))
+        self.latest_time = t
+
+    def query(self, channel, t_start, t_end, max_points=600):
+        """(t, y) arrays for `channel` within [t_start, t_end], at most about max_points long."""
+        c = self._index[channel]
+        slack = 0.02 * (t_end - t_start)  # A tier missing a sliver at the left edge is still fine
+        for ring, exact in ((self.raw, True), (self.minutes, False), (self.hours, False)):
+            if ring.oldest() <= t_start + slack or ring is self.hours:
+                break
+        if exact:
+            t, y = ring.ordered("mean", c)
+            lo, hi = np.searchsorted(t, t_start), np.searchsorted(t, t_end, side="right")
+            return lttb(t[lo:hi], y[lo:hi], max_points)
+        t, low = ring.ordered("low", c)
+        _, high = ring.ordered("high", c)
+        lo, hi = np.searchsorted(t, t_start), np.searchsorted(t, t_end, side="right")
+        t, low, high = t[lo:hi], low[lo:hi], high[lo:hi]
+        bucket = self._minute if ring is self.minutes else self._hour
+        if bucket.n and bucket.start() <= t_end and self.latest_time >= t_start:
+            # The open bucket holds everything since the last closed one
+            t = np.append(t, bucket.start())
+            low, high = np.append(low, bucket.low[c]), np.append(high, bucket.high[c])
+        return min_max_per_column(t, low, high, max(max_points // 2, 1))
+
+    def modes(self, t_start, t_end):
+        """[(t0, t1, mode)] spans overlapping [t_start, t_end]."""
+        spans = []
+        changes = list(self.mode_changes)
+        for i, (t, mode) in enumerate(changes):
+            t_next = changes[i + 1][0] if i + 1 < len(changes) else t_end
+            if t_next > t_start and t < t_end:
+                spans.append((max(t, t_start), min(t_next, t_end), mode))
+        return spans
+
+    def nbytes(self):
+        rings = (self.raw, self.minutes, self.hours)
+        return sum(r.t.nbytes + r.low.nbytes + r.high.nbytes + r.mean.nbytes for r in rings)
+
+
+if __name__ == "__main__":
+    import time
+
+    # 14 days of 1 Hz housekeeping: voltage with orbit sag, air temp with heater cycling
+    n = 14 * 24 * 3600
+    rng = np.random.default_rng(0)
+    t = 1.0e9 + np.arange(n, dtype=np.float64)
+    voltage = 3.8 + 0.05 * np.sin(2 * np.pi * t / 5400) + rng.normal(0, 0.003, n)
+    voltage[n // 2:n // 2 + 120] -= 0.3  # A two-minute sag a week ago
+    air = 22.0 + 1.5 * np.sign(np.sin(2 * np.pi * t / 600)) + rng.normal(0, 0.05, n)
+
+    history = MultiResolutionHistory(["battery_voltage", "air_temp"])
+    t0 = time.perf_counter()
+    for k in range(n):
+        history.add(t[k], (voltage[k], air[k]), "EXPERIMENT_MODE" if k % 86400 < 80000 else "SAFE_MODE")
+    fill = time.perf_counter() - t0
+
+    print(f"--- History buffer: {n:,} samples (14 days at 1 Hz) ---")
+    print(f"fill {fill:.1f} s ({fill / n * 1e6:.1f} us/sample), memory {history.nbytes() / 1e3:.0f} kB "
+          f"(the same for any mission length), {len(history.mode_changes)} mode changes")
+    for label, span in (("1 hour", HOUR), ("1 day", 24 * HOUR), ("14 days", n)):
+        t_end = t[-1]
+        t1 = time.perf_counter()
+        for _ in range(20):
+            qt, qy = history.query("battery_voltage", t_end - span, t_end, 600)
+        elapsed = (time.perf_counter() - t1) / 20
+        print(f"{label:<8} query {elapsed * 1000:6.2f} ms -> {len(qt)} points, min voltage {qy.min():.3f} V")
+
+    # The sag must survive decimation of the whole mission
+    _, qy = history.query("battery_voltage", t[0], t[-1], 600)
+    assert qy.min() < voltage[:n // 2].min() - 0.1, "sag lost by decimation"
+    print("Two-minute voltage sag visible in the 14-day plot: OK")
@@ -0,0 +1,415 @@
+"""
+housekeeping.py
+Streaming housekeeping statistics and the compact summary beacon.
+
+Downlinking the 1 Hz telemetry ring costs about a kilobyte per hour of
+mission even after downlink.py's compression. Most passes only need to
+know that the satellite stayed healthy, so the flight loop also keeps
+running summaries of every housekeeping channel:
+
+- per sample (main.py adds one after each health check), O(1): count,
+  min, max, mean and variance (Welford's update),
+- per unit of time, sample-and-hold: seconds below and above the
+  channel's global_config limits, and seconds spent in each mode.
+
+They roll up into fixed-size summary records per minute, per hour and
+per orbit (ORBIT_PERIOD_SEC from ORBIT_EPOCH). Only one accumulator is
+updated per sample: it covers the time up to the next minute, hour or
+orbit boundary, and is merged into the three levels when it closes
+(Chan's parallel variance formula), so the per-sample cost does not
+depend on the number of levels. A fourth level accumulates everything
+since the last beacon.
+
+beacon() packs that since-last-pass summary plus the last few orbit
+records into a few hundred bytes (RECORD.size bytes each), sent on its
+own virtual channel by downlink.prepare_pass(). decode_beacon() is the
+ground side.
+"""
+
+import collections
+import math
+import struct
+
+import conops_modes
+import global_config
+
+MINUTE, HOUR, ORBIT, PASS = range(4)
+LEVEL_NAMES = {MINUTE: "minute", HOUR: "hour", ORBIT: "orbit", PASS: "pass"}
+
+# name, beacon scale (value is sent as round(value * scale)), low limit, high limit (global_config names)
+CHANNELS = (
+    ("battery_voltage", 1000, "SAFE_MODE_VOLTAGE", None),  # mV
+    ("pi_temp", 100, None, "MAX_PI_TEMP"),                 # 0.01 °C
+    ("air_temp", 100, "IDEAL_PLANT_TEMP_MIN", "IDEAL_PLANT_TEMP_MAX"),
+    ("substrate_temp", 100, "IDEAL_PLANT_TEMP_MIN", "IDEAL_PLANT_TEMP_MAX"),
+    ("water_temp", 100, "MIN_WATER_TEMP", "IDEAL_PLANT_TEMP_MAX"),
+    ("humidity", 100, None, None),                         # 0.01 %
+    ("soil_moisture", 100, None, None),
+)
+N_CHANNELS = len(CHANNELS)
+N_MODES = len(conops_modes.MODES)
+_MODE_INDEX = {mode: i for i, mode in enumerate(conops_modes.MODES)}
+
+# --- Beacon Format ---
+# Header: level, interval start (s), seconds covered, samples, time unit (s) of the times below
+RECORD_HEADER = "BIIIH"
+# Per channel: min, max, mean, std (quantized by its scale), time below, time above
+CHANNEL_FIELDS = "hhhHHH"
+# Then the time in each mode
+RECORD = struct.Struct("<" + RECORD_HEADER + CHANNEL_FIELDS * N_CHANNELS + "H" * N_MODES)
+BEACON_HEADER = struct.Struct("<4sBB")  # magic, version, record count
+BEACON_MAGIC = b"PFHK"
+BEACON_VERSION = 1
+NO_DATA = -32768
+
+
+def state_values(system_state):
+    """The housekeeping channels of a flight state, in CHANNELS order."""
+    payload = system_state["payload_temps"]
+    return (system_state["battery_voltage"], system_state["pi_temp"], payload["air"], payload["substrate"],
+            payload["water"], system_state["humidity"], system_state["soil_moisture"])
+
+
+class _Accumulator:
+    """Running statistics of one interval."""
+    __slots__ = ("start", "n", "low", "high", "mean", "m2", "below", "above", "dwell", "covered")
+
+    def __init__(self, start):
+        self.start = start
+        self.n = 0
+        self.low = [math.inf] * N_CHANNELS
+        self.high = [-math.inf] * N_CHANNELS
+        self.mean = [0.0] * N_CHANNELS
+        self.m2 = [0.0] * N_CHANNELS
+        self.below = [0.0] * N_CHANNELS
+        self.above = [0.0] * N_CHANNELS
+        self.dwell = [0.0] * N_MODES
+        self.covered = 0.0
+
+    def merge(self, other):
+        """Adds another accumulator's samples and times (Chan et al.)."""
+        if other.n and not self.n:
+            # Into a fresh interval (every new minute): a copy
+            self.n = other.n
+            self.mean, self.m2 = list(other.mean), list(other.m2)
+            self.low, self.high = list(other.low), list(other.high)
+        elif other.n:
+            n = self.n + other.n
+            weight, cross = other.n / n, self.n * other.n / n
+            deltas = [b - a for a, b in zip(self.mean, other.mean)]
+            self.mean = [a + d * weight for a, d in zip(self.mean, deltas)]
+            self.m2 = [a + b + d * d * cross for a, b, d in zip(self.m2, other.m2, deltas)]
+            self.low = [a if a < b else b for a, b in zip(self.low, other.low)]
+            self.high = [a if a > b else b for a, b in zip(self.high, other.high)]
+            self.n = n
+        self.below = [a + b for a, b in zip(self.below, other.below)]
+        self.above = [a + b for a, b in zip(self.above, other.above)]
+        self.dwell = [a + b for a, b in zip(self.dwell, other.dwell)]
+        self.covered += other.covered
+
+    def record(self, level):
+        """The finished summary as a plain dict."""
+        n = self.n
+        return {"level": level, "start": self.start, "covered": self.covered, "n": n,
+                "min": list(self.low) if n else [math.nan] * N_CHANNELS,
+                "max": list(self.high) if n else [math.nan] * N_CHANNELS,
+                "mean": list(self.mean) if n else [math.nan] * N_CHANNELS,
+                "std": [math.sqrt(m2 / n) for m2 in self.m2] if n else [math.nan] * N_CHANNELS,
+                "below": list(self.below), "above": list(self.above), "dwell": list(self.dwell)}
+
+
+def _book(acc, below, above, mode, dt):
+    """Adds dt of one held sample: time out of band on the given channels, in the mode, covered."""
+    for i in below:
+        acc.below[i] += dt
+    for i in above:
+        acc.above[i] += dt
+    acc.dwell[mode] += dt
+    acc.covered += dt
+
+
+class Aggregator:
+    def __init__(self, history=None):
+        self.lows = [getattr(global_config, low) if low else -math.inf for _, _, low, _ in CHANNELS]
+        self.highs = [getattr(global_config, high) if high else math.inf for _, _, _, high in CHANNELS]
+        # Level boundaries: origin + k * width
+        self.grids = {MINUTE: (0.0, 60.0), HOUR: (0.0, 3600.0),
+                      ORBIT: (global_config.ORBIT_EPOCH, global_config.ORBIT_PERIOD_SEC)}
+        history = history or global_config.HOUSEKEEPING_HISTORY
+        self.records = {level: collections.deque(maxlen=history[level]) for level in self.grids}
+        self.levels = {}
+        self.since_beacon = None
+        self.segment = None   # The accumulator samples go into
+        self.segment_end = None
+        self.last_time = None
+        self.last_values = None
+        self.last_mode = None
+
+    def _interval_start(self, level, t):
+        origin, width = self.grids[level]
+        return origin + math.floor((t - origin) / width) * width
+
+    def _open(self, t):
+        ends = []
+        for level, (origin, width) in self.grids.items():
+            start = self._interval_start(level, t)
+            if level not in self.levels:
+                self.levels[level] = _Accumulator(start)
+            ends.append(start + width)
+        if self.since_beacon is None:
+            self.since_beacon = _Accumulator(t)
+        self.segment = _Accumulator(t)
+        self.segment_end = min(ends)
+
+    def _close(self):
+        """Merges the segment into every level and emits the levels whose interval ended with it."""
+        for acc in self.levels.values():
+            acc.merge(self.segment)
+        self.since_beacon.merge(self.segment)
+        self._roll()
+
+    def _roll(self):
+        end = self.segment_end
+        for level, acc in self.levels.items():
+            if acc.start + self.grids[level][1] <= end:
+                self.records[level].append(acc.record(level))
+                self.levels[level] = _Accumulator(end)
+        self._open(end)
+
+    def _hold(self, t):
+        """Books [last sample, t) with the last sample's values and mode, closing segments on the way."""
+        below = [i for i, x in enumerate(self.last_values) if x < self.lows[i]]
+        above = [i for i, x in enumerate(self.last_values) if x > self.highs[i] and i not in below]
+        mode = self.last_mode
+        while True:
+            until = min(t, self.segment_end)
+            dt = until - self.last_time
+            seg = self.segment
+            if until == self.segment_end and not seg.n and not seg.covered:
+                # The held sample covers this whole segment (long gaps between
+                # samples span many minutes): book it straight into the levels
+                # instead of merging an accumulator that holds nothing else
+                if dt > 0:
+                    for acc in (*self.levels.values(), self.since_beacon):
+                        _book(acc, below, above, mode, dt)
+                    self.last_time = until
+                self._roll()
+                continue
+            if dt > 0:
+                _book(seg, below, above, mode, dt)
+                self.last_time = until
+            if t < self.segment_end:
+                return
+            self._close()
+
+    def add(self, t, values, mode):
+        """One sample: values in CHANNELS order, mode as its name."""
+        if self.segment is None:
+            self._open(t)
+        else:
+            self._hold(t)
+        seg = self.segment
+        seg.n += 1
+        n = seg.n
+        low, high, mean, m2 = seg.low, seg.high, seg.mean, seg.m2
+        for i, x in enumerate(values):
+            if x < low[i]:
+                low[i] = x
+            if x > high[i]:
+                high[i] = x
+            delta = x - mean[i]
+            mean[i] += delta / n
+            m2[i] += delta * (x - mean[i])
+        self.last_time, self.last_values, self.last_mode = t, values, _MODE_INDEX.get(mode, 0)
+
+    # --- Beacon ---
+
+    def _split(self, now):
+        """Books time up to now and hands the open segment to the levels, so a summary can end at now."""
+        self._hold(now)
+        for acc in self.levels.values():
+            acc.merge(self.segment)
+        self.since_beacon.merge(self.segment)
+        self.segment = _Accumulator(now)  # Same segment_end
+
+    def pass_record(self, now):
+        """Summary of everything since the last beacon, up to now, or None before the first sample."""
+        if self.segment is None:
+            return None
+        self._split(now)
+        return self.since_beacon.record(PASS)
+
+    def beacon(self, now, max_orbits=None):
+        """Encoded beacon: the newest orbit records and the summary since the last beacon, which starts over."""
+        max_orbits = global_config.HOUSEKEEPING_BEACON_ORBITS if max_orbits is None else max_orbits
+        summary = self.pass_record(now)
+        if summary is None:
+            return b""
+        orbits = [r for r in self.records[ORBIT] if r["start"] + r["covered"] > summary["start"]]
+        records = (orbits[-max_orbits:] if max_orbits else []) + [summary]
+        self.since_beacon = _Accumulator(now)
+        return BEACON_HEADER.pack(BEACON_MAGIC, BEACON_VERSION, len(records)) + \
+            b"".join(encode_record(r) for r in records)
+
+
+def _quantize(value, scale, signed=True):
+    if math.isnan(value):
+        return NO_DATA if signed else 0
+    q = round(value * scale)
+    return max(-32767, min(32767, q)) if signed else max(0, min(65535, q))
+
+
+def encode_record(record):
+    """
+    A summary record as RECORD.size bytes: values quantized per CHANNELS,
+    times in whole units of 1 s, or coarser if the record covers more than
+    65535 s (a pass summary after a long gap between passes).
+    """
+    covered = int(round(record["covered"]))
+    unit = max(1, -(-covered // 65535))
+    scale = 1.0 / unit
+    fields = [record["level"], int(record["start"]) & 0xFFFFFFFF, covered, record["n"], unit]
+    for i, (_, value_scale, _, _) in enumerate(CHANNELS):
+        fields += [_quantize(record["min"][i], value_scale), _quantize(record["max"][i], value_scale),
+                   _quantize(record["mean"][i], value_scale), _quantize(record["std"][i], value_scale, signed=False),
+                   _quantize(record["below"][i], scale, signed=False), _quantize(record["above"][i], scale, signed=False)]
+    fields += [_quantize(d, scale, signed=False) for d in record["dwell"]]
+    return RECORD.pack(*fields)
+
+
+def decode_beacon(data):
+    """Ground side: the records of a beacon, with values back in engineering units."""
+    magic, version, count = BEACON_HEADER.unpack_from(data, 0)
+    if magic != BEACON_MAGIC or version != BEACON_VERSION:
+        raise ValueError("not a Pathfinder housekeeping beacon")
+    records = []
+    for k in range(count):
+        values = RECORD.unpack_from(data, BEACON_HEADER.size + k * RECORD.size)
+        level, start, covered, n, unit = values[:5]
+        record = {"level": LEVEL_NAMES[level], "start": start, "covered": covered, "n": n, "channels": {}}
+        for i, (name, scale, _, _) in enumerate(CHANNELS):
+            low, high, mean, std, below, above = values[5 + 6 * i:11 + 6 * i]
+            record["channels"][name] = {
+                "min": low / scale if low != NO_DATA else None, "max": high / scale if high != NO_DATA else None,
+                "mean": mean / scale if mean != NO_DATA else None, "std": std / scale,
+                "below": below * unit, "above": above * unit}
+        record["dwell"] = dict(zip(conops_modes.MODES, (d * unit for d in values[5 + 6 * N_CHANNELS:])))
+        records.append(record)
+    return records
+
+
+# --- Module-level aggregator used by main.py and downlink.py ---
+_aggregator = Aggregator()
+
+
+def reset():
+    global _aggregator
+    _aggregator = Aggregator()
+
+
+def add(now, system_state):
+    _aggregator.add(now, state_values(system_state), system_state["current_mode"])
+
+
+def beacon(now):
+    return _aggregator.beacon(now)
+
+
+def get_records(level):
+    """The finished MINUTE, HOUR or ORBIT records still kept, oldest first."""
+    return list(_aggregator.records[level])
+
+
+# --- Batch Reference (NumPy) ---
+
+def batch_records(t, values, modes, level, lows, highs, origin, width):
+    """
+    The same summaries as Aggregator for one level, computed over whole
+    arrays: t (n,), values (n, N_CHANNELS), modes (n,) as MODES indices.
+    Only intervals that ended by t[-1] are returned.
+    """
+    import numpy as np
+
+    bucket = np.floor((t - origin) / width)
+    starts = np.flatnonzero(np.diff(bucket, prepend=bucket[0] - 1))
+    counts = np.diff(np.append(starts, len(t)))
+    mean = np.add.reduceat(values, starts) / counts[:, None]
+    std = np.sqrt(np.add.reduceat((values - np.repeat(mean, counts, axis=0)) ** 2, starts) / counts[:, None])
+
+    # Sample-and-hold over [t0, t_last], split at every interval edge
+    edges = origin + width * np.arange(bucket[0] + 1, bucket[-1] + 1)
+    points = np.union1d(t, edges)
+    held = np.searchsorted(t, points, side="right") - 1
+    dt = np.diff(points)
+    segment_bucket = np.floor((points[:-1] - origin) / width)
+    index = np.searchsorted(np.unique(bucket), segment_bucket)
+    held_values = values[held[:-1]]
+    below = np.zeros((len(starts), N_CHANNELS))
+    above = np.zeros((len(starts), N_CHANNELS))
+    np.add.at(below, index, dt[:, None] * (held_values < lows))
+    np.add.at(above, index, dt[:, None] * (held_values > highs))
+    dwell = np.zeros((len(starts), N_MODES))
+    np.add.at(dwell, (index, modes[held[:-1]]), dt)
+
+    complete = origin + (bucket[starts] + 1) * width <= t[-1]
+    return [{"start": origin + bucket[s] * width, "n": int(counts[k]),
+             "min": np.minimum.reduceat(values, starts)[k], "max": np.maximum.reduceat(values, starts)[k],
+             "mean": mean[k], "std": std[k], "below": below[k], "above": above[k], "dwell": dwell[k]}
+            for k, s in enumerate(starts) if complete[k]]
+
+
+if __name__ == "__main__":
+    import time
+
+    import numpy as np
+
+    import downlink
+
+    # Two days of the synthetic 1 Hz log, thinned to irregular health-check times,
+    # with a few mode changes so dwell times have something to count
+    log = downlink.synthetic_log(days=2, seed=1)
+    rng = np.random.default_rng(0)
+    keep = np.sort(rng.choice(len(log), size=len(log) // 3, replace=False))
+    log = log[keep]
+    t = log["time"].astype(np.float64)
+    names = [name for name, _, _, _ in CHANNELS]
+    values = np.column_stack([log[name].astype(np.float64) for name in names])
+    values[(t % 7000) < 400, 0] -= 0.4  # Voltage dips below SAFE_MODE_VOLTAGE
+    modes = np.full(len(t), _MODE_INDEX["EXPERIMENT_MODE"])
+    modes[(t % 20000) < 1500] = _MODE_INDEX["SAFE_MODE"]
+    modes[(t % 50000) < 300] = _MODE_INDEX["TRANSMIT_MODE"]
+    mode_names = [conops_modes.MODES[m] for m in modes]
+    rows = [tuple(row) for row in values.tolist()]
+
+    aggregator = Aggregator(history={MINUTE: 10 ** 6, HOUR: 10 ** 6, ORBIT: 10 ** 6})
+    t0 = time.perf_counter()
+    for k in range(len(t)):
+        aggregator.add(t[k], rows[k], mode_names[k])
+    elapsed = time.perf_counter() - t0
+    print(f"--- Housekeeping aggregator: {len(t):,} samples over 2 days ---")
+    print(f"{elapsed / len(t) * 1e6:.2f} us per sample (all levels), "
+          + ", ".join(f"{len(aggregator.records[level])} {LEVEL_NAMES[level]}" for level in aggregator.records))
+
+    # Streaming vs. batch
+    lows, highs = np.array(aggregator.lows), np.array(aggregator.highs)
+    worst = 0.0
+    for level, (origin, width) in aggregator.grids.items():
+        expected = batch_records(t, values, modes, level, lows, highs, origin, width)
+        got = [r for r in aggregator.records[level] if r["start"] >= expected[0]["start"]]
+        got = got[:len(expected)]
+        assert len(got) == len(expected), (LEVEL_NAMES[level], len(got), len(expected))
+        for g, e in zip(got, expected):
+            assert g["start"] == e["start"] and g["n"] == e["n"]
+            for field in ("min", "max", "mean", "std", "below", "above", "dwell"):
+                error = np.max(np.abs(np.asarray(g[field]) - e[field]))
+                worst = max(worst, error)
+                assert error < 1e-6, (LEVEL_NAMES[level], g["start"], field, error)
+    print(f"matches the NumPy batch computation for every level (worst difference {worst:.1e})")
+
+    data = aggregator.beacon(t[-1])
+    decoded = decode_beacon(data)
+    print(f"beacon: {len(data)} bytes ({len(decoded)} records of {RECORD.size} B) "
+          f"vs {len(downlink.encode_records(log))} B of compressed raw telemetry for the same 2 days")
+    last = decoded[-1]
+    print(f"last pass summary: {last['covered']} s, voltage min {last['channels']['battery_voltage']['min']} V, "
+          f"{last['channels']['battery_voltage']['below']} s below {global_config.SAFE_MODE_VOLTAGE} V")
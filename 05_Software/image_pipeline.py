@@ -0,0 +1,256 @@
+"""
+image_pipeline.py
+Background capture -> encode -> store pipeline for the growth-chamber camera.
+
+On the Pi a camera capture, the image encode and the SD write take
+hundreds of milliseconds. Doing that inline in handle_experiment_mode
+would stall thermal control and health checks for the whole tick.
+Instead, the mode handler only calls request_capture(), which puts a
+small request on a bounded queue and returns right away. A worker
+thread then:
+1. triggers the camera and reads out the frame,
+2. adds the frame to the image store (image_store.py: keyframes plus
+   changed tiles, near-duplicates skipped) and writes a PNG thumbnail.
+   This worker is the store's only entry point, so the store's encoding
+   never runs on the control loop,
+3. appends a line to index.jsonl in IMAGE_DIR with the capture time,
+   mode and temperatures at the moment of the request, and the store's
+   frame number and kind.
+
+If the queue is full the request is dropped, and a request that waited
+longer than IMAGE_LATE_SEC is flagged late. Both are counted in
+get_stats().
+
+If the pipeline was never started (e.g. Monte Carlo runs), request_capture()
+falls back to the old inline hardware_drivers.capture_image() call.
+"""
+
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import flight_log
+import global_config
+import hardware_drivers
+import image_store
+import mission_clock
+
+
+# --- Encoding ---
+
+def encode_png(gray):
+    """Encodes a 2-D uint8 array as an 8-bit grayscale PNG (stdlib only)."""
+    h, w = gray.shape
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    # Every scanline starts with filter type 0 (none)
+    raw = np.hstack([np.zeros((h, 1), dtype=np.uint8), gray]).tobytes()
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+def make_thumbnail(gray, scale=global_config.THUMBNAIL_SCALE):
+    """Block-averages the frame down by `scale` in each direction."""
+    h, w = (gray.shape[0] // scale) * scale, (gray.shape[1] // scale) * scale
+    blocks = gray[:h, :w].reshape(h // scale, scale, w // scale, scale)
+    return blocks.mean(axis=(1, 3)).astype(np.uint8)
+
+
+# --- Pipeline ---
+
+class ImagePipeline:
+    def __init__(self, image_dir=global_config.IMAGE_DIR,
+                 queue_size=global_config.IMAGE_QUEUE_SIZE,
+                 late_sec=global_config.IMAGE_LATE_SEC):
+        self.image_dir = image_dir
+        self.late_sec = late_sec
+        self.requests = queue.Queue(maxsize=queue_size)
+        self.stats = {"requested": 0, "stored": 0, "dropped": 0, "late": 0, "failed": 0,
+                      "max_process_sec": 0.0, "total_process_sec": 0.0}
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._index = None
+        self._thread = None
+        self.store = None
+
+    def start(self):
+        os.makedirs(self.image_dir, exist_ok=True)
+        self.store = image_store.ImageStore(os.path.join(self.image_dir, "store"))
+        self._sequence = len(self.store)
+        self._index = open(os.path.join(self.image_dir, "index.jsonl"), "a")
+        self._thread = threading.Thread(target=self._worker, name="image_pipeline", daemon=True)
+        self._thread.start()
+
+    def request(self, system_state):
+        """Queues one capture. Never blocks; returns False if the request was dropped."""
+        payload = system_state["payload_temps"]
+        request = {
+            "capture_time": mission_clock.now(),
+            "mode": system_state["current_mode"],
+            "air_temp": payload["air"],
+            "water_temp": payload["water"],
+            "pi_temp": system_state["pi_temp"],
+            "_queued_at": time.monotonic(),
+        }
+        try:
+            self.requests.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+        with self._lock:
+            self.stats["requested"] += 1
+        return True
+
+    def _worker(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            try:
+                self._process(request)
+            except Exception as e:
+                flight_log.error("Images", "Capture failed: %s", e)
+                with self._lock:
+                    self.stats["failed"] += 1
+
+    def _process(self, request):
+        started = time.monotonic()
+        late = started - request.pop("_queued_at") > self.late_sec
+
+        hardware_drivers.capture_image()
+        frame = hardware_drivers.read_camera_frame()
+
+        name = f"img_{self._sequence:06d}"
+        self._sequence += 1
+        request["frame"], kind = self.store.add(frame, request["capture_time"])
+        request["stored"] = image_store.KIND_NAMES[kind]
+        request["thumbnail"] = name + "_thumb.png"
+        request["late"] = late
+        with open(os.path.join(self.image_dir, request["thumbnail"]), "wb") as f:
+            f.write(encode_png(make_thumbnail(frame)))
+        self._index.write(json.dumps(request) + "\n")
+        self._index.flush()
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.stats["stored"] += 1
+            self.stats["late"] += late
+            self.stats["total_process_sec"] += elapsed
+            self.stats["max_process_sec"] = max(self.stats["max_process_sec"], elapsed)
+
+    def stop(self, drain=True):
+        """Stops the worker. With drain=True, queued captures are finished first."""
+        if self._thread is None:
+            return
+        if not drain:
+            while True:
+                try:
+                    self.requests.get_nowait()
+                except queue.Empty:
+                    break
+        self.requests.put(None)
+        self._thread.join()
+        self._thread = None
+        self._index.close()
+        self.store.close()
+
+
+# --- Module-level pipeline used by conops_modes ---
+_pipeline = None
+
+
+def start(image_dir=global_config.IMAGE_DIR):
+    global _pipeline
+    _pipeline = ImagePipeline(image_dir)
+    _pipeline.start()
+    flight_log.info("Images", "Capture pipeline started (%s).", image_dir)
+
+
+def request_capture(system_state):
+    """Asks for one image. Inline capture if the pipeline is not running."""
+    if _pipeline is None:
+        hardware_drivers.capture_image()
+        return True
+    return _pipeline.request(system_state)
+
+
+def stop(drain=True):
+    global _pipeline
+    if _pipeline is not None:
+        _pipeline.stop(drain)
+        flight_log.info("Images", "Capture pipeline stopped: %s", get_stats())
+        _pipeline = None
+
+
+def get_stats():
+    if _pipeline is None:
+        return {}
+    with _pipeline._lock:
+        stats = dict(_pipeline.stats)
+    stats["store"] = _pipeline.store.stats()
+    return stats
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import tempfile
+
+    # Tick latency with inline capture vs. the background pipeline.
+    # One "tick" is a small amount of control work; every 10th tick asks for an image.
+    state = {"current_mode": "EXPERIMENT_MODE", "pi_temp": 45.0,
+             "payload_temps": {"air": 22.0, "substrate": 21.0, "water": 20.0}}
+    n_ticks = 300
+
+    def control_work():
+        return sum(i * i for i in range(2000))
+
+    def inline_capture(image_dir, k):
+        hardware_drivers.capture_image()
+        frame = hardware_drivers.read_camera_frame()
+        with open(os.path.join(image_dir, f"inline_{k}.png"), "wb") as f:
+            f.write(encode_png(frame))
+        with open(os.path.join(image_dir, f"inline_{k}_thumb.png"), "wb") as f:
+            f.write(encode_png(make_thumbnail(frame)))
+
+    def run(use_pipeline):
+        image_dir = tempfile.mkdtemp()
+        pipeline = ImagePipeline(image_dir)
+        if use_pipeline:
+            pipeline.start()
+        latencies = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for k in range(n_ticks):
+                t0 = time.perf_counter()
+                control_work()
+                if k % 10 == 0:
+                    if use_pipeline:
+                        pipeline.request(state)
+                    else:
+                        inline_capture(image_dir, k)
+                latencies.append(time.perf_counter() - t0)
+                time.sleep(0.005)  # Idle part of the tick
+            if use_pipeline:
+                pipeline.stop()
+        latencies.sort()
+        return latencies, pipeline.stats
+
+    print(f"--- Image pipeline: {n_ticks} ticks, capture every 10th, "
+          f"{global_config.CAMERA_WIDTH}x{global_config.CAMERA_HEIGHT} frames ---")
+    for label, use_pipeline in (("inline", False), ("pipeline", True)):
+        latencies, stats = run(use_pipeline)
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"{label:<10} tick p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  max {latencies[-1] * 1000:6.2f} ms")
+    print(f"pipeline stats: {stats}")
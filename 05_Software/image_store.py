@@ -0,0 +1,359 @@
+"""
+image_store.py
+Deduplicating, delta-encoded store for the growth-chamber camera frames.
+
+One image every IMAGE_INTERVAL_SEC is about 4,000 frames in 14 days, and
+consecutive frames differ only where the plant grew. Writing each frame
+as a PNG stores (and later downlinks) the whole chamber 4,000 times.
+The store keeps each change once:
+
+- Near-duplicates are skipped. The cheap perceptual hash is the frame's
+  block-mean signature (SIGNATURE_GRID blocks, each the mean of
+  ~1,200 pixels, so sensor noise averages out). If no block moved more
+  than IMAGE_DUPLICATE_THRESHOLD gray levels since the last stored frame,
+  the frame is recorded as a duplicate of it and costs no data.
+- Keyframes: every IMAGE_KEYFRAME_INTERVAL stored frames, or when most
+  tiles changed, the whole frame is stored losslessly (horizontal
+  difference filter + zlib, like PNG's "Sub" filter).
+- Delta frames: the frame is cut into IMAGE_TILE_SIZE tiles. A tile
+  counts as changed when one of its 8x8 block means moved more than
+  IMAGE_TILE_THRESHOLD from the last stored version of that tile. Only
+  changed tiles are stored, as a zlib-compressed difference to the
+  keyframe tile; unchanged tiles point to the data already stored for
+  them. A delta frame is therefore its new tiles plus a small
+  compressed directory (one offset/length per tile, zero meaning "as in
+  the keyframe").
+
+Any frame is rebuilt from at most two pieces: its keyframe (the last one
+decoded is cached) plus its own directory of tile differences, so the
+cost does not grow with the distance to the keyframe.
+
+Files in the store directory:
+- data.bin:  append-only keyframes, tile differences and directories,
+- index.bin: fixed-size records (time, kind, reference, offset, length,
+  bytes added), memory-mapped with NumPy, so a frame's record is one
+  array lookup and the index needs no parsing on start.
+Data is written before its index record, and the frame count in the
+index header last, so a reset mid-write loses at most that frame.
+
+Duplicates and unchanged tiles are not bit-exact: they show the frame
+as it was when last stored, within the thresholds above (the report
+gives the error). Keyframes and stored tiles are lossless.
+
+Where frames come in: ImagePipeline's worker (image_pipeline.py) adds
+every frame right after hardware_drivers.capture_image() and
+read_camera_frame(), so the experiment timer and the CAPTURE_IMAGE
+stored command both go through the store. The hook is deliberately not
+inside hardware_drivers.capture_image(): that is the bare camera trigger
+of the hardware layer (hal_trace.py records and replays it), and it runs
+inline in the mode handler when the pipeline is not started. The tile
+differences and zlib would then be back on the control loop. Without
+the pipeline (Monte Carlo runs) no frame is read out, so nothing is
+stored.
+"""
+
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+import global_config
+
+KEY, DELTA, DUPLICATE = 0, 1, 2
+KIND_NAMES = {KEY: "key", DELTA: "delta", DUPLICATE: "duplicate"}
+
+SIGNATURE_GRID = (12, 16)  # Block-mean signature: rows x columns of blocks
+TILE_BLOCK = 8             # Change test inside a tile uses these block means
+
+INDEX_MAGIC = b"RVMIMG01"
+INDEX_HEADER = struct.Struct("<8sQ")  # magic, frame count
+INDEX_DTYPE = np.dtype([
+    ("time", "<f8"),    # Capture time (mission time)
+    ("kind", "u1"),     # KEY, DELTA or DUPLICATE
+    ("ref", "<i4"),     # DELTA: its keyframe; DUPLICATE: the stored frame it repeats; KEY: itself
+    ("offset", "<u8"),  # KEY: the keyframe data; DELTA: its tile directory
+    ("length", "<u4"),
+    ("bytes", "<u4"),   # Bytes this frame added to data.bin (its storage and downlink cost)
+])
+
+
+def _block_means(gray, rows, cols):
+    h, w = gray.shape
+    bh, bw = h // rows, w // cols
+    blocks = gray[:bh * rows, :bw * cols].reshape(rows, bh, cols, bw)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def signature(gray):
+    """The perceptual hash: block means on a SIGNATURE_GRID."""
+    return _block_means(gray, *SIGNATURE_GRID)
+
+
+def _encode_key(gray):
+    # Horizontal differences (wrapping in uint8) make the smooth chamber compressible
+    filtered = gray.copy()
+    filtered[:, 1:] -= gray[:, :-1]
+    return zlib.compress(filtered.tobytes(), 6)
+
+
+def _decode_key(data, shape):
+    filtered = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape)
+    return np.cumsum(filtered, axis=1, dtype=np.uint8)
+
+
+class ImageStore:
+    def __init__(self, directory, tile=None, capacity=None):
+        self.directory = directory
+        self.tile = tile or global_config.IMAGE_TILE_SIZE
+        self.shape = (global_config.CAMERA_HEIGHT, global_config.CAMERA_WIDTH)
+        self.grid = (self.shape[0] // self.tile, self.shape[1] // self.tile)
+        self.n_tiles = self.grid[0] * self.grid[1]
+        capacity = capacity or global_config.IMAGE_STORE_CAPACITY
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, "index.bin")
+        size = INDEX_HEADER.size + capacity * INDEX_DTYPE.itemsize
+        if not os.path.exists(index_path):
+            with open(index_path, "wb") as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, 0))
+                f.truncate(size)
+        self._header = np.memmap(index_path, dtype=np.uint8, mode="r+", shape=(INDEX_HEADER.size,))
+        magic, count = INDEX_HEADER.unpack(self._header.tobytes())
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{index_path} is not an image store index")
+        self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r+", offset=INDEX_HEADER.size,
+                               shape=((os.path.getsize(index_path) - INDEX_HEADER.size) // INDEX_DTYPE.itemsize,))
+        self.count = count
+        self._data = open(os.path.join(directory, "data.bin"), "a+b")
+        self._data.seek(0, os.SEEK_END)
+        self._key_cache = (None, None)  # (frame number, decoded keyframe)
+
+        # Encoder state: the last stored frame as it reconstructs, per tile
+        self._reference = None       # Reconstruction of the last stored frame
+        self._ref_signature = None
+        self._ref_blocks = None      # TILE_BLOCK means of the reconstruction
+        self._key_frame = None       # Number and pixels of the current keyframe
+        self._key = None
+        self._directory = None       # Current offsets/lengths per tile (0 length: keyframe tile)
+        self._since_key = 0
+        self._last_stored = None
+        if count:
+            self._resume()
+
+    def __len__(self):
+        return self.count
+
+    # --- Writing ---
+
+    def add(self, gray, capture_time=0.0):
+        """Stores one frame. Returns (frame number, kind)."""
+        with self._lock:
+            if self.count >= len(self.index):
+                raise RuntimeError(f"image store full ({len(self.index)} frames)")
+            sig = signature(gray)
+            if self._ref_signature is not None and \
+                    np.abs(sig - self._ref_signature).max() <= global_config.IMAGE_DUPLICATE_THRESHOLD:
+                return self._record(capture_time, DUPLICATE, self._last_stored, 0, 0, 0), DUPLICATE
+
+            blocks = self._tile_blocks(gray)
+            changed = None
+            if self._key is not None and self._since_key < global_config.IMAGE_KEYFRAME_INTERVAL:
+                moved = np.abs(blocks - self._ref_blocks).max(axis=(2, 3))  # Per tile
+                changed = np.flatnonzero(moved.ravel() > global_config.IMAGE_TILE_THRESHOLD)
+                if len(changed) > self.n_tiles // 2:
+                    changed = None  # Cheaper as a keyframe
+            if changed is None:
+                number, kind = self._add_key(gray, capture_time), KEY
+            else:
+                number, kind = self._add_delta(gray, capture_time, changed), DELTA
+            self._ref_signature = signature(self._reference)
+            self._ref_blocks = self._tile_blocks(self._reference)
+            self._last_stored = number
+            return number, kind
+
+    def _add_key(self, gray, capture_time):
+        data = _encode_key(gray)
+        offset = self._append(data)
+        number = self._record(capture_time, KEY, self.count, offset, len(data), len(data))
+        self._key_frame, self._key = number, gray.copy()
+        self._reference = gray.copy()
+        self._directory = np.zeros((2, self.n_tiles), dtype=np.uint64)
+        self._since_key = 0
+        self._key_cache = (number, self._key)
+        return number
+
+    def _add_delta(self, gray, capture_time, changed):
+        t = self.tile
+        added = 0
+        for i in changed:
+            r, c = divmod(int(i), self.grid[1])
+            window = (slice(r * t, (r + 1) * t), slice(c * t, (c + 1) * t))
+            data = zlib.compress((gray[window] - self._key[window]).tobytes(), 6)  # Wraps in uint8
+            self._directory[0, i] = self._append(data)
+            self._directory[1, i] = len(data)
+            self._reference[window] = gray[window]
+            added += len(data)
+        directory = zlib.compress(self._directory.tobytes(), 6)
+        offset = self._append(directory)
+        self._since_key += 1
+        return self._record(capture_time, DELTA, self._key_frame, offset, len(directory), added + len(directory))
+
+    def _tile_blocks(self, gray):
+        """TILE_BLOCK means of every tile, shape (rows, cols, blocks, blocks)."""
+        t, b = self.tile, TILE_BLOCK
+        rows, cols = self.grid
+        means = _block_means(gray, rows * t // b, cols * t // b)
+        return means.reshape(rows, t // b, cols, t // b).transpose(0, 2, 1, 3)
+
+    def _append(self, data):
+        offset = self._data.tell()
+        self._data.write(data)
+        return offset
+
+    def _record(self, capture_time, kind, ref, offset, length, n_bytes):
+        self._data.flush()
+        number = self.count
+        self.index[number] = (capture_time, kind, ref, offset, length, n_bytes)
+        self.count += 1
+        self._header[:] = np.frombuffer(INDEX_HEADER.pack(INDEX_MAGIC, self.count), dtype=np.uint8)
+        return number
+
+    def _resume(self):
+        """After a restart: rebuild the encoder state from the last stored frame."""
+        kinds = self.index["kind"][:self.count]
+        self._last_stored = int(np.flatnonzero(kinds != DUPLICATE)[-1])
+        last = self.index[self._last_stored]
+        self._key_frame = self._last_stored if last["kind"] == KEY else int(last["ref"])
+        self._key = self._keyframe(self._key_frame)
+        self._directory = (np.zeros((2, self.n_tiles), dtype=np.uint64) if last["kind"] == KEY
+                           else self._read_directory(last))
+        self._since_key = int(np.count_nonzero(kinds[self._key_frame + 1:] == DELTA))
+        self._reference = self._rebuild(self._last_stored)
+        self._ref_signature = signature(self._reference)
+        self._ref_blocks = self._tile_blocks(self._reference)
+
+    # --- Reading ---
+
+    def _read(self, offset, length):
+        self._data.flush()
+        with open(self._data.name, "rb") as f:
+            f.seek(int(offset))
+            return f.read(int(length))
+
+    def _keyframe(self, number):
+        cached_number, cached = self._key_cache
+        if cached_number == number:
+            return cached
+        record = self.index[number]
+        key = _decode_key(self._read(record["offset"], record["length"]), self.shape)
+        self._key_cache = (number, key)
+        return key
+
+    def _read_directory(self, record):
+        raw = zlib.decompress(self._read(record["offset"], record["length"]))
+        return np.frombuffer(raw, dtype=np.uint64).reshape(2, self.n_tiles).copy()
+
+    def _rebuild(self, number):
+        record = self.index[number]
+        if record["kind"] == DUPLICATE:
+            number, record = int(record["ref"]), self.index[int(record["ref"])]
+        if record["kind"] == KEY:
+            return self._keyframe(number).copy()
+        key = self._keyframe(int(record["ref"]))
+        frame = key.copy()
+        directory = self._read_directory(record)
+        t = self.tile
+        for i in np.flatnonzero(directory[1]):
+            r, c = divmod(int(i), self.grid[1])
+            window = (slice(r * t, (r + 1) * t), slice(c * t, (c + 1) * t))
+            diff = np.frombuffer(zlib.decompress(self._read(directory[0, i], directory[1, i])), dtype=np.uint8)
+            frame[window] = key[window] + diff.reshape(t, t)
+        return frame
+
+    def reconstruct(self, number):
+        """Frame `number` as a uint8 array."""
+        with self._lock:
+            if not 0 <= number < self.count:
+                raise IndexError(f"frame {number} not in store ({self.count} frames)")
+            return self._rebuild(number)
+
+    def stats(self):
+        records = self.index[:self.count]
+        raw = self.count * self.shape[0] * self.shape[1]
+        stored = int(records["bytes"].sum()) + self.count * INDEX_DTYPE.itemsize
+        return {"frames": self.count,
+                **{KIND_NAMES[k]: int(np.count_nonzero(records["kind"] == k)) for k in KIND_NAMES},
+                "stored_bytes": stored,
+                "raw_bytes": raw,
+                "compression_ratio": raw / stored if stored else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._data.close()
+            self.index.flush()
+            self._header.flush()
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+    import tempfile
+    import time
+
+    import hardware_drivers
+    from image_pipeline import encode_png
+
+    parser = argparse.ArgumentParser(description="Image store on a synthetic growth sequence")
+    parser.add_argument("--frames", type=int, default=4032, help="Frames to store (default: 14 days at 5 min).")
+    args = parser.parse_args()
+
+    hardware_drivers.reset_simulation(seed=0)
+    store = ImageStore(tempfile.mkdtemp())
+    png_bytes, png_sampled = 0, 0
+    originals = {}
+    add_times = []
+    check = set(np.linspace(0, args.frames - 1, 50).astype(int))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for k in range(args.frames):
+            hardware_drivers.capture_image()
+            frame = hardware_drivers.read_camera_frame()
+            t0 = time.perf_counter()
+            store.add(frame, capture_time=k * 300.0)
+            add_times.append(time.perf_counter() - t0)
+            if k % 20 == 0:  # PNG size (the old pipeline) on a sample
+                png_bytes += len(encode_png(frame))
+                png_sampled += 1
+            if k in check:
+                originals[k] = frame
+
+    s = store.stats()
+    png_total = png_bytes / png_sampled * args.frames
+    print(f"--- Image store: {args.frames} synthetic frames "
+          f"({global_config.CAMERA_WIDTH}x{global_config.CAMERA_HEIGHT}) ---")
+    print(f"kinds: {s['key']} key, {s['delta']} delta, {s['duplicate']} duplicate")
+    print(f"raw {s['raw_bytes'] / 1e6:.1f} MB, PNG per frame ~{png_total / 1e6:.1f} MB, "
+          f"store {s['stored_bytes'] / 1e6:.2f} MB (incl. index)")
+    print(f"compression: {s['compression_ratio']:.0f}x vs raw, {png_total / s['stored_bytes']:.1f}x vs PNG; "
+          f"this is also the downlink volume")
+    add_times.sort()
+    print(f"add: p50 {add_times[len(add_times) // 2] * 1e3:.2f} ms, max {add_times[-1] * 1e3:.2f} ms")
+
+    # Reconstruction latency and error, on a reopened store (index from the memory map)
+    store.close()
+    store = ImageStore(store.directory)
+    latencies, errors = [], []
+    for k in sorted(originals):
+        store._key_cache = (None, None)  # Cold: decode the keyframe every time
+        t0 = time.perf_counter()
+        frame = store.reconstruct(k)
+        latencies.append(time.perf_counter() - t0)
+        errors.append(np.abs(frame.astype(np.int16) - originals[k]))
+    latencies.sort()
+    errors = np.stack(errors)
+    print(f"reconstruct (cold): p50 {latencies[len(latencies) // 2] * 1e3:.2f} ms, max {latencies[-1] * 1e3:.2f} ms")
+    print(f"error on {len(originals)} frames: mean {errors.mean():.2f} gray levels, "
+          f"{np.mean(errors > 4) * 100:.2f}% of pixels off by more than the sensor noise")
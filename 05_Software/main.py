@@ -2,66 +2,259 @@
 FAU RVM - Main Flight Software (GNC/Software Team)
 main.py
 """
+import argparse
 import time
-import copy  # IMPORTANT: Needed to send data safely to the GUI
+import actuators
+import command_queue
+import flight_log
+import flight_metrics
 import conops_modes
 import system_health
+import thermal_control
 import global_config
+import housekeeping
+import mission_clock
+import flight_state
+import scheduler
+import sensor_acquisition
 
-def run_simulation_loop(data_queue=None, stop_event=None):
+def run_simulation_loop(data_queue=None, stop_event=None, mission_duration=None, on_tick=None,
+                        recorder=None, checkpoint=None):
     """
     The main loop, refactored to work with threading for the GUI.
+
+    The loop is deadline-driven (see scheduler.py). Each job is a task
+    with its own rate, and the process sleeps until the earliest deadline:
+    - health:      sensor reads and fault checks, every HEALTH_CHECK_PERIOD_SEC;
+                   each result also feeds the housekeeping beacon summaries
+    - mode_logic:  the current mode's handler. Polling modes run every
+                   MAIN_LOOP_DELAY; EXPERIMENT_MODE runs only at its next
+                   image / LED / end-of-experiment deadline. STARTUP and
+                   INITIALIZE hand over in the same wakeup, so the first
+                   tick already ends in SAFE_MODE (or the resumed mode).
+    - thermal:     payload thermostat, every THERMAL_CONTROL_PERIOD_SEC
+    - commands:    stored commands (command_queue.py), only when the
+                   earliest one is due; re-armed when a batch arrives.
+
+    All timing goes through mission_clock, so the same loop runs in real
+    time on the Pi or "as fast as possible" on a DiscreteEventClock.
+    If mission_duration (seconds) is given, the loop stops on its own once
+    that much mission time has passed since boot.
+    State deltas are put() on data_queue once per wakeup: a queue.Queue for
+    the in-process dashboard, or a telemetry_server.TelemetryServer for
+    subscribers in other processes.
+    Every stage is timed into flight_metrics (health, mode handler,
+    thermal, commands, publish, sleep), with per-handler exception counts.
+    on_tick(system_state) is called once per wakeup, after the tasks ran
+    (used by monte_carlo.py to collect statistics without copying state).
+    If a telemetry_recorder.TelemetryRecorder is given, every wakeup is
+    persisted to its ring file, which is also what TRANSMIT_MODE
+    downlinks from.
+    If a checkpoint.Checkpoint is given, the loop first restores it (a
+    warm restart resumes the saved mode without POST) and then keeps it
+    up to date once per wakeup.
+
+    Returns the Scheduler, so callers can print its per-task statistics.
     """
-    # This dictionary holds the entire "state" of the satellite.
-    system_state = {
-        "current_mode": "STARTUP",
-        "last_mode": "",
-        "boot_time": time.time(),
-        "experiment_start_time": None,
-        "battery_voltage": 0.0,
-        "pi_temp": 0.0,
-        "payload_temps": {"air": 0.0, "substrate": 0.0, "water": 0.0},
-        "soil_moisture": 0.0,
-        "humidity": 0.0,
-        "gnd_command_received": None, 
-    }
-
-    print("--- Pathfinder Flight Software Initializing ---")
-
-    # Main Loop: Runs until the stop_event is set (when you close the GUI)
-    while not (stop_event and stop_event.is_set()):
-        
-        # 1. --- CHECK SYSTEM HEALTH ---
+    # This holds the entire "state" of the satellite. It reads and writes
+    # like a dict, but only publishes the fields that changed each tick.
+    system_state = flight_state.FlightState(boot_time=mission_clock.now(),
+                                            telemetry_file=recorder.path if recorder else None)
+    actuators.reset()  # Nothing has been written yet this boot
+    sensor_acquisition.reset()  # No staleness carried over from an earlier run
+    thermal_control.reset()
+    housekeeping.reset()
+    flight_log.reset()
+    flight_metrics.reset()
+    tasks = scheduler.Scheduler()
+
+    flight_log.info("Main", "--- Pathfinder Flight Software Initializing ---")
+    if checkpoint:
+        checkpoint.restore(system_state)
+
+    # 1. --- CHECK SYSTEM HEALTH ---
+    def health_task():
+        mode_before = system_state["current_mode"]
+        t0 = time.perf_counter()
         try:
             system_health.check_all_systems(system_state)
         except Exception as e:
-            print(f"CRITICAL ERROR in system_health: {e}")
+            flight_metrics.error("health", e)
+            flight_log.critical("Main", "Error in system_health: %s", e)
             system_state["current_mode"] = "SAFE_MODE" 
+        housekeeping.add(mission_clock.now(), system_state)  # Minute/hour/orbit summaries for the beacon
+        t1 = time.perf_counter()
+        flight_metrics.stage("health", t1 - t0)
+        flight_metrics.startup_phase("first health check", t0, t1)
+        if system_state["current_mode"] != mode_before:
+            # A forced mode change is acted on right away
+            tasks.schedule("mode_logic", mission_clock.now())
 
-        # 2. --- EXECUTE STATE LOGIC ---
+    # 2. --- EXECUTE STATE LOGIC ---
+    def mode_task():
         current_mode = system_state["current_mode"]
-        try:
-            if current_mode == "STARTUP": conops_modes.handle_startup(system_state)
-            elif current_mode == "INITIALIZE": conops_modes.handle_initialize(system_state)
-            elif current_mode == "SAFE_MODE": conops_modes.handle_safe_mode(system_state)
-            elif current_mode == "PRE_EXPERIMENT_HEATING": conops_modes.handle_pre_experiment_heating(system_state)
-            elif current_mode == "WATER_SATURATION": conops_modes.handle_water_saturation(system_state)
-            elif current_mode == "EXPERIMENT_MODE": conops_modes.handle_experiment_mode(system_state)
-            elif current_mode == "TRANSMIT_MODE": conops_modes.handle_transmit_mode(system_state)
-            elif current_mode == "LAST_RESORT_MODE": conops_modes.handle_last_resort_mode(system_state)
-            else: system_state["current_mode"] = "SAFE_MODE"
-        except Exception as e:
-            print(f"ERROR: {e}")
+        handler = conops_modes.HANDLERS.get(current_mode)
+        if handler is None:
+            flight_log.error("Main", "Unknown mode %s. Entering SAFE_MODE.", current_mode)
             system_state["current_mode"] = "SAFE_MODE"
+        else:
+            t0 = time.perf_counter()
+            try:
+                handler(system_state)
+            except Exception as e:
+                flight_metrics.error(current_mode, e)
+                flight_log.error("Main", "Error in %s handler: %s", current_mode, e)
+                system_state["current_mode"] = "SAFE_MODE"
+            flight_metrics.handler(current_mode, time.perf_counter() - t0)
+        wake_commands()  # The handler may have received a batch
+
+        new_mode = system_state["current_mode"]
+        if current_mode in conops_modes.BOOT_MODES and new_mode != current_mode:
+            if new_mode not in conops_modes.BOOT_MODES:
+                flight_metrics.startup_phase(new_mode, time.perf_counter())
+                flight_log.info("Main", "Startup: %s", flight_metrics.startup_summary())
+            return mission_clock.now()  # Boot modes don't wait for the next heartbeat
+
+        # Poll again next heartbeat, unless the mode only has timed work to do
+        soonest = mission_clock.now() + global_config.MAIN_LOOP_DELAY
+        deadline = conops_modes.next_deadline(system_state)
+        return soonest if deadline is None else max(deadline, soonest)
 
-        # 3. --- GUI UPDATE ---
+    # 3. --- PAYLOAD THERMAL CONTROL ---
+    def thermal_task():
+        if system_state["current_mode"] in ("SAFE_MODE", "EXPERIMENT_MODE"):
+            t0 = time.perf_counter()
+            system_health.run_payload_thermal_control(system_state)
+            flight_metrics.stage("thermal", time.perf_counter() - t0)
+
+    # 4. --- STORED COMMANDS ---
+    def command_task():
+        mode_before = system_state["current_mode"]
+        t0 = time.perf_counter()
+        command_queue.dispatch(system_state)
+        flight_metrics.stage("commands", time.perf_counter() - t0)
+        if system_state["current_mode"] != mode_before:
+            tasks.schedule("mode_logic", mission_clock.now())
+        return command_queue.next_due()  # None: nothing queued, the task ends
+
+    def wake_commands():
+        due = command_queue.next_due()
+        task = tasks.tasks.get("commands")
+        if due is None or (task is not None and task.due <= due):
+            return
+        if task is None:
+            tasks.add_oneshot("commands", due, command_task, priority=1)
+        else:
+            tasks.schedule("commands", due)
+
+    # 5. --- ACTUATORS, GUI UPDATE / TELEMETRY (once per wakeup) ---
+    def publish():
+        t0 = time.perf_counter()
+        # Heater/LED commands from this wakeup's tasks go out in one batch
+        actuators.flush()
+        system_state["mission_time"] = mission_clock.now()
+        # Only the fields that changed are sent; values are immutable
+        # scalars, so no copy is needed to hand them to the GUI thread.
         if data_queue:
-            data_queue.put(copy.deepcopy(system_state))
+            delta = system_state.take_delta()
+            if delta:
+                data_queue.put(delta)
+        if on_tick:
+            on_tick(system_state)
+        if recorder:
+            recorder.record(system_state)
+        if checkpoint:
+            checkpoint.save(system_state)
+        t1 = time.perf_counter()
+        flight_metrics.stage("publish", t1 - t0)
+        flight_metrics.end_tick(t1)
+
+    boot_time = system_state["boot_time"]
+    tasks.add_periodic("health", global_config.HEALTH_CHECK_PERIOD_SEC, health_task, boot_time, priority=0)
+    tasks.add_oneshot("mode_logic", boot_time, mode_task, priority=1)
+    tasks.add_periodic("thermal", global_config.THERMAL_CONTROL_PERIOD_SEC, thermal_task, boot_time, priority=2)
+    wake_commands()  # Commands restored from the journal
+
+    until = None if mission_duration is None else boot_time + mission_duration
+    tasks.run(until=until, stop_event=stop_event, on_wakeup=publish)
+    if checkpoint:
+        checkpoint.save(system_state, force=True)
+
+    flight_log.info("Main", "--- Flight Software Stopping ---")
+    return tasks
+
+def main(argv=None):
+    """Command-line entry point (also used by boot.py)."""
+    parser = argparse.ArgumentParser(description="Pathfinder flight software (SITL)")
+    parser.add_argument("--fast", action="store_true",
+                        help="Run on a simulated clock as fast as possible.")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Stop after this many seconds of mission time.")
+    parser.add_argument("--record", metavar="PATH", nargs="?", const=global_config.TELEMETRY_FILE,
+                        help="Record every tick to a telemetry ring file.")
+    parser.add_argument("--checkpoint", metavar="PATH", nargs="?", const=global_config.CHECKPOINT_FILE,
+                        help="Keep a warm-restart checkpoint and resume from it on boot.")
+    parser.add_argument("--commands", metavar="PATH", nargs="?", const=global_config.COMMAND_QUEUE_FILE,
+                        help="Keep stored commands in a journal that survives resets.")
+    parser.add_argument("--images", action="store_true",
+                        help="Capture and store real image files in the background.")
+    parser.add_argument("--log", metavar="PATH", default=global_config.LOG_FILE,
+                        help="JSON-lines flight log file (rotated, see flight_log.py).")
+    parser.add_argument("--serve", metavar="PORT", type=int, nargs="?", const=global_config.TELEMETRY_PORT,
+                        help="Publish the flight state to local subscribers (telemetry_server.py).")
+    parser.add_argument("--metrics", metavar="PORT", type=int, nargs="?", const=global_config.METRICS_PORT,
+                        help="Serve loop metrics as JSON on http://127.0.0.1:PORT/metrics.")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Only write the log file, don't echo it to the console.")
+    args = parser.parse_args(argv)
+
+    if args.fast:
+        mission_clock.set_clock(mission_clock.DiscreteEventClock())
+        if args.duration is None:
+            # One full experiment plus a few minutes for startup and heating
+            args.duration = global_config.EXPERIMENT_DURATION_SEC + 600
 
-        # 4. --- DELAY ---
-        time.sleep(global_config.MAIN_LOOP_DELAY)
+    flight_log.start(args.log, echo=not args.quiet)
+    recorder = None
+    if args.record:
+        import telemetry_recorder
+        recorder = telemetry_recorder.TelemetryRecorder(args.record)
+    checkpoint = None
+    if args.checkpoint:
+        import checkpoint as checkpoints
+        checkpoint = checkpoints.Checkpoint(args.checkpoint)
+    if args.commands:
+        command_queue.start(args.commands)
+    if args.images:
+        import image_pipeline
+        image_pipeline.start()
+    server = None
+    if args.serve is not None:
+        import telemetry_server
+        server = telemetry_server.TelemetryServer(port=args.serve)
+        server.start()
+    metrics_server = None
+    if args.metrics is not None:
+        metrics_server = flight_metrics.MetricsServer(port=args.metrics)
+        metrics_server.start()
+    try:
+        tasks = run_simulation_loop(server, mission_duration=args.duration, recorder=recorder,
+                                    checkpoint=checkpoint)
+        flight_log.stop()  # Let the writer finish before printing the reports
+        tasks.print_report()
+        actuators.print_report()
+        flight_metrics.print_report()
+    finally:
+        if recorder:
+            recorder.close()
+        if args.images:
+            image_pipeline.stop()
+        if server:
+            server.stop()
+        if metrics_server:
+            metrics_server.stop()
+        flight_log.stop()
 
-    print("--- Flight Software Stopping ---")
 
 if __name__ == "__main__":
-    run_simulation_loop()
\ No newline at end of file
+    main()
@@ -0,0 +1,82 @@
+"""
+mission_clock.py
+This file provides the single "mission clock" used by the flight software.
+
+Every time decision (LED 16/8 cycle, image timer, experiment duration)
+reads the time through this module instead of calling time.time()
+directly. That lets us swap the real clock for a simulated one:
+- RealTimeClock: wall-clock time. This is what flies on the Pi.
+- DiscreteEventClock: virtual time that never actually waits. It jumps
+  straight to the next "interesting" time, so a full 14-day experiment
+  finishes in seconds on a laptop.
+
+Installing a DiscreteEventClock also switches sensor_acquisition to
+inline reads: wall-clock read deadlines mean nothing in virtual time,
+and would make simulated runs slow and non-repeatable.
+"""
+
+import time
+
+
+class RealTimeClock:
+    """Wall-clock time. sleep_until() really blocks until the wakeup."""
+
+    def now(self):
+        return time.time()
+
+    def sleep_until(self, when, stop_event=None):
+        delay = when - time.time()
+        if delay <= 0:
+            return
+        if stop_event:
+            stop_event.wait(delay)  # Wakes early if the GUI is closed
+        else:
+            time.sleep(delay)
+
+
+class DiscreteEventClock:
+    """
+    Simulated time for "as fast as possible" runs.
+
+    sleep_until() never blocks. It jumps the virtual time straight to the
+    wakeup the scheduler asked for (never backwards), so the ticks land
+    on the same times as a real-time run.
+    """
+
+    def __init__(self, start_time=None):
+        # Default to "now" so timers that start at 0 (e.g. last_image_time)
+        # behave exactly like they do on the real clock.
+        self.current_time = time.time() if start_time is None else start_time
+
+    def now(self):
+        return self.current_time
+
+    def sleep_until(self, when, stop_event=None):
+        self.current_time = max(self.current_time, when)
+
+
+# --- The active clock (real time unless a simulation swaps it out) ---
+_clock = RealTimeClock()
+
+
+def set_clock(clock):
+    """Installs the clock used by the whole flight stack."""
+    global _clock
+    _clock = clock
+    # Imported here: sensor_acquisition reads the drivers, which use this module
+    import sensor_acquisition
+    sensor_acquisition.set_concurrent(not isinstance(clock, DiscreteEventClock))
+
+
+def get_clock():
+    return _clock
+
+
+def now():
+    """Current mission time in seconds (same epoch as time.time())."""
+    return _clock.now()
+
+
+def sleep_until(when, stop_event=None):
+    """Waits until mission time `when` (returns early if stop_event is set)."""
+    _clock.sleep_until(when, stop_event)
@@ -0,0 +1,233 @@
+"""
+monte_carlo.py
+Runs a campaign of randomized missions on top of main.run_simulation_loop.
+
+Each mission gets:
+- its own seed for the sensor noise in hardware_drivers,
+- a randomized starting water temperature,
+- a fresh DiscreteEventClock (sensors are then read inline, so a given
+  seed always gives the same result),
+- optional global_config overrides. By default the campaign runs the
+  flight task rates (CAMPAIGN_CONFIG is empty), and a full 14-day mission
+  takes about 25 s on one core, so 10,000 missions are core-days of work.
+  --coarse (COARSE_CONFIG) runs health checks and thermal control every
+  5 minutes, about 1 s per mission, but it changes the results: the
+  thermostat acts on 5-minute-old temperatures, and seed 0 drops from
+  1.00 to 0.83 time in band. Use it only to screen quickly, and never
+  compare its numbers with flight-rate ones. The report prints the
+  overrides in effect.
+
+Missions are spread across a process pool (one worker per core). Every
+worker resets the module-level simulation state before each mission, so
+one process can run many missions back to back.
+
+Usage:
+    python monte_carlo.py --missions 10000
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import random
+import statistics
+import time
+
+import actuators
+import main
+import conops_modes
+import hardware_drivers
+import global_config
+import mission_clock
+import thermal_control
+
+# Fixed epoch for the simulated clock so runs are reproducible.
+SIM_EPOCH = 1.0e9
+DEFAULT_MISSION_DURATION = global_config.EXPERIMENT_DURATION_SEC + 600
+WATER_TEMP_RANGE = (5.0, 15.0)  # °C. Initial water temperature is drawn from this range.
+
+MODES = conops_modes.MODES
+# Time in band is scored against PAY-2 as specified, not against overridden thresholds
+PLANT_BAND = (global_config.IDEAL_PLANT_TEMP_MIN, global_config.IDEAL_PLANT_TEMP_MAX)
+
+# global_config overrides applied to every campaign mission: none, the flight task rates.
+CAMPAIGN_CONFIG = {}
+# Opt-in (--coarse): about 25x faster, but the thermal results move (see above).
+# Re-asserts rewrite an unchanged actuator state; at 5-minute wakeups every
+# tick would re-assert all of them, so they happen hourly.
+COARSE_CONFIG = {
+    "HEALTH_CHECK_PERIOD_SEC": 300.0,
+    "THERMAL_CONTROL_PERIOD_SEC": 300.0,
+    "ACTUATOR_REASSERT_SEC": 3600.0,
+}
+
+
+class MissionTally:
+    """
+    Collects per-mission statistics from the on_tick hook.
+    Each tick's mode and heater states are held until the next tick,
+    so time is credited correctly even when the clock jumps ahead.
+    Mode entries come from the state itself (FlightState.mode_entries):
+    one tick can pass through several modes, e.g. at boot.
+    """
+
+    def __init__(self, start_time):
+        self.last_time = start_time
+        self.last_mode = None
+        self.last_heaters = {}
+        self.mode_time = {mode: 0.0 for mode in MODES}
+        self.mode_entries = {mode: 0 for mode in MODES}
+        self.heater_on_time = {global_config.AIR_HEATER: 0.0, global_config.WATER_HEATER: 0.0}
+        self.last_in_band = False
+        self.in_band_time = 0.0
+
+    def on_tick(self, system_state):
+        self.advance(mission_clock.now())
+        self.mode_entries = system_state.mode_entries
+        self.last_mode = system_state["current_mode"]
+        self.last_in_band = PLANT_BAND[0] <= system_state["payload_temps"]["air"] <= PLANT_BAND[1]
+        self.last_heaters = {h: hardware_drivers.get_heater_state(h) for h in self.heater_on_time}
+
+    def advance(self, now):
+        dt = now - self.last_time
+        if self.last_mode is not None and dt > 0:
+            self.mode_time[self.last_mode] = self.mode_time.get(self.last_mode, 0.0) + dt
+            if self.last_in_band:
+                self.in_band_time += dt
+            for heater, status in self.last_heaters.items():
+                if status == "ON":
+                    self.heater_on_time[heater] += dt
+        self.last_time = now
+
+
+@contextlib.contextmanager
+def config_overrides(overrides):
+    """Temporarily sets global_config constants (restored on exit)."""
+    saved = {name: getattr(global_config, name) for name in overrides}
+    try:
+        for name, value in overrides.items():
+            setattr(global_config, name, value)
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(global_config, name, value)
+
+
+def run_mission(seed, mission_duration=DEFAULT_MISSION_DURATION, water_temp_range=WATER_TEMP_RANGE,
+                overrides=CAMPAIGN_CONFIG):
+    """
+    Runs one randomized mission and returns a flat dict of results.
+    Console output from the flight code is discarded.
+    """
+    rng = random.Random(seed)
+    water_temp = rng.uniform(*water_temp_range)
+
+    hardware_drivers.reset_simulation(seed=seed, water_temp=water_temp)
+    conops_modes.reset_timers()
+    mission_clock.set_clock(mission_clock.DiscreteEventClock(start_time=SIM_EPOCH))
+
+    tally = MissionTally(SIM_EPOCH)
+    with config_overrides(overrides), contextlib.redirect_stdout(io.StringIO()):
+        main.run_simulation_loop(mission_duration=mission_duration, on_tick=tally.on_tick)
+    tally.advance(min(mission_clock.now(), SIM_EPOCH + mission_duration))
+
+    result = {
+        "seed": seed,
+        "initial_water_temp": water_temp,
+        "safe_mode_entries": tally.mode_entries.get("SAFE_MODE", 0),
+        "last_resort_entries": tally.mode_entries.get("LAST_RESORT_MODE", 0),
+        "images_captured": hardware_drivers.get_image_count(),
+        "time_in_band": tally.in_band_time / mission_duration,
+        "actuator_writes": sum(s["writes"] for s in actuators.get_stats().values()),
+    }
+    energy = hardware_drivers.get_energy_report()
+    result["energy_used_wh"] = energy["load_total_wh"]
+    result["heater_energy_wh"] = energy["load_air_heater_wh"] + energy["load_water_heater_wh"]
+    result["min_soc"] = energy["min_soc"]
+    for heater, metrics in thermal_control.get_metrics().items():
+        result[f"switches_{heater}"] = metrics["switches"]
+        result[f"out_of_band_{heater}"] = metrics["out_of_band_sec"]
+    for mode in MODES:
+        result[f"time_{mode}"] = tally.mode_time[mode]
+    for heater, on_time in tally.heater_on_time.items():
+        result[f"duty_{heater}"] = on_time / mission_duration
+    return result
+
+
+def _run_mission_star(args):
+    return run_mission(*args)
+
+
+def run_campaign(n_missions, base_seed=0, processes=None,
+                 mission_duration=DEFAULT_MISSION_DURATION, water_temp_range=WATER_TEMP_RANGE,
+                 overrides=CAMPAIGN_CONFIG):
+    """
+    Runs n_missions randomized missions across a process pool.
+    Mission i uses seed base_seed + i. Returns the list of result dicts,
+    ordered by seed.
+    """
+    jobs = [(base_seed + i, mission_duration, water_temp_range, overrides) for i in range(n_missions)]
+    processes = processes or multiprocessing.cpu_count()
+
+    if processes == 1:
+        results = [_run_mission_star(job) for job in jobs]
+    else:
+        chunksize = max(1, n_missions // (processes * 8))
+        with multiprocessing.Pool(processes) as pool:
+            results = list(pool.imap_unordered(_run_mission_star, jobs, chunksize=chunksize))
+
+    results.sort(key=lambda r: r["seed"])
+    return results
+
+
+def summarize(results):
+    """
+    Reduces per-mission results to summary statistics
+    (mean, stdev, min, p5, p50, p95, max) for every numeric metric.
+    """
+    summary = {}
+    for key in results[0]:
+        if key == "seed":
+            continue
+        values = sorted(r[key] for r in results)
+        n = len(values)
+        summary[key] = {
+            "mean": statistics.fmean(values),
+            "stdev": statistics.pstdev(values),
+            "min": values[0],
+            "p5": values[int(0.05 * (n - 1))],
+            "p50": values[int(0.50 * (n - 1))],
+            "p95": values[int(0.95 * (n - 1))],
+            "max": values[-1],
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'metric':<34}{'mean':>12}{'stdev':>12}{'min':>12}{'p50':>12}{'p95':>12}{'max':>12}")
+    for key, s in summary.items():
+        print(f"{key:<34}{s['mean']:>12.3f}{s['stdev']:>12.3f}{s['min']:>12.3f}"
+              f"{s['p50']:>12.3f}{s['p95']:>12.3f}{s['max']:>12.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pathfinder Monte Carlo mission campaign")
+    parser.add_argument("--missions", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Worker processes (default: all cores).")
+    parser.add_argument("--duration", type=float, default=DEFAULT_MISSION_DURATION,
+                        help="Mission time per run, in seconds.")
+    parser.add_argument("--coarse", action="store_true",
+                        help="5-minute health checks and thermostat: much faster, but not flight-representative.")
+    args = parser.parse_args()
+    overrides = COARSE_CONFIG if args.coarse else CAMPAIGN_CONFIG
+
+    t0 = time.perf_counter()
+    results = run_campaign(args.missions, args.seed, args.processes, args.duration, overrides=overrides)
+    elapsed = time.perf_counter() - t0
+
+    print(f"--- Monte Carlo: {args.missions} missions in {elapsed:.1f} s "
+          f"({args.missions / elapsed:.2f} missions/s) ---")
+    print("Overrides: " + (", ".join(f"{k}={v}" for k, v in overrides.items()) or "none (flight task rates)"))
+    print_summary(summarize(results))
@@ -0,0 +1,192 @@
+"""
+scheduler.py
+Deadline-driven task scheduler for the flight loop.
+
+Instead of waking every MAIN_LOOP_DELAY and re-checking everything, each
+job is a task with its own next fire time, kept in a heap. The loop
+sleeps (through mission_clock) until the earliest deadline, runs every
+task that is due, and goes back to sleep.
+
+A task's function may return the absolute time it wants to run next.
+If it returns None, a periodic task is rescheduled one period after its
+previous deadline (no drift) and a one-shot task is dropped.
+
+Per-task statistics: runs, start jitter (actual start minus deadline,
+in mission time), run time, and overruns (run time longer than the
+period, or whole periods skipped because the task fell behind). They
+outlive the task: a finished or cancelled one-shot stays in report(),
+and a task added again under the same name carries on counting.
+"""
+
+import heapq
+import itertools
+import time
+
+import mission_clock
+
+
+class Task:
+    def __init__(self, name, fn, period=None, priority=10):
+        self.name = name
+        self.fn = fn
+        self.period = period
+        self.priority = priority
+        self.due = None
+        self.version = 0  # Bumped on reschedule; stale heap entries are skipped
+
+        # Statistics
+        self.runs = 0
+        self.overruns = 0
+        self.jitter_total = 0.0
+        self.jitter_max = 0.0
+        self.runtime_total = 0.0
+        self.runtime_max = 0.0
+
+    def carry_over(self, other):
+        """Continues the statistics of an earlier task with the same name."""
+        self.runs, self.overruns = other.runs, other.overruns
+        self.jitter_total, self.jitter_max = other.jitter_total, other.jitter_max
+        self.runtime_total, self.runtime_max = other.runtime_total, other.runtime_max
+
+    def stats(self):
+        runs = max(self.runs, 1)
+        return {
+            "runs": self.runs,
+            "period": self.period,
+            "overruns": self.overruns,
+            "jitter_mean": self.jitter_total / runs,
+            "jitter_max": self.jitter_max,
+            "runtime_mean": self.runtime_total / runs,
+            "runtime_max": self.runtime_max,
+        }
+
+
+class Scheduler:
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self.tasks = {}
+        self.finished = {}  # name -> one-shot task that ran or was cancelled, for report()
+        self.wakeups = 0
+
+    # --- Adding / Moving Tasks ---
+
+    def add_periodic(self, name, period, fn, start=None, priority=10):
+        """Runs fn every `period` seconds, first at `start` (default: now)."""
+        task = self._add(Task(name, fn, period, priority))
+        self.schedule(name, mission_clock.now() if start is None else start)
+        return task
+
+    def add_oneshot(self, name, when, fn, priority=10):
+        """Runs fn once at absolute mission time `when`."""
+        task = self._add(Task(name, fn, None, priority))
+        self.schedule(name, when)
+        return task
+
+    def _add(self, task):
+        earlier = self.tasks.get(task.name) or self.finished.pop(task.name, None)
+        if earlier is not None:
+            task.carry_over(earlier)
+        self.tasks[task.name] = task
+        return task
+
+    def schedule(self, name, when):
+        """(Re)schedules a task to run at `when`, replacing any earlier deadline."""
+        task = self.tasks[name]
+        task.due = when
+        task.version += 1
+        heapq.heappush(self._heap, (when, task.priority, next(self._counter), task.version, task))
+
+    def cancel(self, name):
+        task = self.tasks.pop(name, None)
+        if task:
+            task.version += 1
+            self.finished[name] = task
+
+    def next_deadline(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        while self._heap:
+            _, _, _, version, task = self._heap[0]
+            if version == task.version and self.tasks.get(task.name) is task:
+                return
+            heapq.heappop(self._heap)
+
+    # --- Running ---
+
+    def run_pending(self):
+        """Runs every task whose deadline has passed, in (deadline, priority) order."""
+        now = mission_clock.now()
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return
+            due, _, _, _, task = heapq.heappop(self._heap)
+            task.version += 1  # This entry is consumed
+            self._run(task, due)
+            now = mission_clock.now()
+
+    def _run(self, task, due):
+        start = mission_clock.now()
+        t0 = time.perf_counter()
+        next_due = task.fn()
+        runtime = time.perf_counter() - t0
+
+        jitter = start - due
+        task.runs += 1
+        task.jitter_total += jitter
+        task.jitter_max = max(task.jitter_max, jitter)
+        task.runtime_total += runtime
+        task.runtime_max = max(task.runtime_max, runtime)
+
+        if self.tasks.get(task.name) is not task:
+            return  # Cancelled while running
+        if next_due is not None:
+            self.schedule(task.name, next_due)
+        elif task.period is not None:
+            if runtime > task.period:
+                task.overruns += 1
+            next_due = due + task.period
+            now = mission_clock.now()
+            if next_due <= now:
+                # Fell behind: skip the missed periods instead of bursting
+                missed = int((now - next_due) // task.period) + 1
+                task.overruns += missed
+                next_due += missed * task.period
+            self.schedule(task.name, next_due)
+        else:
+            del self.tasks[task.name]
+            self.finished[task.name] = task
+
+    def run(self, until=None, stop_event=None, on_wakeup=None):
+        """
+        Sleeps until the earliest deadline, runs what is due, repeats.
+        on_wakeup() is called after the due tasks of each wakeup ran.
+        Stops when there is nothing left to run, at mission time `until`,
+        or when stop_event is set.
+        """
+        while not (stop_event and stop_event.is_set()):
+            deadline = self.next_deadline()
+            if deadline is None:
+                return
+            if until is not None and deadline >= until:
+                mission_clock.sleep_until(until, stop_event)
+                return
+            mission_clock.sleep_until(deadline, stop_event)
+            self.wakeups += 1
+            self.run_pending()
+            if on_wakeup:
+                on_wakeup()
+
+    def report(self):
+        tasks = dict(self.finished, **self.tasks)
+        return {name: task.stats() for name, task in tasks.items()}
+
+    def print_report(self):
+        print(f"[Scheduler] {self.wakeups} wakeups")
+        print(f"{'task':<12}{'runs':>10}{'overruns':>10}{'jitter mean':>14}{'jitter max':>12}{'run mean (ms)':>15}{'run max (ms)':>14}")
+        for name, s in self.report().items():
+            print(f"{name:<12}{s['runs']:>10}{s['overruns']:>10}{s['jitter_mean']:>14.4f}{s['jitter_max']:>12.4f}"
+                  f"{s['runtime_mean'] * 1000:>15.3f}{s['runtime_max'] * 1000:>14.3f}")
@@ -0,0 +1,306 @@
+"""
+sensor_acquisition.py
+Concurrent sensor reads with a deadline per sensor.
+
+On the flight hardware the health sensors sit on different buses
+(ADC for the battery, the SoC's own thermal zone, the BME280 on I2C,
+a 1-Wire probe in the water loop). Reading them one after another makes
+a health check cost the *sum* of all bus transactions.
+
+Here every bus gets its own single worker thread, so sensors on
+different buses are read at the same time while reads on one bus stay
+serialized (as the bus requires). acquire_all() waits at most until
+each sensor's deadline (SENSOR_DEADLINES_SEC), so a health check costs
+about as long as the slowest sensor, never more than the largest deadline.
+
+A sensor that misses its deadline, raises, or is still busy with an
+earlier read is reported stale and keeps its last good value. Every
+completed read (even a late one) goes into that sensor's latency
+histogram, available from get_stats().
+
+set_concurrent(False) reads the sensors one after another in the calling
+thread instead, with no deadlines. That is only for drivers that cannot
+block (trace replay, fast simulations), where thread hand-offs would
+cost more than the reads and wall-clock deadlines would make runs
+non-deterministic. mission_clock.set_clock() makes that switch whenever
+a DiscreteEventClock is installed (and back for a real clock).
+
+run_concurrently() uses the same switch for other independent driver
+calls, such as the boot self-tests and power-on steps.
+"""
+
+import bisect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import global_config
+import hardware_drivers
+
+# --- Sensor Table ---
+# name -> (bus, read function). The functions look hardware_drivers up at
+# call time so simulations can swap the drivers out.
+SENSORS = {
+    "battery_voltage": ("adc", lambda: hardware_drivers.read_voltage_sensor()),
+    "pi_temp": ("soc", lambda: hardware_drivers.read_temp_sensor(global_config.PI_TEMP_SENSOR)),
+    "air_temp": ("i2c1", lambda: hardware_drivers.read_temp_sensor(global_config.AIR_TEMP_SENSOR)),
+    "water_temp": ("onewire", lambda: hardware_drivers.read_temp_sensor(global_config.WATER_TEMP_SENSOR)),
+}
+
+# Upper edges of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf"))
+
+
+class LatencyHistogram:
+    def __init__(self, edges=LATENCY_BUCKETS_MS):
+        self.edges = edges
+        self.counts = [0] * len(edges)
+        self.total = 0
+        self.max_ms = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000.0
+        self.counts[bisect.bisect_left(self.edges, ms)] += 1
+        self.total += 1
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile (ms)."""
+        if not self.total:
+            return 0.0
+        rank = p / 100.0 * self.total
+        seen = 0
+        for edge, count in zip(self.edges, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(edge, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            "buckets_ms": {("inf" if e == float("inf") else e): c for e, c in zip(self.edges, self.counts)},
+            "count": self.total,
+            "p50_ms": self.percentile(50),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+        }
+
+
+class Reading:
+    """One sensor's result from acquire_all()."""
+    __slots__ = ("value", "stale", "latency")
+
+    def __init__(self, value, stale, latency):
+        self.value = value      # Fresh value, or the last good one if stale (None if never read)
+        self.stale = stale
+        self.latency = latency  # Seconds, or None if the read did not finish in time
+
+    def __repr__(self):
+        return f"Reading({self.value!r}, stale={self.stale})"
+
+
+class SensorAcquisition:
+    def __init__(self, sensors=None, deadlines=None, concurrent=True):
+        self.concurrent = concurrent
+        self.sensors = dict(SENSORS if sensors is None else sensors)
+        self.deadlines = dict(global_config.SENSOR_DEADLINES_SEC if deadlines is None else deadlines)
+        self._buses = {}
+        for bus, _ in self.sensors.values():
+            if bus not in self._buses:
+                self._buses[bus] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"bus_{bus}")
+
+        self._lock = threading.Lock()
+        self._last_good = {name: None for name in self.sensors}
+        self._in_flight = {}
+        self.histograms = {name: LatencyHistogram() for name in self.sensors}
+        self.stats = {name: {"reads": 0, "stale": 0, "errors": 0} for name in self.sensors}
+
+    def _timed_read(self, name, read):
+        t0 = time.perf_counter()
+        try:
+            return read(), time.perf_counter() - t0
+        finally:
+            with self._lock:
+                self.histograms[name].add(time.perf_counter() - t0)
+
+    def _finished(self, name, future):
+        # Runs when a read completes, even one acquire_all() stopped waiting for
+        with self._lock:
+            self._in_flight.pop(name, None)
+            if future.exception() is None:
+                self._last_good[name] = future.result()[0]
+            else:
+                self.stats[name]["errors"] += 1
+
+    def acquire_all(self):
+        """
+        Reads every sensor concurrently. Returns {name: Reading}.
+        Blocks for at most the largest deadline.
+        """
+        if not self.concurrent:
+            return self._acquire_inline()
+        t0 = time.perf_counter()
+        futures = {}
+        for name, (bus, read) in self.sensors.items():
+            with self._lock:
+                busy = self._in_flight.get(name)
+                if busy is not None and not busy.done():
+                    continue  # Previous read is still stuck on the bus; don't queue behind it
+                future = self._buses[bus].submit(self._timed_read, name, read)
+                self._in_flight[name] = future
+            future.add_done_callback(lambda f, name=name: self._finished(name, f))
+            futures[name] = future
+
+        # Check each sensor at its own deadline, tightest first
+        readings = {}
+        for name in sorted(self.sensors, key=self._deadline):
+            future = futures.get(name)
+            if future is not None:
+                wait([future], timeout=max(0.0, t0 + self._deadline(name) - time.perf_counter()))
+            ok = future is not None and future.done() and future.exception() is None
+            with self._lock:
+                self.stats[name]["reads"] += 1
+                if ok:
+                    value, latency = future.result()
+                    self._last_good[name] = value
+                    readings[name] = Reading(value, False, latency)
+                else:
+                    self.stats[name]["stale"] += 1
+                    readings[name] = Reading(self._last_good[name], True, None)
+        return readings
+
+    def _acquire_inline(self):
+        # Inline reads come from drivers that never touch a bus (fast
+        # simulations, replay), so their latency is not measured: timing
+        # them cost more than the reads themselves.
+        readings = {}
+        with self._lock:
+            for name, (_, read) in self.sensors.items():
+                stats = self.stats[name]
+                stats["reads"] += 1
+                try:
+                    value = read()
+                except Exception:
+                    value = None
+                if value is None:
+                    stats["errors"] += 1
+                    stats["stale"] += 1
+                    readings[name] = Reading(self._last_good[name], True, None)
+                else:
+                    self._last_good[name] = value
+                    readings[name] = Reading(value, False, 0.0)
+        return readings
+
+    def reset(self):
+        """Forgets last good values and statistics (a new boot or simulated mission)."""
+        with self._lock:
+            self._last_good = {name: None for name in self.sensors}
+            self.histograms = {name: LatencyHistogram() for name in self.sensors}
+            self.stats = {name: {"reads": 0, "stale": 0, "errors": 0} for name in self.sensors}
+
+    def _deadline(self, name):
+        return self.deadlines.get(name, max(self.deadlines.values(), default=1.0))
+
+    def get_stats(self):
+        with self._lock:
+            return {name: dict(self.stats[name], latency=self.histograms[name].as_dict())
+                    for name in self.sensors}
+
+    def shutdown(self):
+        for executor in self._buses.values():
+            executor.shutdown(wait=False)
+
+
+# --- Module-level acquisition used by system_health ---
+_acquisition = None
+_concurrent = True
+
+
+def acquire_all():
+    """Reads all health sensors concurrently (see SensorAcquisition.acquire_all)."""
+    global _acquisition
+    if _acquisition is None:
+        _acquisition = SensorAcquisition(concurrent=_concurrent)
+    return _acquisition.acquire_all()
+
+
+def reset():
+    """Clears the module acquisition's last good values and statistics."""
+    if _acquisition is not None:
+        _acquisition.reset()
+
+
+def set_concurrent(enabled):
+    """Switches between threaded reads with deadlines and plain in-thread reads."""
+    global _concurrent
+    _concurrent = enabled
+    if _acquisition is not None:
+        _acquisition.concurrent = enabled
+
+
+def run_concurrently(*calls):
+    """
+    Runs independent driver calls at the same time and returns their
+    results in order; the first exception is re-raised. With
+    set_concurrent(False) they run one after another in this thread.
+    """
+    if not _concurrent or len(calls) < 2:
+        return [call() for call in calls]
+    with ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="driver") as pool:
+        futures = [pool.submit(call) for call in calls]
+        return [future.result() for future in futures]
+
+
+def get_concurrent():
+    return _concurrent
+
+
+def get_stats():
+    return _acquisition.get_stats() if _acquisition is not None else {}
+
+
+if __name__ == "__main__":
+    import random
+
+    # Mock bus latencies (s) in the range of the real parts; one sensor hangs now and then.
+    delays = {"battery_voltage": 0.002, "pi_temp": 0.001, "air_temp": 0.030, "water_temp": 0.020}
+    rng = random.Random(0)
+
+    def slow(name, value):
+        def read():
+            delay = delays[name] * rng.uniform(0.8, 1.2)
+            if name == "water_temp" and rng.random() < 0.1:
+                delay = 0.4  # 1-Wire probe stuck, longer than its deadline
+            time.sleep(delay)
+            return value
+        return read
+
+    sensors = {name: (bus, slow(name, i)) for i, (name, (bus, _)) in enumerate(SENSORS.items())}
+    n = 100
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        for _, read in sensors.values():
+            read()
+    sequential = (time.perf_counter() - t0) / n
+
+    acquisition = SensorAcquisition(sensors)
+    worst = 0.0
+    stale = 0
+    t0 = time.perf_counter()
+    for _ in range(n):
+        t1 = time.perf_counter()
+        readings = acquisition.acquire_all()
+        worst = max(worst, time.perf_counter() - t1)
+        stale += sum(r.stale for r in readings.values())
+    concurrent = (time.perf_counter() - t0) / n
+
+    print(f"--- Sensor acquisition: {n} health checks, {len(sensors)} sensors ---")
+    print(f"sequential  {sequential * 1000:7.2f} ms/check (sum of sensors)")
+    print(f"concurrent  {concurrent * 1000:7.2f} ms/check, worst {worst * 1000:.2f} ms "
+          f"(largest deadline {max(acquisition.deadlines.values()) * 1000:.0f} ms), {stale} stale readings")
+    for name, s in acquisition.get_stats().items():
+        latency = s["latency"]
+        print(f"{name:<16} reads {s['reads']:>4}  stale {s['stale']:>3}  "
+              f"p50 {latency['p50_ms']:7.2f} ms  p99 {latency['p99_ms']:7.2f} ms  max {latency['max_ms']:7.2f} ms")
+    acquisition.shutdown()
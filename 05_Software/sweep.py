@@ -0,0 +1,268 @@
+"""
+sweep.py
+Parallel grid / random-search sweep over global_config constants, with
+simulated missions cached on disk.
+
+Each configuration is a set of global_config overrides on top of a base
+configuration: the flight task rates (monte_carlo.CAMPAIGN_CONFIG), or
+with --coarse monte_carlo.COARSE_CONFIG, which is much faster but moves
+the thermal results. It runs --seeds missions through
+monte_carlo.run_mission in a process pool and is scored on:
+- energy_used_wh      (lower is better),
+- time_in_band        (share of the mission with the air in PAY-2, higher),
+- images_captured     (higher),
+- safe_mode_entries   (lower).
+Each metric is scaled to 0..1 across the sweep (1 = best seen) and the
+weighted sum (--weights) ranks the table.
+
+Every mission result is memoized in SWEEP_CACHE_DIR under a hash of the
+full effective configuration (every global_config constant after the
+base and the overrides), the seed, the mission duration and the flight
+software source. Missions run on the simulated clock, which reads the
+sensors inline (no wall-clock deadlines), so a seed and a configuration
+always give the same result and a cached point can be reproduced.
+Re-running a sweep, adding seeds or widening a range only simulates the
+new points; editing any .py file here starts a fresh cache.
+
+    python sweep.py --param SAFE_MODE_VOLTAGE=3.4:3.6:3 --param IMAGE_INTERVAL_SEC=300,600
+    python sweep.py --param IDEAL_PLANT_TEMP_MIN=18:21 --random 20 --seeds 2 --coarse
+"""
+
+import argparse
+import glob
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+import global_config
+import monte_carlo
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# metric -> +1 if higher is better, -1 if lower is better
+OBJECTIVES = {
+    "energy_used_wh": -1,
+    "time_in_band": +1,
+    "images_captured": +1,
+    "safe_mode_entries": -1,
+}
+
+
+# --- Parameters ---
+
+def parse_param(spec):
+    """
+    "NAME=lo:hi[:steps]" (a range; grid steps default to 5) or
+    "NAME=v1,v2,..." (a list). Returns (name, values or (lo, hi, steps)).
+    """
+    name, _, values = spec.partition("=")
+    if not hasattr(global_config, name) or not isinstance(getattr(global_config, name), (int, float)) \
+            or isinstance(getattr(global_config, name), bool):
+        raise ValueError(f"{name} is not a numeric global_config constant")
+    kind = type(getattr(global_config, name))
+    if ":" in values:
+        parts = values.split(":")
+        steps = int(parts[2]) if len(parts) > 2 else 5
+        return name, (float(parts[0]), float(parts[1]), steps)
+    return name, [kind(float(v)) for v in values.split(",")]
+
+
+def _typed(name, value):
+    return int(round(value)) if isinstance(getattr(global_config, name), int) else float(value)
+
+
+def grid(params):
+    """Every combination of the parameter values."""
+    axes = []
+    for name, values in params:
+        if isinstance(values, tuple):
+            lo, hi, steps = values
+            values = [_typed(name, v) for v in np.linspace(lo, hi, steps)]
+        axes.append([(name, v) for v in dict.fromkeys(values)])  # Integer ranges can repeat
+    return [dict(combo) for combo in itertools.product(*axes)]
+
+
+def random_points(params, n, seed=0):
+    """n configurations drawn uniformly from the ranges (or from the lists)."""
+    rng = random.Random(seed)
+    points = []
+    for _ in range(n):
+        point = {}
+        for name, values in params:
+            if isinstance(values, tuple):
+                point[name] = _typed(name, rng.uniform(values[0], values[1]))
+            else:
+                point[name] = rng.choice(values)
+        points.append(point)
+    return points
+
+
+# --- Cache ---
+
+def source_fingerprint():
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(SOURCE_DIR, "*.py"))):
+        with open(path, "rb") as f:
+            h.update(os.path.basename(path).encode() + f.read())
+    return h.hexdigest()
+
+
+def effective_config(overrides):
+    """Every global_config constant as the mission will see it."""
+    config = {name: getattr(global_config, name) for name in dir(global_config) if name.isupper()}
+    config.update(overrides)
+    return config
+
+
+def cache_key(overrides, seed, duration, fingerprint):
+    blob = json.dumps({"config": effective_config(overrides), "seed": seed, "duration": duration,
+                       "source": fingerprint}, sort_keys=True, default=repr)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """One JSON file per mission result, written atomically."""
+
+    def __init__(self, directory=global_config.SWEEP_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, result):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+
+
+# --- Running ---
+
+def _run_job(job):
+    key, overrides, seed, duration, cache_dir = job
+    result = monte_carlo.run_mission(seed, duration, overrides=overrides)
+    ResultCache(cache_dir).put(key, result)  # From the worker, so a crash loses only running missions
+    return key, result
+
+
+def run_sweep(points, seeds=1, base_seed=0, duration=monte_carlo.DEFAULT_MISSION_DURATION,
+              processes=None, cache_dir=global_config.SWEEP_CACHE_DIR, base=monte_carlo.CAMPAIGN_CONFIG):
+    """
+    Runs (or looks up) every point x seed, with the point's overrides on
+    top of `base`. Returns (rows, stats): one row per point with its
+    overrides and the mean of each metric over seeds.
+    """
+    cache = ResultCache(cache_dir)
+    fingerprint = source_fingerprint()
+    results, jobs = {}, []
+    for point in points:
+        overrides = dict(base, **point)
+        for seed in range(base_seed, base_seed + seeds):
+            key = cache_key(overrides, seed, duration, fingerprint)
+            cached = cache.get(key)
+            if cached is not None:
+                results[key] = cached
+            elif key not in results:
+                results[key] = None
+                jobs.append((key, overrides, seed, duration, cache_dir))
+
+    processes = min(processes or multiprocessing.cpu_count(), max(len(jobs), 1))
+    if processes == 1:
+        for key, result in map(_run_job, jobs):
+            results[key] = result
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            for key, result in pool.imap_unordered(_run_job, jobs):
+                results[key] = result
+
+    rows = []
+    for point in points:
+        overrides = dict(base, **point)
+        runs = [results[cache_key(overrides, seed, duration, fingerprint)]
+                for seed in range(base_seed, base_seed + seeds)]
+        rows.append({"config": point, **{m: float(np.mean([r[m] for r in runs])) for m in OBJECTIVES}})
+    return rows, {"points": len(points), "missions": len(points) * seeds, "simulated": len(jobs)}
+
+
+def rank(rows, weights=None):
+    """Adds a 0..1-per-metric weighted "score" to each row and sorts best first."""
+    weights = weights or {m: 1.0 for m in OBJECTIVES}
+    for row in rows:
+        row["score"] = 0.0
+    for metric, direction in OBJECTIVES.items():
+        values = np.array([row[metric] for row in rows]) * direction
+        span = values.max() - values.min()
+        scaled = (values - values.min()) / span if span > 0 else np.ones_like(values)
+        for row, s in zip(rows, scaled):
+            row["score"] += weights.get(metric, 0.0) * float(s)
+    return sorted(rows, key=lambda row: -row["score"])
+
+
+def print_table(rows, top=None):
+    names = list(rows[0]["config"]) if rows else []
+    header = "".join(f"{n:>22}" for n in names)
+    print(f"{'rank':>4}{'score':>8}{header}{'energy (Wh)':>13}{'in band':>9}{'images':>8}{'safe entries':>14}")
+    for i, row in enumerate(rows[:top], 1):
+        values = "".join(f"{row['config'][n]:>22g}" for n in names)
+        print(f"{i:>4}{row['score']:>8.2f}{values}{row['energy_used_wh']:>13.1f}{row['time_in_band']:>9.3f}"
+              f"{row['images_captured']:>8.0f}{row['safe_mode_entries']:>14.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Threshold-tuning sweep over global_config constants")
+    parser.add_argument("--param", action="append", required=True,
+                        help="NAME=lo:hi[:steps] or NAME=v1,v2,... (repeat for more constants).")
+    parser.add_argument("--random", type=int, default=None, metavar="N",
+                        help="Random search with N points instead of the full grid.")
+    parser.add_argument("--seeds", type=int, default=1, help="Missions per configuration.")
+    parser.add_argument("--seed", type=int, default=0, help="First mission seed (and random-search seed).")
+    parser.add_argument("--duration", type=float, default=monte_carlo.DEFAULT_MISSION_DURATION)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--coarse", action="store_true",
+                        help="Base on 5-minute health checks and thermostat: much faster, but not flight-representative.")
+    parser.add_argument("--weights", default="",
+                        help="metric=weight,... over " + ", ".join(OBJECTIVES) + " (default 1 each).")
+    parser.add_argument("--cache", default=global_config.SWEEP_CACHE_DIR)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", default=None, help="Write the ranked rows as JSON.")
+    args = parser.parse_args()
+
+    params = [parse_param(spec) for spec in args.param]
+    points = random_points(params, args.random, args.seed) if args.random else grid(params)
+    weights = {m: 1.0 for m in OBJECTIVES}
+    for item in filter(None, args.weights.split(",")):
+        metric, _, weight = item.partition("=")
+        if metric not in OBJECTIVES:
+            parser.error(f"unknown metric {metric}")
+        weights[metric] = float(weight)
+
+    base = monte_carlo.COARSE_CONFIG if args.coarse else monte_carlo.CAMPAIGN_CONFIG
+
+    t0 = time.perf_counter()
+    rows, stats = run_sweep(points, args.seeds, args.seed, args.duration, args.processes, args.cache, base)
+    elapsed = time.perf_counter() - t0
+    rows = rank(rows, weights)
+    print(f"--- Sweep: {stats['points']} configurations x {args.seeds} seeds, {stats['simulated']} of "
+          f"{stats['missions']} missions simulated ({stats['missions'] - stats['simulated']} cached) "
+          f"in {elapsed:.1f} s ---")
+    print("Base: " + (", ".join(f"{k}={v}" for k, v in base.items()) or "flight task rates"))
+    print_table(rows, args.top)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
@@ -6,8 +6,12 @@ This module is responsible for two things:
 2. `run_payload_thermal_control()`: The thermostat logic for the plants.
 """
 
-import hardware_drivers
+import actuators
+import flight_log
 import global_config
+import mission_clock
+import sensor_acquisition
+import thermal_control
 
 def check_all_systems(system_state):
     """
@@ -15,20 +19,30 @@ def check_all_systems(system_state):
     This function can FORCE a mode change if a fault is detected.
     """
     
-    # 1. Read Health Sensors
-    system_state["battery_voltage"] = hardware_drivers.read_voltage_sensor()
-    system_state["pi_temp"] = hardware_drivers.read_temp_sensor(global_config.PI_TEMP_SENSOR)
+    # 1. Read Health + Payload Sensors (concurrently, see sensor_acquisition.py)
+    # A stale sensor keeps its last good value; one never read yet is left alone.
+    readings = sensor_acquisition.acquire_all()
+    for name, key in (("battery_voltage", "battery_voltage"), ("pi_temp", "pi_temp")):
+        if readings[name].value is not None:
+            system_state[key] = readings[name].value
+    for name, key in (("air_temp", "air"), ("water_temp", "water")):
+        if readings[name].value is not None:
+            system_state["payload_temps"][key] = readings[name].value
+    stale = tuple(name for name, reading in readings.items() if reading.stale)
+    if stale != system_state.get("stale_sensors", ()):
+        if stale:
+            flight_log.warning("Health", "Stale sensors: %s", ", ".join(stale))
+        system_state["stale_sensors"] = stale
     
-    # 2. Read Payload Sensors
-    system_state["payload_temps"]["air"] = hardware_drivers.read_temp_sensor(global_config.AIR_TEMP_SENSOR)
-    system_state["payload_temps"]["water"] = hardware_drivers.read_temp_sensor(global_config.WATER_TEMP_SENSOR)
-    
-    # 3. Check for Faults
+    # 2. Check for Faults
     
     # --- Voltage Faults (Ref: EPS-2)
-    current_voltage = system_state["battery_voltage"]
+    current_voltage = readings["battery_voltage"].value
     
-    if current_voltage < global_config.LAST_RESORT_VOLTAGE:
+    if current_voltage is None:
+        # No voltage reading yet; don't act on the 0 V placeholder
+        pass
+    elif current_voltage < global_config.LAST_RESORT_VOLTAGE:
         # CRITICAL: This overrides everything
         system_state["current_mode"] = "LAST_RESORT_MODE"
         
@@ -36,35 +50,30 @@ def check_all_systems(system_state):
         # Low power, but not critical. Shed load.
         # Don't interrupt startup or a transmit.
         if system_state["current_mode"] in ["EXPERIMENT_MODE", "PRE_EXPERIMENT_HEATING"]:
-            print(f"[Health] Low voltage ({current_voltage}V). Forcing SAFE_MODE.")
+            flight_log.warning("Health", "Low voltage (%sV). Forcing SAFE_MODE.", current_voltage)
             system_state["current_mode"] = "SAFE_MODE"
             
     elif current_voltage > global_config.RECOVERED_VOLTAGE:
         # If we were in a low-power state, we can now recover
         if system_state["current_mode"] == "LAST_RESORT_MODE":
-            print(f"[Health] Voltage recovered ({current_voltage}V). Returning to SAFE_MODE.")
+            flight_log.info("Health", "Voltage recovered (%sV). Returning to SAFE_MODE.", current_voltage)
             system_state["current_mode"] = "SAFE_MODE"
 
     # --- Temperature Faults
     if system_state["pi_temp"] > global_config.MAX_PI_TEMP:
-        print(f"[Health] CRITICAL: Pi overheating ({system_state['pi_temp']}°C). Forcing SAFE_MODE.")
+        flight_log.critical("Health", "Pi overheating (%s°C). Forcing SAFE_MODE.", system_state["pi_temp"])
         system_state["current_mode"] = "SAFE_MODE"
         # Add logic to power cycle or shut down if necessary
 
 def run_payload_thermal_control(system_state):
     """
     Thermostat logic to meet MO-1.
-    Keeps payload air temp within the "optimal" range (PAY-2).
+    Keeps payload air temp within the "optimal" range (PAY-2) and the
+    water above MIN_WATER_TEMP (PAY-3), with the controller selected by
+    THERMAL_CONTROLLER (see thermal_control.py).
     """
-    air_temp = system_state["payload_temps"]["air"]
-    
-    # Use the "optimal" range (PAY-2) as the target
-    if air_temp < global_config.IDEAL_PLANT_TEMP_MIN:
-        # Too cold, turn heater on
-        hardware_drivers.set_heater(global_config.AIR_HEATER, "ON")
-    elif air_temp > global_config.IDEAL_PLANT_TEMP_MAX:
-        # Too hot, turn heater off (passive cooling)
-        hardware_drivers.set_heater(global_config.AIR_HEATER, "OFF")
-    else:
-        # In the sweet spot, turn heater off to save power
-        hardware_drivers.set_heater(global_config.AIR_HEATER, "OFF")
+    temps = system_state["payload_temps"]
+    leds_on = actuators.get_commanded(actuators.LEDS) == "ON"  # LED heat is part of the prediction
+    heaters = thermal_control.update(mission_clock.now(), temps["air"], temps["water"], leds_on)
+    for heater, on in heaters.items():
+        actuators.set_heater(heater, "ON" if on else "OFF")
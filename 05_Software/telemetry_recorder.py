@@ -0,0 +1,287 @@
+"""
+telemetry_recorder.py
+Append-only binary telemetry recorder and indexed reader.
+
+Every tick of main.run_simulation_loop is written as one fixed-width
+40-byte record into a pre-allocated, memory-mapped ring file:
+- The file is created once at its full size, so the SD card never sees
+  a growing file or a per-tick open/close.
+- When the ring is full the oldest records are overwritten, so disk and
+  memory use are fixed by TELEMETRY_CAPACITY.
+- Dirty pages are flushed every TELEMETRY_FLUSH_INTERVAL records, which
+  bounds how much data a reset can lose and how often we write.
+
+File layout:
+    [header 64 B][mode index: MODE_INDEX_CAPACITY x 24 B][records: capacity x 40 B]
+
+Records are written in time order, so the reader finds any time window
+with a binary search (no scan). A record older than the newest one (a
+reopened file from an earlier run, or a clock that went back) starts
+the ring over rather than break that order. Mode changes are also logged into a small
+index, so "all EXPERIMENT_MODE data" is a handful of window lookups.
+"""
+
+import mmap
+import os
+import struct
+
+import numpy as np
+
+import conops_modes
+import flight_log
+import hardware_drivers
+import global_config
+import mission_clock
+
+MAGIC = b"PFTLM\x00\x00\x01"
+VERSION = 1
+
+# magic, version, record_size, capacity, record_count, mode_index_count
+HEADER = struct.Struct("<8sIIQQQ")
+HEADER_SIZE = 64
+COUNTS_OFFSET = 24  # Offset of (record_count, mode_index_count) in the header
+COUNTS = struct.Struct("<QQ")
+
+# time, mode, voltage, pi, air, substrate, water, soil moisture, humidity, flags
+RECORD = struct.Struct("<dBfffffffB2x")
+RECORD_SIZE = RECORD.size  # 40 bytes
+
+# sequence number of the first record in the new mode, time, mode
+MODE_ENTRY = struct.Struct("<QdB7x")
+MODE_INDEX_CAPACITY = 4096
+
+# Bits in the record "flags" byte
+FLAG_AIR_HEATER = 0x01
+FLAG_WATER_HEATER = 0x02
+FLAG_LEDS = 0x04
+
+# Same layout as RECORD, for zero-copy reads with NumPy
+RECORD_DTYPE = np.dtype([
+    ("time", "<f8"), ("mode", "u1"),
+    ("battery_voltage", "<f4"), ("pi_temp", "<f4"),
+    ("air_temp", "<f4"), ("substrate_temp", "<f4"), ("water_temp", "<f4"),
+    ("soil_moisture", "<f4"), ("humidity", "<f4"),
+    ("flags", "u1"), ("_pad", "V2"),
+])
+
+UNKNOWN_MODE = 255
+_MODE_CODES = {mode: i for i, mode in enumerate(conops_modes.MODES)}
+
+
+def _file_size(capacity):
+    return HEADER_SIZE + MODE_INDEX_CAPACITY * MODE_ENTRY.size + capacity * RECORD_SIZE
+
+
+class TelemetryRecorder:
+    """
+    Writes one record per tick into the ring file.
+    Reopening an existing file with the same capacity keeps appending,
+    unless the first new record is older than the newest stored one.
+    """
+
+    def __init__(self, path=global_config.TELEMETRY_FILE,
+                 capacity=global_config.TELEMETRY_CAPACITY,
+                 flush_interval=global_config.TELEMETRY_FLUSH_INTERVAL):
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.records_offset = HEADER_SIZE + MODE_INDEX_CAPACITY * MODE_ENTRY.size
+
+        size = _file_size(capacity)
+        fresh = not os.path.exists(path) or os.path.getsize(path) != size
+        self._file = open(path, "r+b" if not fresh else "w+b")
+        if fresh:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+        if fresh:
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD_SIZE, capacity, 0, 0)
+            self.count, self.mode_count = 0, 0
+        else:
+            magic, version, record_size, file_capacity, self.count, self.mode_count = \
+                HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or record_size != RECORD_SIZE or file_capacity != capacity:
+                raise ValueError(f"{path} is not a compatible telemetry file")
+
+        self._last_time = None
+        if self.count:
+            self._last_time = RECORD.unpack_from(
+                self._map, self.records_offset + ((self.count - 1) % capacity) * RECORD_SIZE)[0]
+        self._last_mode = None
+        if self.mode_count:
+            self._last_mode = MODE_ENTRY.unpack_from(
+                self._map, HEADER_SIZE + ((self.mode_count - 1) % MODE_INDEX_CAPACITY) * MODE_ENTRY.size)[2]
+        self._unflushed = 0
+
+    def record(self, system_state, now=None):
+        """Appends one record for the current tick."""
+        now = mission_clock.now() if now is None else now
+        if self._last_time is not None and now < self._last_time:
+            flight_log.warning("Telemetry", "Record at %.1f is older than the newest (%.1f); starting %s over.",
+                               now, self._last_time, self.path)
+            self.count, self.mode_count, self._last_mode = 0, 0, None
+        self._last_time = now
+        mode = _MODE_CODES.get(system_state["current_mode"], UNKNOWN_MODE)
+        payload = system_state["payload_temps"]
+
+        flags = 0
+        if hardware_drivers.get_heater_state(global_config.AIR_HEATER) == "ON":
+            flags |= FLAG_AIR_HEATER
+        if hardware_drivers.get_heater_state(global_config.WATER_HEATER) == "ON":
+            flags |= FLAG_WATER_HEATER
+        if hardware_drivers.get_led_state() == "ON":
+            flags |= FLAG_LEDS
+
+        if mode != self._last_mode:
+            MODE_ENTRY.pack_into(self._map, HEADER_SIZE + (self.mode_count % MODE_INDEX_CAPACITY) * MODE_ENTRY.size,
+                                 self.count, now, mode)
+            self.mode_count += 1
+            self._last_mode = mode
+
+        RECORD.pack_into(self._map, self.records_offset + (self.count % self.capacity) * RECORD_SIZE,
+                         now, mode,
+                         system_state["battery_voltage"], system_state["pi_temp"],
+                         payload["air"], payload["substrate"], payload["water"],
+                         system_state["soil_moisture"], system_state["humidity"], flags)
+        self.count += 1
+        COUNTS.pack_into(self._map, COUNTS_OFFSET, self.count, self.mode_count)
+
+        self._unflushed += 1
+        if self._unflushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._map.flush()
+        self._unflushed = 0
+
+    def close(self):
+        if self._map is not None:
+            self.flush()
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+
+class TelemetryReader:
+    """
+    Read-only view of a telemetry file (it may still be being written).
+    Queries return NumPy structured arrays with the fields of RECORD_DTYPE.
+    """
+
+    def __init__(self, path=global_config.TELEMETRY_FILE):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.capacity, _, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            raise ValueError(f"{path} is not a telemetry file")
+        records_offset = HEADER_SIZE + MODE_INDEX_CAPACITY * MODE_ENTRY.size
+        # Zero-copy view of the whole ring
+        self._ring = np.frombuffer(self._map, dtype=RECORD_DTYPE,
+                                   count=self.capacity, offset=records_offset)
+
+    def _counts(self):
+        return COUNTS.unpack_from(self._map, COUNTS_OFFSET)
+
+    def _segments(self):
+        """The valid part of the ring as (oldest..end, start..newest) slices, in time order."""
+        count, _ = self._counts()
+        if count <= self.capacity:
+            return [self._ring[:count]]
+        head = count % self.capacity
+        return [self._ring[head:], self._ring[:head]]
+
+    def __len__(self):
+        return min(self._counts()[0], self.capacity)
+
+    def window(self, t_start, t_end):
+        """All records with t_start <= time < t_end, found by binary search."""
+        parts = []
+        for segment in self._segments():
+            times = segment["time"]
+            lo = np.searchsorted(times, t_start, side="left")
+            hi = np.searchsorted(times, t_end, side="left")
+            if hi > lo:
+                parts.append(segment[lo:hi])
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.concatenate(parts)
+
+    def mode_changes(self):
+        """
+        [(time, mode_name)] for every mode change still covered by the ring,
+        oldest first.
+        """
+        count, mode_count = self._counts()
+        oldest_seq = max(0, count - self.capacity)
+        entries = []
+        for i in range(max(0, mode_count - MODE_INDEX_CAPACITY), mode_count):
+            seq, t, mode = MODE_ENTRY.unpack_from(self._map, HEADER_SIZE + (i % MODE_INDEX_CAPACITY) * MODE_ENTRY.size)
+            name = conops_modes.MODES[mode] if mode < len(conops_modes.MODES) else "UNKNOWN"
+            entries.append((seq, t, name))
+
+        # Keep the change the oldest surviving record belongs to, and all later ones
+        first = 0
+        for i, (seq, _, _) in enumerate(entries):
+            if seq <= oldest_seq:
+                first = i
+        return [(t, name) for _, t, name in entries[first:]]
+
+    def mode_windows(self, mode):
+        """[(t_start, t_end)] spans spent in `mode`. The last span may still be open (t_end = inf)."""
+        changes = self.mode_changes()
+        spans = []
+        for i, (t, name) in enumerate(changes):
+            if name == mode:
+                t_end = changes[i + 1][0] if i + 1 < len(changes) else float("inf")
+                spans.append((t, t_end))
+        return spans
+
+    def in_mode(self, mode, t_start=float("-inf"), t_end=float("inf")):
+        """All records taken in `mode` within [t_start, t_end)."""
+        parts = [self.window(max(a, t_start), min(b, t_end))
+                 for a, b in self.mode_windows(mode) if a < t_end and b > t_start]
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.concatenate(parts)
+
+    def close(self):
+        self._ring = None
+        self._map.close()
+        self._file.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    n = 14 * 24 * 3600  # 14 days at 1 Hz
+    path = os.path.join(tempfile.mkdtemp(), "telemetry_bench.bin")
+    recorder = TelemetryRecorder(path, capacity=n, flush_interval=3600)
+    state = {"current_mode": "EXPERIMENT_MODE", "battery_voltage": 3.8, "pi_temp": 45.0,
+             "payload_temps": {"air": 22.0, "substrate": 21.0, "water": 20.0},
+             "soil_moisture": 0.4, "humidity": 60.0}
+
+    t0 = time.perf_counter()
+    for k in range(n):
+        if k % 86400 == 0:
+            state["current_mode"] = "SAFE_MODE" if state["current_mode"] == "EXPERIMENT_MODE" else "EXPERIMENT_MODE"
+        recorder.record(state, now=1.0e9 + k)
+    write_time = time.perf_counter() - t0
+    recorder.close()
+    print(f"--- Telemetry: wrote {n:,} records in {write_time:.2f} s "
+          f"({write_time / n * 1e6:.2f} us/record, file {os.path.getsize(path) / 1e6:.1f} MB) ---")
+
+    reader = TelemetryReader(path)
+    rng = np.random.default_rng(0)
+    t0 = time.perf_counter()
+    for _ in range(100):
+        start = 1.0e9 + rng.uniform(0, n - 3600)
+        records = reader.window(start, start + 3600)
+    query_time = (time.perf_counter() - t0) / 100
+    print(f"1-hour window query: {query_time * 1000:.3f} ms ({len(records)} records)")
+
+    t0 = time.perf_counter()
+    records = reader.in_mode("EXPERIMENT_MODE")
+    print(f"All EXPERIMENT_MODE records: {(time.perf_counter() - t0) * 1000:.2f} ms ({len(records):,} records)")
+    reader.close()
+    os.remove(path)
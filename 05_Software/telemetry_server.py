@@ -0,0 +1,352 @@
+"""
+telemetry_server.py
+Publishes the flight state to any number of local subscriber processes.
+
+The flight loop used to hand its state deltas to the dashboard through a
+queue.Queue in the same process, so a slow Tk redraw competed with the
+flight code for the GIL. Now the loop can publish to a TelemetryServer
+instead, and the dashboard, a ground logger or a test harness subscribe
+over a local TCP socket from their own processes.
+
+Flight side (never blocks):
+- publish(delta) merges the changed fields into one pending dict under
+  a lock and pokes the server thread. Nothing is serialized or sent in
+  the flight thread.
+- The server thread merges the pending fields into every subscriber's
+  own pending dict and sends when that subscriber's socket can take
+  more. A subscriber that reads slowly does not build up a queue: newer
+  values simply overwrite older unsent ones (latest-value conflation),
+  so its backlog is never larger than one full state.
+- A new subscriber first receives the complete latest state.
+
+Wire format: each message is a 4-byte big-endian length followed by
+UTF-8 JSON: {"seq": publish count, "t": mission time, "fields": {...}}.
+"fields" is a FlightState delta and can be fed to apply_delta().
+
+The server has put(), so main.run_simulation_loop can use it in place of
+its data_queue.
+"""
+
+import json
+import selectors
+import socket
+import struct
+import threading
+import time
+
+import flight_log
+import global_config
+import mission_clock
+
+LENGTH = struct.Struct(">I")
+
+
+def encode_message(seq, t, fields):
+    body = json.dumps({"seq": seq, "t": t, "fields": fields}, separators=(",", ":")).encode("utf-8")
+    return LENGTH.pack(len(body)) + body
+
+
+class _Subscriber:
+    __slots__ = ("sock", "address", "pending", "outbox", "sent", "conflated", "writing")
+
+    def __init__(self, sock, address, state):
+        self.sock = sock
+        self.address = address
+        self.pending = dict(state)  # Fields not yet sent; starts with the full state
+        self.outbox = b""
+        self.sent = 0
+        self.conflated = 0          # Field updates overwritten before they were sent
+        self.writing = False
+
+
+class TelemetryServer:
+    def __init__(self, host=global_config.TELEMETRY_HOST, port=global_config.TELEMETRY_PORT):
+        self.host = host
+        self.port = port
+        self.stats = {"publishes": 0, "subscribers": 0, "connects": 0, "disconnects": 0}
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._latest = {}
+        self._seq = 0
+        self._time = 0.0
+        self._frame_seq, self._frame_time = 0, 0.0  # Newest publish the server thread has taken
+        self._woken = False
+        self._subscribers = {}
+        self._thread = None
+        self._stopping = False
+
+    # --- Flight Side ---
+
+    def start(self):
+        self._listener = socket.create_server((self.host, self.port))
+        self._listener.setblocking(False)
+        self.port = self._listener.getsockname()[1]  # In case port 0 was asked for
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ, "accept")
+        self._selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+        self._thread = threading.Thread(target=self._serve, name="telemetry_server", daemon=True)
+        self._thread.start()
+        flight_log.info("Telemetry", "Serving flight state on %s:%d", self.host, self.port)
+
+    def publish(self, delta):
+        """Hands changed fields to the server thread. Never blocks on a subscriber."""
+        with self._lock:
+            self._pending.update(delta)
+            self._seq += 1
+            self._time = mission_clock.now()
+            wake, self._woken = not self._woken, True
+        if wake:
+            try:
+                self._wake_w.send(b"\0")
+            except BlockingIOError:
+                pass  # Already signalled
+
+    put = publish  # Lets the server stand in for main.run_simulation_loop's data_queue
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscriber_stats(self):
+        return [{"address": s.address, "sent": s.sent, "conflated": s.conflated,
+                 "pending_fields": len(s.pending)} for s in list(self._subscribers.values())]
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wake_w.send(b"\0")
+        self._thread.join()
+        self._thread = None
+        for sub in list(self._subscribers.values()):
+            sub.sock.close()
+        self._subscribers.clear()
+        self._selector.close()
+        self._listener.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    # --- Server Thread ---
+
+    def _serve(self):
+        while not self._stopping:
+            for key, events in self._selector.select():
+                if key.data == "accept":
+                    self._accept()
+                elif key.data == "wake":
+                    self._take_pending()
+                else:
+                    sub = key.data
+                    if events & selectors.EVENT_READ:
+                        self._check_closed(sub)
+                    if events & selectors.EVENT_WRITE and sub.sock.fileno() != -1:
+                        self._send(sub)
+
+    def _accept(self):
+        try:
+            sock, address = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        # A small send buffer keeps stale data out of the kernel: once it is
+        # full, newer values replace older ones in sub.pending instead
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, global_config.TELEMETRY_SEND_BUFFER)
+        with self._lock:
+            state = dict(self._latest)
+            state.update(self._pending)
+        sub = _Subscriber(sock, f"{address[0]}:{address[1]}", state)
+        self._subscribers[sock] = sub
+        self._selector.register(sock, selectors.EVENT_READ, sub)
+        self.stats["connects"] += 1
+        self.stats["subscribers"] = len(self._subscribers)
+        self._send(sub)
+
+    def _take_pending(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            seq, t = self._seq, self._time
+            self._woken = False
+        if not pending:
+            return
+        self._latest.update(pending)
+        self.stats["publishes"] = seq
+        self._frame_seq, self._frame_time = seq, t
+        for sub in list(self._subscribers.values()):
+            for key in pending:
+                if key in sub.pending:
+                    sub.conflated += 1
+            sub.pending.update(pending)
+            self._send(sub)
+
+    def _next_frame(self, sub):
+        # Everything pending for this subscriber goes out as one message
+        if not sub.outbox and sub.pending:
+            sub.outbox = encode_message(self._frame_seq, self._frame_time, sub.pending)
+            sub.pending = {}
+            sub.sent += 1
+
+    def _send(self, sub):
+        self._next_frame(sub)
+        try:
+            while sub.outbox:
+                n = sub.sock.send(sub.outbox)
+                sub.outbox = sub.outbox[n:]
+                self._next_frame(sub)
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._drop(sub)
+            return
+        # Only ask for write-readiness while something is waiting
+        want_write = bool(sub.outbox)
+        if want_write != sub.writing:
+            sub.writing = want_write
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if want_write else 0)
+            self._selector.modify(sub.sock, events, sub)
+
+    def _check_closed(self, sub):
+        try:
+            data = sub.sock.recv(4096)  # Subscribers don't talk; EOF means they left
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(sub)
+
+    def _drop(self, sub):
+        if self._subscribers.pop(sub.sock, None) is None:
+            return
+        self._selector.unregister(sub.sock)
+        sub.sock.close()
+        self.stats["disconnects"] += 1
+        self.stats["subscribers"] = len(self._subscribers)
+
+
+# --- Ground Side ---
+
+class TelemetryClient:
+    """Blocking subscriber. receive() returns one message dict, or None when the server is gone."""
+
+    def __init__(self, host=global_config.TELEMETRY_HOST, port=global_config.TELEMETRY_PORT, timeout=5.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.settimeout(None)
+        self._buffer = bytearray()
+
+    def _read(self, n):
+        while len(self._buffer) < n:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                return None
+            self._buffer += chunk
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    def receive(self):
+        header = self._read(LENGTH.size)
+        if header is None:
+            return None
+        body = self._read(LENGTH.unpack(header)[0])
+        return None if body is None else json.loads(body)
+
+    def feed(self, data_queue, stop_event=None):
+        """Puts every received delta on data_queue from a daemon thread (for the dashboard)."""
+        def run():
+            while not (stop_event and stop_event.is_set()):
+                message = self.receive()
+                if message is None:
+                    return
+                data_queue.put(message["fields"])
+        thread = threading.Thread(target=run, name="telemetry_client", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.sock.close()
+
+
+def _bench_subscribers(port, n, connected, results):
+    """Benchmark helper: n subscriber sockets in one process, read until the end marker."""
+    selector = selectors.DefaultSelector()
+    for _ in range(n):
+        sock = socket.create_connection((global_config.TELEMETRY_HOST, port))
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, [bytearray(), 0, False])
+    connected.set()
+    open_socks = n
+    deadline = time.monotonic() + 60
+    while open_socks and time.monotonic() < deadline:
+        for key, _ in selector.select(timeout=1.0):
+            buffer, messages, done = key.data
+            chunk = key.fileobj.recv(65536)
+            buffer += chunk
+            while len(buffer) >= LENGTH.size:
+                (length,) = LENGTH.unpack_from(buffer)
+                if len(buffer) < LENGTH.size + length:
+                    break
+                message = json.loads(bytes(buffer[LENGTH.size:LENGTH.size + length]))
+                del buffer[:LENGTH.size + length]
+                messages += 1
+                done = done or "bench_done" in message["fields"]
+            key.data[1:] = [messages, done]
+            if done or not chunk:
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                results.put(messages)
+                open_socks -= 1
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import multiprocessing
+
+    n_publishes = 20000
+    delta = {"battery_voltage": 3.8, "pi_temp": 45.0, "payload_temps.air": 22.0,
+             "payload_temps.water": 20.0, "current_mode": "EXPERIMENT_MODE"}
+    print(f"--- Telemetry server: {n_publishes} publishes of a {len(delta)}-field delta, "
+          f"plus one subscriber that never reads ---")
+    print(f"{'subscribers':>12}{'publish p50 (us)':>18}{'p99 (us)':>10}{'max (us)':>10}"
+          f"{'msgs/sub':>10}{'stalled: sent':>15}{'conflated':>11}")
+    for n in (1, 10, 100):
+        server = TelemetryServer(port=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            server.start()
+        stalled = socket.socket()
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        stalled.connect((global_config.TELEMETRY_HOST, server.port))
+
+        connected, results = multiprocessing.Event(), multiprocessing.Queue()
+        reader = multiprocessing.Process(target=_bench_subscribers, args=(server.port, n, connected, results))
+        reader.start()
+        connected.wait()
+        while server.subscriber_count() < n + 1:
+            time.sleep(0.01)
+
+        latencies = []
+        for k in range(n_publishes):
+            delta["battery_voltage"] = 3.8 + k * 1e-6
+            delta["pi_temp"] = 45.0 + k * 1e-4
+            t0 = time.perf_counter()
+            server.publish(delta)
+            latencies.append(time.perf_counter() - t0)
+            if k % 10 == 0:
+                time.sleep(0.0005)  # Let the server thread run, like the real loop's idle time
+        server.publish({"bench_done": True})
+
+        received = [results.get(timeout=60) for _ in range(n)]
+        reader.join()
+        stall = max(server.subscriber_stats(), key=lambda s: s["conflated"])
+        latencies.sort()
+        print(f"{n:>12}{latencies[len(latencies) // 2] * 1e6:>18.1f}{latencies[int(len(latencies) * 0.99)] * 1e6:>10.1f}"
+              f"{latencies[-1] * 1e6:>10.1f}{sum(received) / n:>10.0f}{stall['sent']:>15}{stall['conflated']:>11}")
+        stalled.close()
+        server.stop()
@@ -0,0 +1,63 @@
+"""
+test_checkpoint.py
+Warm restarts from a checkpoint through the flight loop
+(python -m pytest test_checkpoint.py).
+"""
+
+import contextlib
+import io
+import os
+
+import pytest
+
+import checkpoint
+import conops_modes
+import hardware_drivers
+import main
+import mission_clock
+
+START = 1.0e9
+
+
+@pytest.fixture(autouse=True)
+def flight_clock():
+    saved = mission_clock.get_clock()
+    yield
+    mission_clock.set_clock(saved)
+
+
+def _boot(path, seconds, start_time):
+    """One boot of the flight software on fresh (power-cycled) hardware. Returns [(time, mode)] per wakeup."""
+    mission_clock.set_clock(mission_clock.DiscreteEventClock(start_time=start_time))
+    conops_modes.reset_timers()
+    hardware_drivers.reset_simulation(seed=0)
+    ticks = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.run_simulation_loop(mission_duration=seconds, checkpoint=checkpoint.Checkpoint(path),
+                                 on_tick=lambda s: ticks.append((mission_clock.now(), s["current_mode"])))
+    return ticks
+
+
+@pytest.mark.parametrize("downtime, outcome", [(60.0, "warm"), (3600.0, "resumed")])
+def test_restart_resumes_the_experiment_with_comms_powered(tmp_path, downtime, outcome):
+    path = os.path.join(tmp_path, "checkpoint.json")
+    before = _boot(path, 86400, START)
+    crash_time, mode = before[-1]
+    assert mode == "EXPERIMENT_MODE"
+    saved = checkpoint.Checkpoint(path).load()
+    assert (crash_time + downtime - saved["saved_at"] <= checkpoint.Checkpoint(path).max_age) == (outcome == "warm")
+
+    after = _boot(path, 600, crash_time + downtime)
+    assert after[0][1] == "EXPERIMENT_MODE"  # Resumed within the first tick
+    # INITIALIZE ran again: the reset had powered off the receiver and ADCS
+    energy = hardware_drivers.get_energy_report()
+    assert energy["load_receiver_wh"] > 0 and energy["load_adcs_wh"] > 0
+
+
+def test_unusable_checkpoint_is_a_cold_boot(tmp_path):
+    path = os.path.join(tmp_path, "checkpoint.json")
+    with open(path, "w") as f:
+        f.write("{not json")
+    ticks = _boot(path, 60, START)
+    # From scratch: SAFE_MODE's command poll starts a new experiment with heating
+    assert ticks[0][1] == "PRE_EXPERIMENT_HEATING"
@@ -0,0 +1,133 @@
+"""
+test_command_queue.py
+Stored-command receipt, dispatch order, the journal across a reset and a
+3-day mission run from one uplink (python -m pytest test_command_queue.py).
+"""
+
+import contextlib
+import io
+import os
+import random
+
+import pytest
+
+import command_queue
+import conops_modes
+import hardware_drivers
+import main
+import mission_clock
+from command_queue import CommandQueue, encode_batch
+
+
+@pytest.fixture
+def state():
+    return dict(current_mode="EXPERIMENT_MODE", battery_voltage=3.9, pi_temp=45.0, gnd_command_received=None)
+
+
+@pytest.fixture
+def flight_clock():
+    saved = mission_clock.get_clock()
+    yield
+    mission_clock.set_clock(saved)
+    command_queue.reset()
+
+
+def _noop_batch(batch_id, n, span, seed=0):
+    rng = random.Random(seed)
+    return encode_batch(batch_id, [{"cmd": "NOOP", "at": rng.uniform(0, span), "priority": rng.randrange(20)}
+                                   for _ in range(n)])
+
+
+def test_dispatch_in_time_then_priority_order(state, monkeypatch):
+    ran = []
+    for name in ("A", "B", "C", "D"):
+        monkeypatch.setitem(command_queue.COMMANDS, name, (lambda s, name=name: ran.append(name), ("EXPERIMENT_MODE",)))
+    queue = CommandQueue()
+    batch = encode_batch("order", [{"cmd": "A", "at": 100.0}, {"cmd": "B", "at": 100.0, "priority": 1},
+                                   {"cmd": "C", "at": 50.0, "priority": 20}, {"cmd": "D", "at": 200.0}])
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert queue.receive(batch, now=0.0) == []
+        assert queue.dispatch(state, now=40.0) == 0
+        assert queue.dispatch(state, now=150.0) == 3
+        assert queue.next_due() == 200.0
+        assert queue.dispatch(state, now=250.0) == 1
+    assert ran == ["C", "B", "A", "D"]
+    assert len(queue) == 0 and queue.next_due() is None
+
+
+def test_journal_survives_a_reset(tmp_path, state):
+    path = os.path.join(tmp_path, "queue.jsonl")
+    queue = CommandQueue(path, capacity=1000)
+    with contextlib.redirect_stdout(io.StringIO()):
+        queue.receive(_noop_batch("journal", 1000, 14 * 86400.0), now=0.0)
+        for step in range(1, 7 * 144 + 1):
+            queue.dispatch(state, now=step * 600.0)
+        restored = CommandQueue(path, capacity=1000)
+    assert 0 < len(queue) < 1000
+    assert len(restored) == len(queue) and restored.next_due() == queue.next_due()
+
+    # A repeated uplink of the same batch is not queued twice
+    with contextlib.redirect_stdout(io.StringIO()):
+        errors = restored.receive(_noop_batch("journal", 1000, 14 * 86400.0), now=7 * 86400.0)
+    assert errors and len(restored) == len(queue)
+
+
+def test_invalid_batch_is_rejected_in_full():
+    queue = CommandQueue()
+    bad = encode_batch("bad", [{"cmd": "NOOP", "after": 10}, {"cmd": "SELF_DESTRUCT", "after": 20},
+                               {"cmd": "CAPTURE_IMAGE", "at": -5.0, "if": {"mode": "WARP"}}])
+    with contextlib.redirect_stdout(io.StringIO()):
+        errors = queue.receive(bad, now=0.0)
+    assert len(errors) == 3
+    assert len(queue) == 0 and queue.stats["rejected_batches"] == 1
+
+    corrupt = bad.replace('"NOOP"', '"NOPE"')
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert queue.receive(corrupt, now=0.0)  # CRC mismatch
+    assert len(queue) == 0
+
+
+@pytest.mark.parametrize("command", [
+    {"cmd": ["NOOP"], "after": 1},
+    {"cmd": {"NOOP": 1}, "after": 1},
+    {"cmd": None, "after": 1},
+    {"cmd": "NOOP", "after": "10"},
+    {"cmd": "NOOP", "at": [10]},
+    {"cmd": "NOOP", "after": 1, "priority": "high"},
+    {"cmd": "NOOP", "after": 1, "window": True},
+    {"cmd": "NOOP", "after": 1, "if": []},
+    {"cmd": "NOOP", "after": 1, "if": {"mode": [["SAFE_MODE"]]}},
+    {"cmd": "NOOP", "after": 1, "if": {"min_voltage": "3.6"}},
+    "NOOP",
+])
+def test_malformed_field_types_are_rejected(command):
+    queue = CommandQueue()
+    with contextlib.redirect_stdout(io.StringIO()):
+        errors = queue.receive(encode_batch("malformed", [command]), now=0.0)
+    assert errors
+    assert len(queue) == 0 and queue.stats["rejected_batches"] == 1
+
+
+def test_three_day_mission_from_one_uplink(tmp_path, monkeypatch, flight_clock):
+    plan = [{"cmd": "START_EXPERIMENT", "after": 120, "if": {"min_voltage": 3.6}}]
+    plan += [{"cmd": "CAPTURE_IMAGE", "after": 1800 + 7200 * k, "priority": 5} for k in range(36)]
+    plan += [{"cmd": "REQUEST_TRANSMIT", "after": 2 * 86400, "window": 600},  # Not in SAFE_MODE then
+             {"cmd": "ENTER_SAFE_MODE", "after": 3 * 86400 - 300},
+             {"cmd": "REQUEST_TRANSMIT", "after": 3 * 86400 - 200}]
+    uplinks = iter([encode_batch("ops-1", plan)])
+    monkeypatch.setattr(hardware_drivers, "check_for_gnd_command", lambda: next(uplinks, None))
+
+    mission_clock.set_clock(mission_clock.DiscreteEventClock(start_time=1.0e9))
+    hardware_drivers.reset_simulation(seed=0)
+    conops_modes.reset_timers()
+    command_queue.start(os.path.join(tmp_path, "flight.jsonl"))
+    modes = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.run_simulation_loop(mission_duration=3 * 86400,
+                                 on_tick=lambda s: modes.append(s["current_mode"]) if not modes or
+                                 modes[-1] != s["current_mode"] else None)
+
+    stats = command_queue.get_stats()
+    assert stats["queued"] == len(plan)
+    assert stats["executed"] == len(plan) - 1 and stats["expired"] == 1 and stats["pending"] == 0
+    assert modes == ["SAFE_MODE", "PRE_EXPERIMENT_HEATING", "WATER_SATURATION", "EXPERIMENT_MODE", "SAFE_MODE"]
@@ -0,0 +1,67 @@
+"""
+test_downlink.py
+Framing round trips per virtual channel, and passes that run on from
+the last one (python -m pytest test_downlink.py).
+"""
+
+import os
+
+import numpy as np
+
+import downlink
+import global_config
+import housekeeping
+import mission_clock
+import telemetry_recorder
+
+STATE = {"current_mode": "EXPERIMENT_MODE", "battery_voltage": 3.8, "pi_temp": 45.0,
+         "payload_temps": {"air": 22.0, "substrate": 21.0, "water": 20.0},
+         "soil_moisture": 0.4, "humidity": 60.0}
+
+
+def test_channels_are_reassembled_separately():
+    telemetry = bytes(range(256)) * 40
+    beacon = b"beacon" * 100
+    tm = downlink.frame_payload(telemetry, 7, downlink.VIRTUAL_CHANNEL_TELEMETRY)
+    hk = downlink.frame_payload(beacon, 300, downlink.VIRTUAL_CHANNEL_HOUSEKEEPING)
+    interleaved = [f for pair in zip(tm, hk) for f in pair] + tm[len(hk):] + hk[len(tm):]
+
+    payloads, stats = downlink.decode_frames(interleaved)
+    assert payloads == {downlink.VIRTUAL_CHANNEL_TELEMETRY: telemetry,
+                        downlink.VIRTUAL_CHANNEL_HOUSEKEEPING: beacon}
+    assert stats == {"good": len(tm) + len(hk), "corrupt": 0, "missing": 0}
+
+    _, stats = downlink.decode_frames(tm[:2] + tm[3:] + hk)
+    assert stats["missing"] == 1
+
+
+def test_passes_run_on_from_the_last_one(tmp_path, monkeypatch):
+    monkeypatch.setattr(global_config, "DOWNLINK_RAW_TELEMETRY", True)
+    path = os.path.join(tmp_path, "telemetry.bin")
+    recorder = telemetry_recorder.TelemetryRecorder(path, capacity=10000, flush_interval=100)
+    state = {"telemetry_file": path, "downlink_time": None, "downlink_sequence": (0, 0)}
+    clock = mission_clock.DiscreteEventClock(start_time=1.0e9)
+    monkeypatch.setattr(mission_clock, "_clock", clock)  # The beacon covers up to now
+    housekeeping.reset()
+
+    passes = []
+    for start in (0, 3000):
+        for t in range(start, start + 3000):
+            recorder.record(STATE, now=1.0e9 + t)
+            housekeeping.add(1.0e9 + t, STATE)
+        clock.sleep_until(1.0e9 + start + 3000)
+        recorder.flush()
+        passes.append(downlink.prepare_pass(state, raw=True)[0])
+    recorder.close()
+    housekeeping.reset()
+
+    # Sequence counts run on across passes on both channels
+    _, stats = downlink.decode_frames(passes[0] + passes[1])
+    assert stats == {"good": len(passes[0]) + len(passes[1]), "corrupt": 0, "missing": 0}
+    # Each pass only carries the records newer than the last one
+    for k, frames in enumerate(passes):
+        payloads, _ = downlink.decode_frames(frames)
+        assert set(payloads) == {downlink.VIRTUAL_CHANNEL_TELEMETRY, downlink.VIRTUAL_CHANNEL_HOUSEKEEPING}
+        records = downlink.decode_records(payloads[downlink.VIRTUAL_CHANNEL_TELEMETRY])
+        np.testing.assert_allclose(records["time"], 1.0e9 + 3000 * k + np.arange(3000))
+        assert housekeeping.decode_beacon(payloads[downlink.VIRTUAL_CHANNEL_HOUSEKEEPING])
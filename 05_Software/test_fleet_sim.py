@@ -0,0 +1,38 @@
+"""
+test_fleet_sim.py
+The vectorized fleet against the scalar flight code it mirrors
+(python -m pytest test_fleet_sim.py).
+"""
+
+import numpy as np
+
+import fleet_sim
+import global_config
+
+
+def test_modes_heaters_and_leds_match_scalar():
+    assert fleet_sim.verify_against_scalar(n=20, ticks=400, seed=0)
+    assert fleet_sim.verify_against_scalar(n=10, ticks=300, seed=1)
+
+
+def test_battery_matches_power_model():
+    assert fleet_sim.verify_power_model(n=5, ticks=300, seed=0)
+
+
+def test_fleet_runs_an_experiment():
+    rng = np.random.default_rng(0)
+    fleet = fleet_sim.Fleet(50)
+    now = 1.0e9
+    for _ in range(2 * 3600):
+        fleet.step(now, rng)
+        now += global_config.MAIN_LOOP_DELAY
+    assert np.all(fleet.current_mode == fleet_sim.EXPERIMENT_MODE)
+    assert np.all(fleet.images_captured == int(np.ceil(2 * 3600 / global_config.IMAGE_INTERVAL_SEC)) - 1)
+    assert np.all((fleet.battery_voltage > 3.0) & (fleet.battery_voltage < 4.3))
+    # The thermostat holds the air above the ON point (hysteresis band plus sensor noise)
+    on_below = global_config.IDEAL_PLANT_TEMP_MIN + global_config.THERMAL_MARGIN_C
+    assert fleet.air_temp.min() > on_below - 1.0
+
+
+def test_benchmark_reports_a_rate():
+    assert fleet_sim.benchmark(n=100, ticks=20) > 0
@@ -0,0 +1,90 @@
+"""
+test_housekeeping.py
+The streaming aggregator against the NumPy batch reference, and the
+beacon round trip (python -m pytest test_housekeeping.py).
+"""
+
+import numpy as np
+import pytest
+
+import conops_modes
+import downlink
+import global_config
+import housekeeping
+
+
+@pytest.fixture(scope="module")
+def samples():
+    """A day of the synthetic log at irregular times, with voltage dips and mode changes."""
+    log = downlink.synthetic_log(days=1, seed=1)
+    rng = np.random.default_rng(0)
+    log = log[np.sort(rng.choice(len(log), size=len(log) // 3, replace=False))]
+    t = log["time"].astype(np.float64)
+    names = [name for name, _, _, _ in housekeeping.CHANNELS]
+    values = np.column_stack([log[name].astype(np.float64) for name in names])
+    values[(t % 7000) < 400, 0] -= 0.4  # Below SAFE_MODE_VOLTAGE
+    modes = np.full(len(t), conops_modes.MODES.index("EXPERIMENT_MODE"))
+    modes[(t % 20000) < 1500] = conops_modes.MODES.index("SAFE_MODE")
+    modes[(t % 50000) < 300] = conops_modes.MODES.index("TRANSMIT_MODE")
+    return log, t, values, modes
+
+
+@pytest.fixture(scope="module")
+def aggregator(samples):
+    _, t, values, modes = samples
+    aggregator = housekeeping.Aggregator(history={level: 10 ** 6 for level in
+                                                  (housekeeping.MINUTE, housekeeping.HOUR, housekeeping.ORBIT)})
+    for k, row in enumerate(values.tolist()):
+        aggregator.add(t[k], tuple(row), conops_modes.MODES[modes[k]])
+    return aggregator
+
+
+@pytest.mark.parametrize("level", [housekeeping.MINUTE, housekeeping.HOUR, housekeeping.ORBIT])
+def test_streaming_matches_batch(samples, aggregator, level):
+    _, t, values, modes = samples
+    origin, width = aggregator.grids[level]
+    expected = housekeeping.batch_records(t, values, modes, level, np.array(aggregator.lows),
+                                          np.array(aggregator.highs), origin, width)
+    got = [r for r in aggregator.records[level] if r["start"] >= expected[0]["start"]][:len(expected)]
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        assert g["start"] == e["start"] and g["n"] == e["n"]
+        for field in ("min", "max", "mean", "std", "below", "above", "dwell"):
+            np.testing.assert_allclose(np.asarray(g[field]), e[field], rtol=0, atol=1e-6,
+                                       err_msg=f"{housekeeping.LEVEL_NAMES[level]} {g['start']} {field}")
+
+
+def test_beacon_round_trip(samples):
+    log, t, values, modes = samples
+    aggregator = housekeeping.Aggregator()
+    for k, row in enumerate(values.tolist()):
+        aggregator.add(t[k], tuple(row), conops_modes.MODES[modes[k]])
+    data = aggregator.beacon(t[-1])
+    records = housekeeping.decode_beacon(data)
+
+    assert len(data) < len(downlink.encode_records(log)) / 100
+    summary = records[-1]
+    assert summary["level"] == housekeeping.LEVEL_NAMES[housekeeping.PASS]
+    scale = housekeeping.CHANNELS[0][1]
+    voltage = summary["channels"]["battery_voltage"]
+    assert voltage["min"] == pytest.approx(values[:, 0].min(), abs=1 / scale)
+    assert voltage["max"] == pytest.approx(values[:, 0].max(), abs=1 / scale)
+    assert voltage["below"] > 0  # The dips went below SAFE_MODE_VOLTAGE
+    assert summary["covered"] == pytest.approx(t[-1] - t[0], abs=1)
+
+    # The beacon starts over: the next one only covers what came after it
+    again = housekeeping.decode_beacon(aggregator.beacon(t[-1]))[-1]
+    assert again["n"] == 0 and again["covered"] == 0
+
+
+def test_module_beacon_starts_empty():
+    housekeeping.reset()
+    assert housekeeping.beacon(0.0) == b""
+    state = {"current_mode": "SAFE_MODE", "battery_voltage": global_config.SAFE_MODE_VOLTAGE + 0.2,
+             "pi_temp": 45.0, "payload_temps": {"air": 22.0, "substrate": 21.0, "water": 20.0},
+             "soil_moisture": 0.4, "humidity": 60.0}
+    for now in range(0, 600, 5):
+        housekeeping.add(float(now), state)
+    records = housekeeping.decode_beacon(housekeeping.beacon(600.0))
+    assert records[-1]["dwell"]["SAFE_MODE"] == pytest.approx(600, abs=5)
+    housekeeping.reset()
@@ -0,0 +1,48 @@
+"""
+test_telemetry_recorder.py
+Ring writes, reopening a file and the indexed reads
+(python -m pytest test_telemetry_recorder.py).
+"""
+
+import contextlib
+import io
+import os
+
+import pytest
+
+import telemetry_recorder
+
+STATE = {"current_mode": "EXPERIMENT_MODE", "battery_voltage": 3.8, "pi_temp": 45.0,
+         "payload_temps": {"air": 22.0, "substrate": 21.0, "water": 20.0},
+         "soil_moisture": 0.4, "humidity": 60.0}
+
+
+def _record(path, times, capacity=1000):
+    recorder = telemetry_recorder.TelemetryRecorder(path, capacity=capacity, flush_interval=100)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in times:
+            recorder.record(STATE, now=float(t))
+    recorder.close()
+
+
+def test_reopen_keeps_appending(tmp_path):
+    path = os.path.join(tmp_path, "telemetry.bin")
+    _record(path, range(1000, 1200))
+    _record(path, range(1200, 1300))
+    reader = telemetry_recorder.TelemetryReader(path)
+    assert len(reader) == 300
+    assert len(reader.window(1150, 1250)) == 100
+    reader.close()
+
+
+@pytest.mark.parametrize("capacity", [1000, 250])
+def test_reopen_with_older_records_starts_over(tmp_path, capacity):
+    path = os.path.join(tmp_path, "telemetry.bin")
+    _record(path, range(1000, 1200), capacity)
+    _record(path, range(0, 100), capacity)
+    reader = telemetry_recorder.TelemetryReader(path)
+    assert len(reader) == 100
+    assert len(reader.window(0, 100)) == 100
+    assert len(reader.window(1000, 1200)) == 0
+    assert reader.mode_changes() == [(0.0, "EXPERIMENT_MODE")]
+    reader.close()
@@ -0,0 +1,348 @@
+"""
+thermal_control.py
+Selectable payload thermal controllers with duty-cycle and energy metrics.
+
+The old thermostat switched the air heater on below IDEAL_PLANT_TEMP_MIN
+and off at or above it, with no hysteresis, so the relay chattered at
+the threshold, and the water heater was never controlled after
+pre-heating. Now each heater is a Channel with its own band:
+- air:   IDEAL_PLANT_TEMP_MIN .. IDEAL_PLANT_TEMP_MAX (PAY-2)
+- water: MIN_WATER_TEMP .. IDEAL_PLANT_TEMP_MAX (PAY-3)
+and one of three controllers (THERMAL_CONTROLLER) decides ON/OFF:
+- "hysteresis": ON below low + THERMAL_MARGIN_C, OFF above that plus
+  THERMAL_HYSTERESIS_C. Heating stops as soon as the plants are safe,
+  which is the cheapest thing a bang-bang controller can do.
+- "pid":        PI(D) on a setpoint inside the band, with the integrator
+  frozen while the output is saturated (anti-windup). The 0..1 output
+  is turned into ON/OFF by PWM over THERMAL_PWM_PERIOD_SEC.
+- "mpc":        receding horizon. Every update it predicts the band
+  temperature with the thermal_model network for the plans "heater OFF
+  for the next k periods, then ON", k = 0..N over THERMAL_HORIZON_SEC.
+  Heating as late as possible is the cheapest way to hold the floor
+  (low + THERMAL_MARGIN_C), so the heater goes ON only if waiting would
+  break it somewhere in the horizon. "Waiting" lasts
+  THERMAL_MIN_DWELL_SEC, because once the heater is OFF the relay cannot
+  come back sooner. The plan is redone every update; only its first
+  step is applied. The water heater, with its long lag, is where the
+  look-ahead pays off.
+Every channel also enforces THERMAL_MIN_DWELL_SEC between relay
+switches, except when a survival limit (PAY-1) is crossed. When
+LAST_RESORT_MODE sheds load, shed_load() marks every channel OFF, so the
+controller and the metrics don't count the heaters as still ON.
+
+Per channel the metrics are duty cycle, switch count, heater energy and
+time outside the band. compare() runs the controllers side by side on
+a fast closed-loop thermal simulation of many missions.
+"""
+
+import numpy as np
+
+import global_config
+import thermal_model
+
+
+# --- Controllers ---
+
+class Hysteresis:
+    def __init__(self, low, high, node):
+        self.on_below = low + global_config.THERMAL_MARGIN_C
+        self.off_above = self.on_below + global_config.THERMAL_HYSTERESIS_C
+        self.node = node
+
+    def decide(self, now, temps, heater_on, leds_on):
+        temp = temps[self.node]
+        if temp < self.on_below:
+            return True
+        if temp > self.off_above:
+            return False
+        return heater_on
+
+
+class PID:
+    def __init__(self, low, high, node):
+        self.setpoint = low + global_config.THERMAL_MARGIN_C + global_config.THERMAL_HYSTERESIS_C / 2
+        self.kp = global_config.THERMAL_PID_KP
+        self.ki = self.kp / global_config.THERMAL_PID_TI_SEC
+        self.kd = global_config.THERMAL_PID_KD
+        self.period = global_config.THERMAL_PWM_PERIOD_SEC
+        self.node = node
+        self.integral = 0.0
+        self.last = None          # (time, temperature) of the previous update
+        self.window_start = None
+        self.on_time = 0.0        # ON time in the current PWM window
+
+    def output(self, now, temp):
+        error = self.setpoint - temp
+        derivative = 0.0
+        dt = 0.0
+        if self.last is not None:
+            dt = now - self.last[0]
+            if dt > 0:
+                derivative = -(temp - self.last[1]) / dt  # On the measurement: no kick on setpoint changes
+        self.last = (now, temp)
+        u = self.kp * error + self.ki * self.integral + self.kd * derivative
+        # Anti-windup: only integrate while the output is not pinned in the error's direction
+        if (u < 1.0 or error < 0) and (u > 0.0 or error > 0):
+            self.integral += error * dt
+        return min(max(u, 0.0), 1.0)
+
+    def decide(self, now, temps, heater_on, leds_on):
+        u = self.output(now, temps[self.node])
+        if self.window_start is None or now - self.window_start >= self.period:
+            self.window_start = now
+            self.on_time = u * self.period
+        return now - self.window_start < self.on_time
+
+
+class RecedingHorizon:
+    def __init__(self, low, high, node, network=thermal_model.DEFAULT_NETWORK):
+        self.floor = low + global_config.THERMAL_MARGIN_C
+        self.node = node
+        self.heater = {thermal_model.AIR: 0, thermal_model.WATER: 1}[node]
+        self.network = network
+        self.step = global_config.THERMAL_CONTROL_PERIOD_SEC
+        self.n = max(int(global_config.THERMAL_HORIZON_SEC // self.step), 1)
+        # Plan to test before staying OFF: the relay is locked OFF for the dwell
+        self.wait = min(max(int(np.ceil(global_config.THERMAL_MIN_DWELL_SEC / self.step)), 1), self.n)
+        self.estimate = None  # Full node temperatures; only air and water are measured
+        self.last_time = None
+        self.heaters = [False, False]
+        self.leds_on = False
+        # plan k, horizon step j: still OFF for j <= k, else ON for j - k steps
+        j = np.arange(1, self.n + 1)
+        k = np.arange(self.n + 1)[:, None]
+        self._waiting = j[None, :] <= k
+        self._on_steps = np.maximum(j[None, :] - k, 0)
+
+    def _observe(self, now, temps):
+        """Runs the model forward with the last known inputs, then snaps the measured nodes."""
+        if self.estimate is None:
+            self.estimate = thermal_model.INITIAL_TEMPS.astype(float).copy()
+        elif now > self.last_time:
+            power = thermal_model.heat_input(self.heaters[0], self.heaters[1], self.leds_on)
+            self.estimate = self.network.advance(self.estimate, power, now - self.last_time)
+        self.last_time = now
+        for node, value in temps.items():
+            self.estimate[node] = value
+
+    def predict(self, heaters_other):
+        """Predicted channel temperature for every plan, shape (n + 1 plans, n steps)."""
+        inputs = [None, None]
+        inputs[1 - self.heater] = heaters_other
+        inputs[self.heater] = False
+        p_off = thermal_model.heat_input(*inputs, self.leds_on)
+        inputs[self.heater] = True
+        p_on = thermal_model.heat_input(*inputs, self.leds_on)
+        times = self.step * np.arange(0, self.n + 1)
+        off_path = self.network.trajectory(self.estimate, p_off, times)        # (n + 1, nodes)
+        # From the state at the end of each wait, heat with the heater ON
+        ss_on = self.network.steady_state(p_on)
+        modes = (off_path - ss_on) @ self.network.to_modes.T                   # (n + 1, modes)
+        decay = np.exp(-np.outer(times, self.network.rates))                   # (n + 1, modes)
+        on_path = ss_on[self.node] + np.einsum("km,jm->kj", modes,
+                                               decay * self.network.from_modes[self.node])
+        steps = np.arange(1, self.n + 1)
+        k = np.arange(self.n + 1)[:, None]
+        return np.where(self._waiting, off_path[steps, self.node][None, :], on_path[k, self._on_steps])
+
+    def decide(self, now, temps, heater_on, leds_on):
+        self._observe(now, temps)
+        self.heaters[self.heater] = heater_on
+        self.leds_on = leds_on
+        predicted = self.predict(self.heaters[1 - self.heater])
+        can_wait = np.all(predicted[self.wait] >= self.floor)  # OFF for the dwell, then ON
+        return not can_wait
+
+
+CONTROLLERS = {"hysteresis": Hysteresis, "pid": PID, "mpc": RecedingHorizon}
+
+
+# --- Channels ---
+
+class Channel:
+    """One heater: a controller, the relay dwell rule and the metrics."""
+
+    def __init__(self, heater, node, low, high, controller, survival=None):
+        self.heater = heater
+        self.node = node
+        self.low, self.high = low, high
+        self.survival = survival  # (min, max) that override the dwell, or None
+        self.controller = CONTROLLERS[controller](low, high, node)
+        self.power_w = {global_config.AIR_HEATER: global_config.AIR_HEATER_POWER_W,
+                        global_config.WATER_HEATER: global_config.WATER_HEATER_POWER_W}[heater]
+        self.on = False
+        self.last_switch = None
+        self.last_time = None
+        self.last_temp = None
+        self.metrics = {"time": 0.0, "on_time": 0.0, "switches": 0, "out_of_band": 0.0}
+
+    def _account(self, now):
+        if self.last_time is not None and now > self.last_time:
+            dt = now - self.last_time
+            self.metrics["time"] += dt
+            if self.on:
+                self.metrics["on_time"] += dt
+            if not self.low <= self.last_temp <= self.high:
+                self.metrics["out_of_band"] += dt
+
+    def update(self, now, temps, leds_on):
+        temp = temps[self.node]
+        self._account(now)
+        self.last_time, self.last_temp = now, temp
+
+        wanted = bool(self.controller.decide(now, temps, self.on, leds_on))
+        if wanted != self.on:
+            urgent = self.survival and not self.survival[0] <= temp <= self.survival[1]
+            dwelt = self.last_switch is None or now - self.last_switch >= global_config.THERMAL_MIN_DWELL_SEC
+            if urgent or dwelt:
+                self.on = wanted
+                self.last_switch = now
+                self.metrics["switches"] += 1
+        return self.on
+
+    def shed(self, now):
+        """Load shedding switched the relay OFF without asking the controller."""
+        self._account(now)
+        if self.last_time is not None:
+            self.last_time = max(self.last_time, now)
+        if self.on:
+            self.on = False
+            self.last_switch = now
+            self.metrics["switches"] += 1
+
+    def report(self):
+        m = self.metrics
+        return {"duty": m["on_time"] / m["time"] if m["time"] else 0.0,
+                "switches": m["switches"],
+                "energy_wh": m["on_time"] * self.power_w / 3600.0,
+                "out_of_band_sec": m["out_of_band"]}
+
+
+class PayloadThermalControl:
+    def __init__(self, controller=None):
+        self.controller = controller or global_config.THERMAL_CONTROLLER
+        self.channels = [
+            Channel(global_config.AIR_HEATER, thermal_model.AIR, global_config.IDEAL_PLANT_TEMP_MIN,
+                    global_config.IDEAL_PLANT_TEMP_MAX, self.controller,
+                    survival=(global_config.MIN_PLANT_TEMP, global_config.MAX_PLANT_TEMP)),
+            Channel(global_config.WATER_HEATER, thermal_model.WATER, global_config.MIN_WATER_TEMP,
+                    global_config.IDEAL_PLANT_TEMP_MAX, self.controller),
+        ]
+
+    def update(self, now, air_temp, water_temp, leds_on=False):
+        """Returns {heater id: True/False} for this control step."""
+        temps = {thermal_model.AIR: air_temp, thermal_model.WATER: water_temp}
+        return {c.heater: c.update(now, temps, leds_on) for c in self.channels}
+
+    def shed(self, now):
+        for c in self.channels:
+            c.shed(now)
+
+    def report(self):
+        return {c.heater: c.report() for c in self.channels}
+
+
+# --- Module-level controller used by system_health ---
+_control = None
+
+
+def reset():
+    """New mission: picks up THERMAL_CONTROLLER and clears the metrics."""
+    global _control
+    _control = PayloadThermalControl()
+
+
+def update(now, air_temp, water_temp, leds_on=False):
+    if _control is None:
+        reset()
+    return _control.update(now, air_temp, water_temp, leds_on)
+
+
+def shed_load(now):
+    """LAST_RESORT_MODE turned the heaters OFF: stop counting them as ON."""
+    if _control is not None:
+        _control.shed(now)
+
+
+def get_metrics():
+    return _control.report() if _control is not None else {}
+
+
+# --- Batch Comparison ---
+
+def simulate_mission(controller, days=2.0, seed=0, water_temp=12.0, ambient_temp=None):
+    """
+    Closed loop of one controller on the thermal network alone (no flight
+    loop): LEDs on the 16/8 cycle, sensor noise as in hardware_drivers,
+    control every THERMAL_CONTROL_PERIOD_SEC. Returns the channel reports.
+    """
+    rng = np.random.default_rng(seed)
+    network = thermal_model.DEFAULT_NETWORK
+    if ambient_temp is not None:
+        network = thermal_model.ThermalNetwork(ambient_temp=ambient_temp)
+    temps = thermal_model.INITIAL_TEMPS.astype(float).copy()
+    temps[thermal_model.WATER] = water_temp
+    control = PayloadThermalControl(controller)
+    step = global_config.THERMAL_CONTROL_PERIOD_SEC
+    heaters = {global_config.AIR_HEATER: False, global_config.WATER_HEATER: False}
+    for k in range(int(days * 86400 // step)):
+        now = k * step
+        leds_on = (now % (24 * 3600)) < global_config.LED_ON_TIME_SEC
+        noise = rng.uniform(-0.1, 0.1, 2)
+        heaters = control.update(now, temps[thermal_model.AIR] + noise[0],
+                                 temps[thermal_model.WATER] + noise[1], leds_on)
+        power = thermal_model.heat_input(heaters[global_config.AIR_HEATER],
+                                         heaters[global_config.WATER_HEATER], leds_on)
+        temps = network.advance(temps, power, step)
+    return control.report()
+
+
+def _simulate_star(args):
+    return args[0], simulate_mission(*args)
+
+
+def compare(controllers=tuple(CONTROLLERS), missions=8, days=2.0, seed=0, processes=None):
+    """
+    Runs every controller on the same randomized missions (initial water
+    temperature and ambient) in a process pool. Returns
+    {controller: {heater: {metric: mean over missions}}}.
+    """
+    import multiprocessing
+    rng = np.random.default_rng(seed)
+    cases = [(float(rng.uniform(5.0, 15.0)), float(rng.uniform(8.0, 16.0))) for _ in range(missions)]
+    jobs = [(name, days, seed + i, water, ambient) for name in controllers for i, (water, ambient) in enumerate(cases)]
+    processes = processes or multiprocessing.cpu_count()
+    if processes == 1:
+        results = [_simulate_star(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_simulate_star, jobs)
+
+    summary = {}
+    for name in controllers:
+        runs = [report for n, report in results if n == name]
+        summary[name] = {heater: {metric: float(np.mean([r[heater][metric] for r in runs]))
+                                  for metric in runs[0][heater]}
+                         for heater in runs[0]}
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Compare payload thermal controllers")
+    parser.add_argument("--missions", type=int, default=8)
+    parser.add_argument("--days", type=float, default=2.0)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    summary = compare(missions=args.missions, days=args.days, processes=args.processes)
+    elapsed = time.perf_counter() - t0
+    print(f"--- Thermal controllers: {args.missions} missions x {args.days:g} days in {elapsed:.1f} s ---")
+    print(f"{'controller':<12}{'heater':<14}{'duty':>8}{'switches':>10}{'energy (Wh)':>13}{'out of band (min)':>19}")
+    for name, heaters in summary.items():
+        for heater, r in heaters.items():
+            print(f"{name:<12}{heater:<14}{r['duty']:>8.3f}{r['switches']:>10.0f}{r['energy_wh']:>13.1f}"
+                  f"{r['out_of_band_sec'] / 60:>19.1f}")